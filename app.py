@@ -31,11 +31,9 @@ from backend.helper_functions.types import CacheConfigDict, GitInfo
 LAYER_FOLDER: str = "geojsons"
 with open(os.path.join("static", "config", "route_keys.json"), "r", -1, "utf-8") as f:
     KEY_DICT: RouteKeys = json.load(f)
-FEED_LOADER: FeedLoader = FeedLoader(
-    url="https://cdn.mbta.com/MBTA_GTFS.zip",
-    geojson_path=os.path.join(os.getcwd(), "static", LAYER_FOLDER),
-    keys_dict={k: v["route_types"] for k, v in KEY_DICT.items()},
-)
+# built by `get_feed_loader`, not on import: the schedule parser's `spawn`
+# processes import this module again and mustn't open databases or pools
+FEED_LOADER: FeedLoader | None = None
 
 
 CACHE_CONFIG: CacheConfigDict = {
@@ -48,6 +46,25 @@ GIT_INFO: GitInfo = get_gitinfo()
 USE_DEBUG: bool = False
 
 
+def get_feed_loader() -> FeedLoader:
+    """Returns the app's `FeedLoader`, creating it on the first call.
+
+    Returns:
+        FeedLoader: the feed loader
+    """
+    global FEED_LOADER  # pylint: disable=global-statement
+    if FEED_LOADER is None:
+        FEED_LOADER = FeedLoader(
+            url=os.environ.get(
+                "MBTAMAPPER_GTFS_URL", "https://cdn.mbta.com/MBTA_GTFS.zip"
+            ),
+            geojson_path=os.path.join(os.getcwd(), "static", LAYER_FOLDER),
+            keys_dict={k: v["route_types"] for k, v in KEY_DICT.items()},
+        )
+        _set_logging()
+    return FEED_LOADER
+
+
 def _set_logging() -> logging.Logger:
     """Sets up logging for the application."""
 
@@ -76,9 +93,6 @@ def _set_logging() -> logging.Logger:
     return logger
 
 
-_set_logging()
-
-
 def create_key_blueprint(
     key: str, _app: flask.Flask, _cache: flask_caching.Cache
 ) -> flask.Blueprint:
@@ -136,6 +150,30 @@ def create_key_blueprint(
             return flask_caching.CachedResponse(flask.jsonify(json_data), cache_s)
         return flask.jsonify(json_data)
 
+    @blueprint.route("/vehicles/history")
+    def get_vehicle_history() -> tuple[flask.Response, int] | flask.Response:
+        """Returns the recent trails of the vehicles at /vehicles as geojson, \
+            a linestring per vehicle.
+
+        query params `minutes` (default all that's kept) and `vehicle_id` \
+            (comma separated) filter it.
+
+        Returns:
+            Response: geojson of vehicle trails.
+        """
+
+        params: dict[str, str] = flask.request.args.to_dict()
+        try:
+            minutes = float(params["minutes"]) if "minutes" in params else None
+        except ValueError:
+            return flask.jsonify({"error": "minutes must be a number"}), 400
+        vehicle_ids = None
+        if "vehicle_id" in params:
+            vehicle_ids = [s.strip() for s in params["vehicle_id"].split(",")]
+        return flask.jsonify(
+            FEED_LOADER.get_vehicle_history_cache(key, minutes, vehicle_ids)
+        )
+
     @blueprint.route("/stops")
     def get_stops() -> flask.Response:
         """Returns stops as geojson in the context of the route type AND \
@@ -185,6 +223,7 @@ def create_main_app(import_data: bool = False, proxies: int = 5) -> flask.Flask:
         Flask: default app.
     """
 
+    get_feed_loader()
     _app = flask.Flask(__name__)
 
     _cache = flask_caching.Cache(_app, config=CACHE_CONFIG)
@@ -244,6 +283,44 @@ def create_main_app(import_data: bool = False, proxies: int = 5) -> flask.Flask:
         backup = FEED_LOADER.backup_to_file(database_name)
         return flask.send_file(backup.url.database, mimetype="application/x-sqlite3")
 
+    @_app.route("/admin/imports")
+    def import_history() -> tuple[flask.Response, int] | flask.Response:
+        """returns the import telemetry history as json, newest first.
+
+        query params `stage` (e.g. import_gtfs) and `limit` (default 50) filter it.
+
+        Returns:
+            Response: recorded import runs
+        """
+        params: dict[str, str] = flask.request.args.to_dict()
+        try:
+            limit = int(params.get("limit", 50))
+        except ValueError:
+            return flask.jsonify({"error": "limit must be an integer"}), 400
+        return flask.jsonify(
+            FEED_LOADER.telemetry.history(stage=params.get("stage"), limit=limit)
+        )
+
+    @_app.route("/admin/pools")
+    def pool_status() -> flask.Response:
+        """returns the connections in use and checkout waits \
+            of the writer and reader pools as json.
+
+        Returns:
+            Response: status per pool
+        """
+        return flask.jsonify(FEED_LOADER.pool_status())
+
+    @_app.route("/admin/polling")
+    def polling_status() -> flask.Response:
+        """returns the learned cadence, demand and next fetch \
+            of each realtime feed as json.
+
+        Returns:
+            Response: schedule per feed
+        """
+        return flask.jsonify(FEED_LOADER.poll_scheduler.as_dict())
+
     @_app.route("/departure_board")
     def departure_board() -> flask.Response:
         """departure board page: WIP"""
@@ -314,6 +391,7 @@ def create_main_app(import_data: bool = False, proxies: int = 5) -> flask.Flask:
         include: list[str] = params.pop("include", "").split(",")
         cache_s: int = int(params.pop("cache", 0))
         params.pop("_", "")
+        FEED_LOADER.request_realtime("api", orm.__name__, *include)
         geojson: bool = (
             bool(params.pop("geojson", False))  # this will be removed in the future
             or params.pop("file_type", "").lower() == "geojson"
@@ -458,8 +536,9 @@ if __name__ == "__main__":
 
     USE_DEBUG = True
     CACHE_CONFIG["DEBUG"] = USE_DEBUG
+    feed_loader = get_feed_loader()
     if args.debug and (
-        args.import_data or not FEED_LOADER.db_exists or not FEED_LOADER.geojsons_exist
+        args.import_data or not feed_loader.db_exists or not feed_loader.geojsons_exist
     ):
         raise ValueError("cannot run in debug mode while importing data.")
     subprocess.call("npm run watch &", shell=True)
@@ -3,6 +3,22 @@
 This package loads GTFS data into a database and provides a Flask app to
 display the data."""
 
+from .archive_cache import ArchiveCache
+from .blue_green import BlueGreen
+from .bulk_loader import BulkLoader
+from .chunk_reader import ChunkReader
+from .connection_profile import ConnectionProfile
 from .feed import Feed
 from .feed_loader import FeedLoader
+from .feed_manifest import FeedManifest
+from .feed_replay import FeedRecording, FeedReplay
+from .import_telemetry import ImportRun, ImportTelemetry
+from .poll_scheduler import PollScheduler
 from .query import Query
+from .realtime_diff import RealtimeDiff
+from .realtime_enrichment import RealtimeEnrichment
+from .realtime_feed import RealtimeFeed
+from .realtime_fetcher import RealtimeFetcher
+from .realtime_store import RealtimeStore, RealtimeTable
+from .schedule_snapshot import ScheduleSnapshot
+from .vehicle_history import VehicleHistory
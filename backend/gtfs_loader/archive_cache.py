@@ -0,0 +1,153 @@
+"""ArchiveCache class."""
+
+import hashlib
+import logging
+import os
+import typing as t
+
+from ..helper_functions.types import PathLike
+from .feed_manifest import FeedManifest
+
+
+class ArchiveCache:
+    """Content-addressed store of downloaded GTFS archives, \
+        plus the partial download in progress.
+
+    - archives are kept as `{sha256}.zip`; the `keep` most recently used survive
+    - `latest.json` holds the validators and hash of the newest archive, \
+        so a restart can make its download conditional without a manifest
+    - `partial.zip` is the download in progress and `partial.json` the \
+        validators it was started with, so it can be resumed with `If-Range`
+
+    Args:
+        directory (PathLike): cache directory, created if missing
+        keep (int, optional): archives to keep. Defaults to 3.
+    """
+
+    LATEST_FILE = "latest.json"
+    PARTIAL_FILE = "partial.zip"
+    PARTIAL_META_FILE = "partial.json"
+    HASH_BLOCK_SIZE = 2**20
+
+    def __init__(self, directory: PathLike, keep: int = 3) -> None:
+        """Initializes ArchiveCache.
+
+        Args:
+            directory (PathLike): cache directory, created if missing
+            keep (int, optional): archives to keep. Defaults to 3.
+        """
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.directory}, keep={self.keep})>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def path(self, digest: str) -> str:
+        """path of the archive with sha256 `digest`"""
+        return os.path.join(self.directory, f"{digest}.zip")
+
+    @property
+    def partial_path(self) -> str:
+        """path of the download in progress"""
+        return os.path.join(self.directory, self.PARTIAL_FILE)
+
+    @property
+    def latest(self) -> FeedManifest:
+        """validators and hash of the newest archive; empty if there is none"""
+        latest = FeedManifest.load(os.path.join(self.directory, self.LATEST_FILE))
+        if latest.sha256 and os.path.exists(self.path(latest.sha256)):
+            return latest
+        return FeedManifest()
+
+    def open(self, digest: str | None) -> t.IO[bytes] | None:
+        """opens a cached archive, marking it as recently used.
+
+        Args:
+            digest (str, optional): sha256 of the archive
+        Returns:
+            IO[bytes] | None: the archive; `None` if it isn't cached
+        """
+        if not digest or not os.path.exists(path := self.path(digest)):
+            return None
+        os.utime(path)
+        return open(path, "rb")  # pylint: disable=consider-using-with
+
+    def partial(self) -> tuple[int, FeedManifest]:
+        """the resumable download in progress, if any.
+
+        a partial download without validators can't be resumed safely \
+            and is discarded.
+
+        Returns:
+            tuple[int, FeedManifest]: bytes already on disk and \
+                the validators they were downloaded with
+        """
+        meta = FeedManifest.load(os.path.join(self.directory, self.PARTIAL_META_FILE))
+        if not os.path.exists(self.partial_path):
+            return 0, FeedManifest()
+        if not (meta.etag or meta.last_modified):
+            self.discard_partial()
+            return 0, FeedManifest()
+        return os.path.getsize(self.partial_path), meta
+
+    def start_partial(self, validators: FeedManifest, resume: bool) -> t.IO[bytes]:
+        """opens the partial download for writing.
+
+        Args:
+            validators (FeedManifest): validators of the response being written
+            resume (bool): append to the bytes on disk instead of starting over
+        Returns:
+            IO[bytes]: the partial file
+        """
+        FeedManifest(validators.etag, validators.last_modified).save(
+            os.path.join(self.directory, self.PARTIAL_META_FILE)
+        )
+        # pylint: disable=consider-using-with
+        return open(self.partial_path, "ab" if resume else "wb")
+
+    def discard_partial(self) -> None:
+        """removes the partial download"""
+        for name in [self.PARTIAL_FILE, self.PARTIAL_META_FILE]:
+            FeedManifest.remove(os.path.join(self.directory, name))
+
+    def commit(self, validators: FeedManifest) -> tuple[str, t.IO[bytes]]:
+        """files the finished partial download under its hash \
+            and makes it the latest archive.
+
+        Args:
+            validators (FeedManifest): validators of the download
+        Returns:
+            tuple[str, IO[bytes]]: sha256 of the archive and the opened archive
+        """
+        digest = hashlib.sha256()
+        with open(self.partial_path, "rb") as file:
+            while block := file.read(self.HASH_BLOCK_SIZE):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        if os.path.exists(self.path(sha256)):
+            logging.info("archive %s already cached", sha256)
+        os.replace(self.partial_path, self.path(sha256))
+        self.discard_partial()
+        FeedManifest(validators.etag, validators.last_modified, sha256=sha256).save(
+            os.path.join(self.directory, self.LATEST_FILE)
+        )
+        self.prune()
+        return sha256, self.open(sha256)
+
+    def prune(self) -> None:
+        """removes all but the `keep` most recently used archives"""
+        archives = sorted(
+            (
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith(".zip") and name != self.PARTIAL_FILE
+            ),
+            key=os.path.getmtime,
+        )
+        for path in archives[: -self.keep]:
+            os.remove(path)
+            logging.info("removed cached archive %s", path)
@@ -0,0 +1,268 @@
+"""BlueGreen class."""
+
+import logging
+import os
+import re
+import time
+import typing as t
+
+import sqlalchemy as sa
+from sqlalchemy import orm as saorm
+from sqlalchemy import schema
+
+from ..gtfs_orms import Agency, Base, Calendar, Route, Stop, StopTime, Trip
+from ..helper_functions.types import PathLike
+from .connection_profile import READ_ONLY, REALTIME_WRITER, ConnectionProfile
+
+
+class BlueGreen:
+    """The sqlite databases of a `Feed`: the live one, which the app is \
+        served from, and the rebuilds that are swapped in for it.
+
+    a rebuild is loaded into a side database, checked by `validate_database` \
+        and made live by `swap_database`, which renames it to a new \
+        `{gtfs_name}.<generation>.db`; readers never see a half-built schedule.
+    """
+
+    REQUIRED_ORMS: tuple[t.Type[Base], ...] = (
+        Agency,
+        Calendar,
+        Route,
+        Stop,
+        Trip,
+        StopTime,
+    )
+    """tables that must have rows before a rebuilt database goes live"""
+
+    # set by `Feed`
+    REALTIME_ORMS: tuple[t.Type[Base], ...]
+    gtfs_name: str
+    engine: sa.Engine
+    reader_engine: sa.Engine
+    scoped_session: saorm.scoped_session
+    writer_session: saorm.scoped_session
+
+    @property
+    def legacy_db_path(self) -> str:
+        """the database path used before rebuilds were swapped in"""
+        return f"{self.gtfs_name}.db"
+
+    @property
+    def generations(self) -> list[str]:
+        """database files swapped in by `swap_database`, oldest first"""
+        pattern = re.compile(rf"{re.escape(self.gtfs_name)}\.(\d+)\.db")
+        return sorted(
+            (f for f in os.listdir() if pattern.fullmatch(f)),
+            key=lambda f: int(pattern.fullmatch(f)[1]),
+        )
+
+    @staticmethod
+    def remove_database(path: PathLike) -> None:
+        """removes a sqlite database file along with its wal and shm files.
+
+        Args:
+            path (PathLike): path to the database
+        """
+        for file in (path, f"{path}-wal", f"{path}-shm"):
+            if os.path.exists(file):
+                os.remove(file)
+
+    @classmethod
+    def validate_database(cls, engine: sa.Engine) -> None:
+        """checks a rebuilt database before it goes live.
+
+        Args:
+            engine (sa.Engine): engine bound to the rebuilt database
+        Raises:
+            ValueError: if the database is corrupt, a foreign key is dangling \
+                (bulk loads don't enforce them) or a required table is empty
+        """
+        with engine.connect() as conn:
+            if (check := conn.exec_driver_sql("PRAGMA quick_check").scalar()) != "ok":
+                raise ValueError(f"{engine.url.database}: {check}")
+            if dangling := conn.exec_driver_sql(
+                'SELECT "table", count(*) FROM pragma_foreign_key_check GROUP BY 1'
+            ).all():
+                raise ValueError(
+                    f"{engine.url.database}: dangling foreign keys in {dict(dangling)}"
+                )
+            for orm in cls.REQUIRED_ORMS:
+                if conn.execute(sa.select(sa.func.count()).select_from(orm)).scalar():
+                    continue
+                raise ValueError(f"{engine.url.database}: {orm.__tablename__} is empty")
+
+    @staticmethod
+    def create_tables(engine: sa.Engine, indexes: bool = True) -> None:
+        """creates every table that doesn't exist yet.
+
+        Args:
+            engine (sa.Engine): engine to create the tables in
+            indexes (bool, optional): also create the secondary indexes. \
+                Defaults to True; bulk loads leave them to `create_indexes`.
+        """
+        if indexes:
+            Base.metadata.create_all(engine)
+            return
+        with engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                conn.execute(schema.CreateTable(table, if_not_exists=True))
+
+    @staticmethod
+    def drop_indexes(engine: sa.Engine, *orms: t.Type[Base]) -> None:
+        """drops the secondary indexes of `orms` ahead of a bulk load.
+
+        Args:
+            engine (sa.Engine): engine to drop the indexes in
+            *orms (type[Base]): tables about to be reloaded
+        """
+        with engine.begin() as conn:
+            for orm in orms:
+                for index in orm.__table__.indexes:
+                    conn.execute(schema.DropIndex(index, if_exists=True))
+
+    @classmethod
+    def create_indexes(cls, engine: sa.Engine) -> None:
+        """creates the missing secondary indexes declared on the orms, \
+            then `ANALYZE`s the schedule tables so the planner uses them.
+
+        realtime tables are left out of `ANALYZE`; they are rewritten \
+            every few seconds, so their statistics would be stale anyway.
+
+        Args:
+            engine (sa.Engine): engine to create the indexes in
+        """
+        realtime = {orm.__tablename__ for orm in cls.REALTIME_ORMS}
+        with engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    conn.execute(schema.CreateIndex(index, if_not_exists=True))
+            for table in Base.metadata.sorted_tables:
+                if table.name not in realtime:
+                    conn.exec_driver_sql(f"ANALYZE {table.name}")
+
+    @staticmethod
+    def open_database(path: PathLike, **kwargs) -> tuple[sa.Engine, sa.Engine]:
+        """opens the live sqlite database at `path`: a `REALTIME_WRITER` engine \
+            with one connection, so writers queue in its pool instead of on \
+            sqlite's lock, and a `READ_ONLY` pool for everything else.
+
+        the writer connects first, which creates the file and switches it \
+            to wal before any reader can open it.
+
+        Args:
+            path (PathLike): database file
+            kwargs: keyword arguments to pass to `sa.create_engine` for the writer
+        Returns:
+            tuple[sa.Engine, sa.Engine]: writer and reader engines
+        """
+        writer = REALTIME_WRITER.create_engine(path, **kwargs)
+        writer.connect().close()
+        return writer, READ_ONLY.create_engine(path)
+
+    def pool_status(self) -> dict[str, dict[str, t.Any]]:
+        """connections in use and checkout waits of the writer and reader pools.
+
+        Returns:
+            dict[str, dict[str, Any]]: `ConnectionProfile.pool_status` per pool
+        """
+        return {
+            "writer": ConnectionProfile.pool_status(self.engine),
+            "reader": ConnectionProfile.pool_status(self.reader_engine),
+        }
+
+    def swap_database(self, engine: sa.Engine) -> None:
+        """makes the database behind `engine` the live one.
+
+        the file is renamed to a new generation, then the engines and \
+            sessions are repointed at it in one step. sessions already open \
+            finish on the old database, which is kept until the next swap; \
+            older generations are removed.
+
+        Args:
+            engine (sa.Engine): engine bound to the rebuilt database; disposed
+        """
+        engine.dispose()  # the last connection to close checkpoints the wal
+        path = f"{self.gtfs_name}.{time.time_ns()}.db"
+        os.replace(engine.url.database, path)
+        old_engine, old_reader = self.engine, self.reader_engine
+        self.engine, self.reader_engine = self.open_database(path)
+        self.scoped_session.configure(bind=self.reader_engine)
+        self.writer_session.configure(bind=self.engine)
+        old_engine.dispose()
+        old_reader.dispose()
+        retired = self.generations[:-2]
+        if old_engine.url.database != self.legacy_db_path:
+            retired.append(self.legacy_db_path)
+        for retired_path in retired:
+            self.remove_database(retired_path)
+        logging.info("Swapped %s -> %s", old_engine.url.database, path)
+
+    def _copy_realtime(self, engine: sa.Engine) -> None:
+        """copies the live realtime tables into `engine`, so a rebuilt \
+            database doesn't go live without vehicles or predictions.
+
+        Args:
+            engine (sa.Engine): engine bound to the rebuilt database
+        """
+        if not self.db_exists:
+            return
+        # read through the live engine rather than ATTACH: an attached database
+        # would inherit the build's exclusive locking and block the live readers
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            with self.reader_engine.connect() as live:
+                for orm in self.REALTIME_ORMS:
+                    rows = live.exec_driver_sql(
+                        f"SELECT * FROM {orm.__tablename__}"
+                    ).all()
+                    if not rows:
+                        continue
+                    cursor.executemany(
+                        f"INSERT INTO {orm.__tablename__} "
+                        f"VALUES ({', '.join('?' * len(rows[0]))})",
+                        rows,
+                    )
+            raw.commit()
+            cursor.close()
+        finally:
+            raw.close()
+
+    @property
+    def db_exists(self) -> bool:
+        """if the database exists"""
+
+        return all(
+            sa.inspect(self.engine).has_table(table)
+            for table in Base.metadata.tables.keys()
+        )
+
+    def backup_to_file(
+        self, filename: PathLike = None, profile: ConnectionProfile = REALTIME_WRITER
+    ) -> sa.engine.Engine:
+        """Copies the whole live database, through a reader, into a file \
+            with sqlite's online backup.
+
+        this is the staging copy of partial reloads too, and the full copy \
+            is intended: the tables that didn't change are kept as they are \
+            live, and only the changed ones are emptied and reloaded.
+
+        Args:
+            filename (PathLike, optional): pathlike
+            profile (ConnectionProfile, optional): profile of the returned engine. \
+                Defaults to `REALTIME_WRITER`.
+
+        Returns:
+            sa.engine.Engine: engine connected to the file-based database.
+        """
+        filename = filename or f"{self.gtfs_name}_backup.db"
+        backup_engine = profile.create_engine(filename)
+        src_raw: sa.pool.base._ConnectionFairy = self.reader_engine.raw_connection()
+        dst_raw: sa.pool.base._ConnectionFairy = backup_engine.raw_connection()
+        try:
+            src_raw.connection.backup(dst_raw.connection)
+        finally:
+            src_raw.close()
+            dst_raw.close()
+        logging.info("Backed up %s to %s", self.engine.url.database, filename)
+        return backup_engine
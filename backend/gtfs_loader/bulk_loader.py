@@ -0,0 +1,239 @@
+"""BulkLoader class."""
+
+import collections
+import logging
+import time
+import typing as t
+
+import pandas as pd
+import pandas.core.generic as pdcg
+import sqlalchemy as sa
+
+from ..gtfs_orms import Base
+
+if t.TYPE_CHECKING:
+    from pandas.io.sql import SQLTable
+
+
+class BulkLoader:
+    """Bulk inserts dataframes into SQLite with prepared `executemany` \
+        statements on the raw sqlite3 connection, bypassing `DataFrame.to_sql`.
+
+    column order comes from the orm's `__table__`; \
+        dataframe columns that aren't on the table are dropped.
+
+    duplicate primary keys are handled in the same single pass according to \
+        the orm's `__conflict__` policy, and counted in `BulkLoader.rejected`. \
+        other constraint violations, like `NOT NULL`, still raise.
+
+    Args:
+        engine (sa.Engine): engine to load into
+    """
+
+    def __init__(self, engine: sa.Engine) -> None:
+        """Initializes BulkLoader.
+
+        Args:
+            engine (sa.Engine): engine to load into
+        """
+        self.engine = engine
+        self.added: collections.Counter[str] = collections.Counter()
+        """rows added per table"""
+        self.rejected: collections.Counter[str] = collections.Counter()
+        """rows dropped by the conflict policy per table"""
+        self.orphaned: collections.Counter[str] = collections.Counter()
+        """rows dropped by `drop_orphans` per table"""
+        self.write_seconds = 0.0
+        """time spent in `insert`"""
+        self._keys: dict[tuple[str, str], set[t.Any]] = {}
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.engine.url})>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    @staticmethod
+    def columns(frame: pd.DataFrame, orm: t.Type[Base]) -> list[str]:
+        """columns of `frame` to load, in `orm.__table__` order.
+
+        the surrogate `index` key is left to sqlite's rowid.
+
+        Args:
+            frame (pd.DataFrame): dataframe to load
+            orm (type[Base]): table to load into
+        Returns:
+            list[str]: column names
+        """
+        return [c for c in orm.cols if c in frame.columns and c != "index"]
+
+    @staticmethod
+    def rows(frame: pd.DataFrame) -> t.Iterator[tuple[t.Any, ...]]:
+        """yields `frame` as tuples of python objects, with nulls as `None`.
+
+        Args:
+            frame (pd.DataFrame): dataframe to convert
+        Yields:
+            tuple[Any, ...]: one row
+        """
+        columns: list[list[t.Any]] = []
+        for _, series in frame.items():
+            if isinstance(series.dtype, pd.ArrowDtype):  # nulls come back as None
+                array = series.array.__arrow_array__()
+                if hasattr(array.type, "index_type"):  # decode categoricals first
+                    array = array.cast(array.type.value_type)
+                columns.append(array.to_pylist())
+                continue
+            if series.hasnans:
+                series = series.astype(object).where(series.notna(), None)
+            columns.append(series.tolist())
+        yield from zip(*columns)
+
+    @staticmethod
+    def insert_statement(orm: t.Type[Base], columns: t.Sequence[str]) -> str:
+        """returns the insert statement for `orm` under its `__conflict__` policy.
+
+        Args:
+            orm (type[Base]): table to insert into
+            columns (Sequence[str]): columns to insert
+        Returns:
+            str: parameterized `INSERT` statement
+        """
+        stmt = (
+            f"INSERT INTO {orm.__tablename__} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})"
+        )
+        keys = [k for k in orm.primary_keys if k in columns]
+        if orm.__conflict__ == "ignore":  # key conflicts only, not NOT NULL/CHECK
+            target = f" ({', '.join(keys)})" if keys == orm.primary_keys else ""
+            return f"{stmt} ON CONFLICT{target} DO NOTHING"
+        if orm.__conflict__ != "replace" or not keys:
+            return stmt
+        updates = [f"{c}=excluded.{c}" for c in columns if c not in keys]
+        return f"{stmt} ON CONFLICT ({', '.join(keys)}) " + (
+            f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+        )
+
+    @staticmethod
+    def dedupe(frame: pd.DataFrame, orm: t.Type[Base]) -> pd.DataFrame:
+        """drops rows of `frame` that repeat a primary key, \
+            if `orm` uses the `dedupe` policy.
+
+        Args:
+            frame (pd.DataFrame): dataframe to load
+            orm (type[Base]): table to load into
+        Returns:
+            pd.DataFrame: `frame`, without duplicate keys
+        """
+        keys = [k for k in orm.primary_keys if k in frame.columns]
+        if orm.__conflict__ != "dedupe" or not keys:
+            return frame
+        return frame.drop_duplicates(keys)
+
+    @classmethod
+    def to_sql_method(
+        cls, orm: t.Type[Base]
+    ) -> t.Callable[["SQLTable", sa.Connection, list[str], t.Iterable], int]:
+        """returns a `method` for `DataFrame.to_sql` that inserts \
+            with `orm`'s conflict policy in one `executemany`.
+
+        Args:
+            orm (type[Base]): table to insert into
+        Returns:
+            Callable: `to_sql` insertion method, returning the rows added
+        """
+
+        def _method(
+            table: "SQLTable", conn: sa.Connection, keys: list[str], data_iter
+        ) -> int:
+            # pylint: disable=unused-argument
+            res = conn.exec_driver_sql(
+                cls.insert_statement(orm, keys),
+                [tuple(None if pd.isna(v) else v for v in row) for row in data_iter],
+            )
+            return res.rowcount
+
+        return _method
+
+    def parent_keys(self, table: str, column: str) -> set[t.Any]:
+        """the values of `table.column` in the database, \
+            cached until `table` is inserted into.
+
+        Args:
+            table (str): referenced table
+            column (str): referenced column
+        Returns:
+            set[Any]: values in the database
+        """
+        if (table, column) not in self._keys:
+            with self.engine.connect() as conn:
+                self._keys[(table, column)] = set(
+                    conn.exec_driver_sql(f"SELECT {column} FROM {table}").scalars()
+                )
+        return self._keys[(table, column)]
+
+    def drop_orphans(self, frame: pd.DataFrame, orm: t.Type[Base]) -> pd.DataFrame:
+        """drops rows of `frame` whose foreign keys aren't in the database.
+
+        used when only part of the schedule is reloaded: unchanged parent \
+            tables have already been filtered, so their children must be too.
+
+        Args:
+            frame (pd.DataFrame): dataframe to load
+            orm (type[Base]): table to load into
+        Returns:
+            pd.DataFrame: `frame`, without orphaned rows
+        """
+        mask = pd.Series(True, index=frame.index)
+        for fkey in orm.__table__.foreign_keys:
+            column, target = fkey.parent.name, fkey.column
+            if target.table is orm.__table__ or column not in frame.columns:
+                continue
+            mask &= frame[column].isna() | frame[column].isin(
+                self.parent_keys(target.table.name, target.name)
+            )
+        if mask.all():
+            return frame
+        self.orphaned[orm.__tablename__] += int((~mask).sum())
+        return frame[mask]
+
+    def insert(self, data: pdcg.NDFrame, orm: t.Type[Base]) -> int:
+        """inserts `data` into `orm`'s table in one transaction.
+
+        Args:
+            data (pd.DataFrame | pd.Series): data to insert
+            orm (type[Base]): table to insert into
+        Returns:
+            int: number of rows added
+        Raises:
+            sqlite3.IntegrityError: if a row violates a constraint the \
+                conflict policy doesn't cover; the whole chunk is rolled back.
+        """
+        start = time.perf_counter()
+        frame = data.to_frame() if isinstance(data, pd.Series) else data
+        columns = self.columns(frame, orm)
+        deduped = self.dedupe(frame, orm)
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.executemany(
+                self.insert_statement(orm, columns), self.rows(deduped[columns])
+            )
+            res = cursor.rowcount
+            cursor.close()
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+            self.write_seconds += time.perf_counter() - start
+        for key in [k for k in self._keys if k[0] == orm.__tablename__]:
+            del self._keys[key]
+        rejected = len(frame) - res if orm.__conflict__ != "replace" else 0
+        self.added[orm.__tablename__] += res
+        self.rejected[orm.__tablename__] += rejected
+        logging.info(
+            "Added %s rows to %s (%s rejected)", res, orm.__tablename__, rejected
+        )
+        return res
@@ -0,0 +1,265 @@
+"""ChunkReader class."""
+
+import collections
+import concurrent.futures as cf
+import importlib.util
+import io
+import itertools
+import logging
+import multiprocessing
+import time
+import typing as t
+from zipfile import ZipFile
+
+import pandas as pd
+
+from ..gtfs_orms import Base
+
+
+def parse_block(
+    header: bytes, block: bytes, args: tuple, kwargs: dict[str, t.Any]
+) -> pd.DataFrame:
+    """parses one block of csv lines; runs inside the worker processes.
+
+    Args:
+        header (bytes): the csv header line
+        block (bytes): whole csv lines, without the header
+        args (tuple): args to pass to `pd.read_csv`
+        kwargs (dict[str, Any]): keyword args to pass to `pd.read_csv`
+    Returns:
+        pd.DataFrame: the parsed chunk
+    """
+    return pd.read_csv(io.BytesIO(header + block), *args, **kwargs)
+
+
+def parse_block_arrow(
+    header: bytes, block: bytes, column_types: dict[str, t.Any]
+) -> pd.DataFrame:
+    """parses one block of csv lines with `pyarrow.csv` into \
+        arrow-backed columns; runs inside the worker processes.
+
+    if a value doesn't parse as its column's type (e.g. `1.0` in an int \
+        column), the block is parsed again with its numeric columns as \
+        strings, which are then coerced: values that don't fit become null \
+        and are counted in the chunk's `attrs["coerced"]`.
+
+    Args:
+        header (bytes): the csv header line
+        block (bytes): whole csv lines, without the header
+        column_types (dict[str, pa.DataType]): arrow type per column
+    Returns:
+        pd.DataFrame: the parsed chunk
+    """
+    # pylint: disable=import-outside-toplevel
+    import pyarrow as pa
+    from pyarrow import csv
+
+    def _read(types: dict[str, t.Any]) -> pd.DataFrame:
+        return csv.read_csv(
+            io.BytesIO(header + block),
+            convert_options=csv.ConvertOptions(
+                column_types=types, strings_can_be_null=True
+            ),
+        ).to_pandas(types_mapper=pd.ArrowDtype)
+
+    try:
+        return _read(column_types)
+    except pa.ArrowInvalid:
+        pass
+    numeric = {
+        k: v
+        for k, v in column_types.items()
+        if pa.types.is_integer(v) or pa.types.is_floating(v) or pa.types.is_boolean(v)
+    }
+    frame = _read(column_types | dict.fromkeys(numeric, pa.string()))
+    coerced = 0
+    for col, kind in numeric.items():
+        if col not in frame.columns:
+            continue
+        values = pd.to_numeric(frame[col].astype(object), errors="coerce")
+        valid = values.notna()
+        if not pa.types.is_floating(kind):
+            valid &= values % 1 == 0
+        coerced += int((frame[col].notna() & ~valid).sum())
+        frame[col] = values.where(valid).astype(pd.ArrowDtype(kind))
+    frame.attrs["coerced"] = coerced
+    return frame
+
+
+def iter_blocks(
+    member: t.IO[bytes], lines: int
+) -> t.Generator[tuple[bytes, bytes], None, None]:
+    """splits a csv stream into blocks of `lines` lines, never \
+        inside a quoted field.
+
+    Args:
+        member (IO[bytes]): csv file opened in binary mode
+        lines (int): lines per block
+    Yields:
+        tuple[bytes, bytes]: the header line and a block of lines
+    """
+    header = member.readline()
+    while block := b"".join(itertools.islice(member, lines)):
+        while block.count(b'"') % 2 and (line := member.readline()):
+            block += line
+        yield header, block
+
+
+class ChunkReader:
+    """Parses the csv members of a GTFS archive into dataframe chunks.
+
+    with `workers > 1`, blocks are parsed in a process pool while the caller \
+        consumes (writes) earlier chunks. up to `max_pending` blocks are in \
+        flight at once, across table boundaries, and chunks are always \
+        yielded in table then file order, so a single writer stays FK-safe.
+
+    files are parsed by `pyarrow.csv` into arrow-backed columns typed from \
+        each orm's `csv_dtypes`, and `read_csv` args are ignored; values that \
+        don't fit their column's type are nulled and counted in `coerced`. \
+        without `arrow` (or pyarrow), `read_csv` reads every column as \
+        `object` unless `dtype` is passed.
+
+    Args:
+        archive (ZipFile): the GTFS archive
+        *args: args to pass to `pd.read_csv`
+        workers (int, optional): parser processes; <= 1 parses inline. Defaults to 0.
+        chunksize (int, optional): rows per chunk. Defaults to 100_000.
+        max_pending (int, optional): blocks in flight. Defaults to 2 * workers.
+        arrow (bool, optional): parse with pyarrow, if installed. Defaults to True.
+        **kwargs: keyword args to pass to `pd.read_csv`
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        archive: ZipFile,
+        *args,
+        workers: int = 0,
+        chunksize: int = 100_000,
+        max_pending: int | None = None,
+        arrow: bool = True,
+        **kwargs,
+    ) -> None:
+        """Initializes ChunkReader.
+
+        Args:
+            archive (ZipFile): the GTFS archive
+            *args: args to pass to `pd.read_csv`
+            workers (int, optional): parser processes. Defaults to 0 (inline).
+            chunksize (int, optional): rows per chunk. Defaults to 100_000.
+            max_pending (int, optional): blocks in flight. Defaults to 2 * workers.
+            arrow (bool, optional): parse with pyarrow, if installed. Defaults to True.
+            **kwargs: keyword args to pass to `pd.read_csv`
+        """
+        if arrow and not importlib.util.find_spec("pyarrow"):
+            logging.warning("pyarrow is not installed, parsing with pandas")
+            arrow = False
+        self.archive = archive
+        self.args = args
+        self.kwargs = kwargs
+        self.workers = workers
+        self.chunksize = chunksize
+        self.max_pending = max_pending or 2 * max(workers, 1)
+        self.arrow = arrow
+        self.parse_seconds = 0.0
+        """time the caller spent waiting on parsed chunks"""
+        self.coerced: collections.Counter[str] = collections.Counter()
+        """values nulled per table, for not parsing as their column's type"""
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}(workers={self.workers}, chunksize={self.chunksize}, arrow={self.arrow})>"  # pylint: disable=line-too-long
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def parser(
+        self, orm: t.Type[Base]
+    ) -> tuple[t.Callable[..., pd.DataFrame], tuple[t.Any, ...]]:
+        """the block parser for `orm`'s file, and its args after the block.
+
+        Args:
+            orm (type[Base]): orm being read
+        Returns:
+            tuple[Callable[..., pd.DataFrame], tuple]: `parse_block` with \
+                `read_csv` args, or `parse_block_arrow` with arrow column types
+        """
+        if not self.arrow:
+            return parse_block, (self.args, {"dtype": object} | self.kwargs)
+        import pyarrow as pa  # pylint: disable=import-outside-toplevel
+
+        return parse_block_arrow, (
+            {
+                k: (
+                    pa.dictionary(pa.int32(), pa.string())
+                    if v == "category"
+                    else pa.type_for_alias(v)
+                )
+                for k, v in orm.csv_dtypes().items()
+            },
+        )
+
+    def _iter_blocks(
+        self, orms: t.Iterable[t.Type[Base]]
+    ) -> t.Generator[tuple[t.Type[Base], bytes, bytes], None, None]:
+        """yields the blocks of every orm's file, in order.
+
+        Args:
+            orms (Iterable[type[Base]]): orms to read, in load order
+        Yields:
+            tuple[type[Base], bytes, bytes]: orm, header, block
+        """
+        for orm in orms:
+            with self.archive.open(orm.__filename__) as member:
+                for header, block in iter_blocks(member, self.chunksize):
+                    yield orm, header, block
+
+    def iter_chunks(
+        self, orms: t.Iterable[t.Type[Base]]
+    ) -> t.Generator[tuple[t.Type[Base], pd.DataFrame], None, None]:
+        """yields parsed chunks of each orm's file, in order.
+
+        Args:
+            orms (Iterable[type[Base]]): orms to read, in load order
+        Yields:
+            tuple[type[Base], pd.DataFrame]: orm and one chunk of its file
+        """
+        if self.workers <= 1:
+            for orm, header, block in self._iter_blocks(orms):
+                func, args = self.parser(orm)
+                start = time.perf_counter()
+                chunk = func(header, block, *args)
+                self.parse_seconds += time.perf_counter() - start
+                self.coerced[orm.__tablename__] += chunk.attrs.pop("coerced", 0)
+                yield orm, chunk
+            return
+
+        logging.info("parsing with %s worker processes", self.workers)
+        pending: collections.deque[tuple[t.Type[Base], cf.Future]] = collections.deque()
+        with cf.ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            for orm, header, block in self._iter_blocks(orms):
+                func, args = self.parser(orm)
+                pending.append((orm, pool.submit(func, header, block, *args)))
+                if len(pending) >= self.max_pending:
+                    yield self._result(pending.popleft())
+            while pending:
+                yield self._result(pending.popleft())
+
+    def _result(
+        self, pending: tuple[t.Type[Base], cf.Future]
+    ) -> tuple[t.Type[Base], pd.DataFrame]:
+        """waits for a block parsed by the pool, counting the wait as parse time.
+
+        Args:
+            pending (tuple[type[Base], Future]): orm and its parse future
+        Returns:
+            tuple[type[Base], pd.DataFrame]: orm and the parsed chunk
+        """
+        orm, future = pending
+        start = time.perf_counter()
+        chunk = future.result()
+        self.parse_seconds += time.perf_counter() - start
+        self.coerced[orm.__tablename__] += chunk.attrs.pop("coerced", 0)
+        return orm, chunk
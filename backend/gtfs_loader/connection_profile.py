@@ -0,0 +1,339 @@
+"""ConnectionProfile class."""
+
+import collections
+import logging
+import os
+import sqlite3
+import threading
+import time
+import typing as t
+
+import sqlalchemy as sa
+from sqlalchemy import event
+
+from ..helper_functions.types import PathLike
+
+SERVING_THREADS = int(os.environ.get("MBTAMAPPER_THREADS", "50"))
+"""threads waitress serves with (`--threads` in deploy.sh)"""
+READERS = min(int(os.environ.get("MBTAMAPPER_READERS", "8")), SERVING_THREADS)
+"""connections in the read-only pool; waitress threads past it wait for one, \
+    which shows up in `CheckoutWaits`"""
+READ_CACHE_BYTES = 64 * 2**20
+"""page cache of the whole read-only pool, split between its connections"""
+
+
+class CheckoutWaits:
+    """Time spent waiting for connections from one pool.
+
+    Args:
+        name (str, optional): name of the pool, for logs. Defaults to "".
+        samples (int, optional): recent waits kept for percentiles. Defaults to 1024.
+    """
+
+    SLOW_SECONDS = 1.0
+    """waits longer than this are logged"""
+
+    def __init__(self, name: str = "", samples: int = 1024) -> None:
+        """Initializes CheckoutWaits.
+
+        Args:
+            name (str, optional): name of the pool, for logs. Defaults to "".
+            samples (int, optional): recent waits kept for percentiles. \
+                Defaults to 1024.
+        """
+        self.name = name
+        self.count = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._recent: collections.deque[float] = collections.deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.name}, count={self.count})>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def add(self, seconds: float, timed_out: bool = False) -> None:
+        """records one checkout.
+
+        Args:
+            seconds (float): time from asking for a connection to getting it
+            timed_out (bool, optional): the pool gave up. Defaults to False.
+        """
+        with self._lock:
+            self.count += 1
+            self.timeouts += timed_out
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self._recent.append(seconds)
+        if seconds > self.SLOW_SECONDS:
+            logging.warning(
+                "waited %.2f s for a %s connection%s",
+                seconds,
+                self.name,
+                " (timed out)" if timed_out else "",
+            )
+
+    def as_dict(self) -> dict[str, t.Any]:
+        """returns the waits as a json serializable dict; percentiles \
+            are over the recent samples, in seconds"""
+        with self._lock:
+            recent = sorted(self._recent)
+            stats = {
+                "count": self.count,
+                "timeouts": self.timeouts,
+                "mean": self.total_seconds / self.count if self.count else 0.0,
+                "max": self.max_seconds,
+            }
+        for q in (50, 95, 99):
+            stats[f"p{q}"] = recent[len(recent) * q // 100] if recent else 0.0
+        return stats
+
+
+class MonitoredQueuePool(sa.pool.QueuePool):
+    """`QueuePool` that records how long every checkout waited in `waits`, \
+        which survives `Engine.dispose`."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.waits = CheckoutWaits()
+
+    def _do_get(self) -> sa.pool.ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except sa.exc.TimeoutError:
+            self.waits.add(time.perf_counter() - start, timed_out=True)
+            raise
+        self.waits.add(time.perf_counter() - start)
+        return entry
+
+    def recreate(self) -> "MonitoredQueuePool":
+        pool = super().recreate()
+        pool.waits = self.waits
+        return pool
+
+
+class ConnectionProfile:
+    """Sqlite settings for one role of connection, applied to every \
+        connection of the engines it creates.
+
+    listeners are attached per engine, so a bulk load, the realtime writer \
+        and the web app's readers never share pragmas by accident.
+
+    Args:
+        name (str): name of the profile
+        pragmas (Sequence[str]): pragmas run on each new connection, in order
+        read_only (bool, optional): open the file with `mode=ro`. Defaults to False.
+        optimize (bool, optional): run `PRAGMA optimize` as connections close. \
+            Defaults to False.
+        snapshot (bool, optional): begin every transaction explicitly, so all \
+            its queries read one snapshot of the database. Defaults to False.
+        **engine_kwargs: keyword arguments for `sa.create_engine`, e.g. pool sizing
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pragmas: t.Sequence[str],
+        read_only: bool = False,
+        optimize: bool = False,
+        snapshot: bool = False,
+        **engine_kwargs,
+    ) -> None:
+        """Initializes ConnectionProfile.
+
+        Args:
+            name (str): name of the profile
+            pragmas (Sequence[str]): pragmas run on each new connection, in order
+            read_only (bool, optional): open the file with `mode=ro`. Defaults to False.
+            optimize (bool, optional): run `PRAGMA optimize` as connections close. \
+                Defaults to False.
+            snapshot (bool, optional): begin every transaction explicitly, so all \
+                its queries read one snapshot of the database. Defaults to False.
+            **engine_kwargs: keyword arguments for `sa.create_engine`, e.g. pool sizing
+        """
+        self.name = name
+        self.pragmas = tuple(pragmas)
+        self.read_only = read_only
+        self.optimize = optimize
+        self.snapshot = snapshot
+        self.engine_kwargs = engine_kwargs
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.name})>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def url(self, path: PathLike) -> str:
+        """sqlalchemy url of the database at `path` under this profile"""
+        if self.read_only:
+            return f"sqlite:///file:{path}?mode=ro&uri=true"
+        return f"sqlite:///{path}"
+
+    def create_engine(self, path: PathLike, **kwargs) -> sa.Engine:
+        """creates an engine for the sqlite database at `path`, \
+            pooled by a `MonitoredQueuePool` named after the profile.
+
+        Args:
+            path (PathLike): database file
+            **kwargs: keyword arguments for `sa.create_engine`, \
+                over the profile's own
+        Returns:
+            sa.Engine: engine whose connections use this profile
+        """
+        engine = sa.create_engine(
+            self.url(path),
+            **({"poolclass": MonitoredQueuePool} | self.engine_kwargs | kwargs),
+        )
+        if isinstance(engine.pool, MonitoredQueuePool):
+            engine.pool.waits.name = self.name
+        return self.attach(engine)
+
+    @staticmethod
+    def pool_status(engine: sa.Engine) -> dict[str, t.Any]:
+        """connections in use and checkout waits of `engine`'s pool.
+
+        Args:
+            engine (sa.Engine): engine to inspect
+        Returns:
+            dict[str, Any]: json serializable status; \
+                waits only for a `MonitoredQueuePool`
+        """
+        pool = engine.pool
+        status: dict[str, t.Any] = {"pool": pool.__class__.__name__}
+        if isinstance(pool, sa.pool.QueuePool):
+            status |= {"size": pool.size(), "checked_out": pool.checkedout()}
+        if isinstance(pool, MonitoredQueuePool):
+            status["waits"] = pool.waits.as_dict()
+        return status
+
+    def attach(self, engine: sa.Engine) -> sa.Engine:
+        """applies this profile to the connections of an existing engine.
+
+        Args:
+            engine (sa.Engine): engine, usually from a user supplied url
+        Returns:
+            sa.Engine: `engine`
+        """
+        event.listen(engine, "connect", self._on_connect)
+        if self.optimize:
+            event.listen(engine, "close", self._on_close)
+        if self.snapshot:
+            event.listen(engine, "begin", self._on_begin)
+        return engine
+
+    def _on_connect(
+        self,
+        dbapi_connection: sqlite3.Connection,
+        connection_record: sa.pool.ConnectionPoolEntry,
+    ) -> None:
+        """runs the profile's pragmas on a new connection.
+
+        Args:
+            dbapi_connection (sqlite3.Connection): connection to sqlite database
+            connection_record (ConnectionRecord, optional): connection record
+        """
+        # pylint: disable=unused-argument
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            logging.warning("db %s is unsupported", dbapi_connection.__class__.__name__)
+            return
+        cursor = dbapi_connection.cursor()
+        for pragma in self.pragmas:
+            try:
+                cursor.execute(f"PRAGMA {pragma}")
+            except sqlite3.OperationalError:
+                logging.warning("PRAGMA %s failed (%s)", pragma, self.name)
+        cursor.close()
+        if self.snapshot:  # pysqlite only begins before writes; see `_on_begin`
+            dbapi_connection.isolation_level = None
+
+    def _on_begin(self, conn: sa.Connection) -> None:
+        """begins the transaction in sqlite too, so the read snapshot is taken \
+            at its first query and held until it ends, rather than per statement.
+
+        Args:
+            conn (sa.Connection): connection beginning a transaction
+        """
+        conn.exec_driver_sql("BEGIN")
+
+    def _on_close(
+        self,
+        dbapi_connection: sqlite3.Connection,
+        connection_record: sa.pool.ConnectionPoolEntry,
+    ) -> None:
+        """runs `PRAGMA optimize` on a closing connection.
+
+        Args:
+            dbapi_connection (sqlite3.Connection): connection to sqlite database
+            connection_record (ConnectionRecord, optional): connection record
+        """
+        # pylint: disable=unused-argument
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA optimize")
+        except sqlite3.OperationalError:
+            logging.warning("PRAGMA optimize failed (%s)", self.name)
+        cursor.close()
+
+
+BULK_LOAD = ConnectionProfile(
+    "bulk_load",
+    [
+        "journal_mode=OFF",
+        "synchronous=OFF",
+        "locking_mode=EXCLUSIVE",
+        "foreign_keys=OFF",
+        f"cache_size={-256 * 1024}",
+        "temp_store=MEMORY",
+    ],
+    optimize=True,
+    pool_size=1,
+    max_overflow=0,
+)
+"""building a side database that is thrown away if anything fails: \
+    no journal, one exclusive connection, and foreign keys checked once \
+    by `Feed.validate_database` instead of on every row"""
+
+REALTIME_WRITER = ConnectionProfile(
+    "realtime_writer",
+    [
+        "journal_mode=WAL",
+        "synchronous=OFF",
+        f"journal_size_limit={64 * 2**20}",
+        "foreign_keys=ON",
+        "temp_store=MEMORY",
+    ],
+    optimize=True,
+    pool_size=1,
+    max_overflow=0,
+)
+"""the live database's one serialized writer: wal, so readers never wait on \
+    the realtime imports, and the wal truncated back to 64 MiB after checkpoints. \
+    unsynced like the old pragmas: `synchronous=NORMAL`, a bigger cache and \
+    rarer checkpoints were ~5-10% slower in `benchmark.py profiles`, and \
+    the realtime tables are fetched again within seconds anyway"""
+
+READ_ONLY = ConnectionProfile(
+    "read_only",
+    [
+        "query_only=1",
+        f"mmap_size={256 * 2**20}",
+        f"cache_size={-READ_CACHE_BYTES // READERS // 1024}",
+        "temp_store=MEMORY",
+    ],
+    read_only=True,
+    snapshot=True,
+    pool_size=READERS,
+    max_overflow=0,
+)
+"""serving the web app: read-only file, memory mapped, `READERS` pooled \
+    connections shared by the waitress threads, within `READ_CACHE_BYTES` \
+    of page cache. the mapped pages are the os's file cache, shared by every \
+    connection and reclaimable, so they aren't budgeted per connection. \
+    each session reads one snapshot, so a response never mixes two realtime imports"""
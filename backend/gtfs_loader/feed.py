@@ -5,13 +5,11 @@
 import io
 import logging
 import os
-import shutil
-import sqlite3
-import tempfile
 import textwrap
+import threading
 import time
 import typing as t
-from datetime import datetime
+from datetime import datetime, timedelta
 from zipfile import ZipFile
 
 import asteval
@@ -21,20 +19,36 @@ import pandas.core.generic as pdcg
 import requests as req
 import sqlalchemy as sa
 import timeout_function_decorator
-from sqlalchemy import event, exc
+from sqlalchemy import exc
 from sqlalchemy import orm as saorm
 
 from ..gtfs_orms import *
-from ..helper_functions import removes_session, timeit
-from ..helper_functions.types import PathLike
+from ..helper_functions import records_import, removes_session, timeit
+from ..helper_functions.gtfs_helper_time_functions import get_date
+from .archive_cache import ArchiveCache
+from .blue_green import BlueGreen
+from .bulk_loader import BulkLoader
+from .chunk_reader import ChunkReader
+from .connection_profile import BULK_LOAD, REALTIME_WRITER
+from .feed_manifest import FeedManifest
+from .import_telemetry import ImportTelemetry
 from .query import Query
+from .realtime_enrichment import RealtimeEnrichment
+from .realtime_feed import RealtimeFeed
+from .realtime_fetcher import RealtimeFetcher
+from .realtime_store import RealtimeStore
+from .schedule_snapshot import ScheduleSnapshot
+from .vehicle_history import VehicleHistory
 
 
-class Feed:
+class Feed(BlueGreen, RealtimeFeed):
     """Loads GTFS data into a route_type specific SQLite database. \
         This class also contains methods to query the database. \
         inherits from Query class, which contains queries. \
     This class is thread-safe.
+
+    its databases are managed by `BlueGreen`, and its realtime data \
+        imported and served by `RealtimeFeed`.
         
 
     Args:
@@ -57,6 +71,16 @@ class Feed:
     STOPS_FILE = "stops.json"
     SHAPES_FILE = "shapes.json"
 
+    PROGRESS_STEP = 0.1
+    """fraction of the download between progress logs"""
+
+    SERVICE_ORMS: tuple[t.Type[Base], ...] = (
+        Calendar,
+        CalendarDate,
+        CalendarAttribute,
+    )
+    """tables that decide which services are active; see `filter_services`"""
+
     @staticmethod
     def find_orm(name: str) -> t.Type[Base] | None:
         """returns the `type` of the orm by name
@@ -71,62 +95,30 @@ class Feed:
                 return cls
         return None
 
-    @staticmethod
-    @event.listens_for(sa.Engine, "connect")
-    def _on_connect(
-        dbapi_connection: sqlite3.Connection,
-        connection_record: sa.pool.ConnectionPoolEntry,
-    ) -> None:
-        """Sets sqlite pragma for each connection,\
-            automitcally called when a connection is created.
-
-        Args:
-            dbapi_connection (sqlite3.Connection): connection to sqlite database
-            connection_record (ConnectionRecord, optional): connection record
-        """
-
-        if not isinstance(dbapi_connection, sqlite3.Connection):
-            logging.warning("db %s is unsupported", dbapi_connection.__class__.__name__)
-            return
-        cursor = dbapi_connection.cursor()
-        for pragma in [
-            "journal_mode=WAL",
-            "synchronous=OFF",
-            "foreign_keys=ON",
-            "temp_store=MEMORY",
-            "shrink_memory",
-            "read_uncommitted=1",
-        ]:
-            try:
-                cursor.execute(f"PRAGMA {pragma}")
-            except sqlite3.OperationalError:
-                logging.warning("PRAGMA %s failed", pragma)
-        cursor.close()
-
-    @staticmethod
-    @event.listens_for(sa.Engine, "close")
-    def _on_close(
-        dbapi_connection: sqlite3.Connection,
-        connection_record: sa.pool.ConnectionPoolEntry,
-    ) -> None:
-        """Sets sqlite pragma on close automatically.
+    @classmethod
+    def dependent_orms(cls, *filenames: str) -> list[t.Type[Base]]:
+        """schedule orms loaded from `filenames`, plus every orm \
+            that references them, in `SCHEDULE_ORMS` order.
 
         Args:
-            dbapi_connection (sqlite3.Connection): connection to sqlite database
-            connection_record (ConnectionRecord, optional): connection record
+            *filenames (str): changed files within the gtfs feed
+        Returns:
+            list[type[Base]]: orms to reload
         """
-        if not isinstance(dbapi_connection, sqlite3.Connection):
-            logging.warning("db %s is unsupported", dbapi_connection.__class__.__name__)
-            return
-        cursor = dbapi_connection.cursor()
-        try:
-            cursor.execute("PRAGMA optimize")
-        except sqlite3.OperationalError:
-            logging.warning("PRAGMA optimize failed")
-        cursor.close()
+        tables: set[str] = set()
+        orms: list[t.Type[Base]] = []
+        for orm in cls.SCHEDULE_ORMS:
+            parents = {fkey.column.table.name for fkey in orm.__table__.foreign_keys}
+            if orm.__filename__ in filenames or parents & tables:
+                orms.append(orm)
+                tables.add(orm.__tablename__)
+                if orm is ShapePoint:
+                    tables.add(Shape.__tablename__)
+        return orms
 
     def _get_session(self, readonly: bool = False, **kwargs) -> saorm.Session:
-        """returns a `Session` from `Feed.scoped_session`.
+        """returns a `Session` from `Feed.scoped_session`, \
+            or from `Feed.writer_session` unless `readonly`.
 
         wrapper for `sa.scoped_session.__call__(...)`
 
@@ -138,9 +130,9 @@ class Feed:
             Session: session object
         """
 
-        session = self.scoped_session(**kwargs)
         if not readonly:
-            return session
+            return self.writer_session(**kwargs)
+        session = self.scoped_session(**kwargs)
         session.flush = lambda *_, **__: logging.warning("flush on readonly session")
         return session
 
@@ -149,144 +141,496 @@ class Feed:
     ) -> None:
         """Initializes Feed object with url.
 
+        without an `engine_uri`, the feed manages its own sqlite files: \
+            `import_gtfs` builds `{gtfs_name}.building.db` beside the live \
+            database and swaps it in once it's valid (see `swap_database`), \
+            and writes and reads go through separate pools (see `open_database`). \
+            with one, reads and writes share its engine.
+
         Args:
             url (str): url of GTFS feed
             gtfs_name (str, optional): name of GTFS feed. Defaults to auto-parsed from url.
-            engine_uri (str, optional): _description_. Defaults to "".
+            engine_uri (str, optional): database to load into in place. \
+                Defaults to the newest `{gtfs_name}.<generation>.db`.
             kwargs: keyword arguments to pass to `sa.create_engine`
         """
         self.url = url
         # ------------------------------- Connection/Session Setup ------------------------------- #
         self.gtfs_name = gtfs_name or url.rsplit("/", maxsplit=1)[-1].split(".")[0]
-        self.zip_path = os.path.join(tempfile.gettempdir(), self.gtfs_name)
-        self.engine = sa.create_engine(engine_uri or f"sqlite:///{self.gtfs_name}.db")
+        self.blue_green = not engine_uri
+        """whether rebuilds go to a side database that is swapped in"""
+        # the serialized writer, and the read-only pool the app is served from
+        if engine_uri:
+            self.engine = REALTIME_WRITER.attach(sa.create_engine(engine_uri, **kwargs))
+            self.reader_engine = self.engine
+        else:
+            self.engine, self.reader_engine = self.open_database(
+                (self.generations or [self.legacy_db_path])[-1], **kwargs
+            )
+        # `info` lets instances reach the feed, e.g. `Prediction` its delays
         self.scoped_session = saorm.scoped_session(
-            saorm.sessionmaker(self.engine, expire_on_commit=False, autoflush=False)
+            saorm.sessionmaker(
+                self.reader_engine,
+                expire_on_commit=False,
+                autoflush=False,
+                info={"feed": self},
+            )
+        )
+        self.writer_session = saorm.scoped_session(
+            saorm.sessionmaker(
+                self.engine,
+                expire_on_commit=False,
+                autoflush=False,
+                info={"feed": self},
+            )
         )
+        self.manifest_path = f"{self.gtfs_name}.manifest.json"
+        self.snapshot_path = f"{self.gtfs_name}.snapshot"
+        self.archive_cache = ArchiveCache(f"{self.gtfs_name}.cache")
+        self.session = req.Session()
+        """pooled http session for feed downloads"""
+        self.fetcher = RealtimeFetcher(workers=len(__class__.REALTIME_ORMS))
+        """pooled, concurrent client for the realtime feeds"""
+        self.telemetry = ImportTelemetry(
+            f"{self.gtfs_name}.history.db",
+            self.gtfs_name,
+            aggregate={"import_realtime": 300},
+        )
+        """import runs; realtime imports are saved as one row per 5 minutes"""
+        self._snapshot: ScheduleSnapshot | None = None
+        self._realtime: dict[str, tuple[str | None, pd.DataFrame]] = {}
+        """last snapshot applied per realtime table, with the database it went to"""
+        self._realtime_lock = threading.Lock()
+        self._enrich_lock = threading.Lock()
+        """held by `_enrich`, which runs outside `_realtime_lock`"""
+        self.realtime_store = RealtimeStore()
+        """the realtime tables in memory, replaced whole by every import"""
+        self.realtime_enrichment = RealtimeEnrichment()
+        """derives the store's schedule dependent columns once per import"""
+        self.vehicle_history = VehicleHistory()
+        """recent positions of every vehicle, recorded by every vehicle import"""
+        self._vehicle_filters: dict[tuple, tuple[set[str], ...]] = {}
+        """routes and trips `get_vehicles_feature` keeps, by database and query"""
 
     def __repr__(self) -> str:
-        return f"<{self.__class__.__name__}({self.url} -> {self.gtfs_name}.db)>"
+        return f"<{self.__class__.__name__}({self.url} -> {self.engine.url.database})>"
 
     def __str__(self) -> str:
         return self.__repr__()
 
     @timeit
-    def download_gtfs(self, **kwargs) -> None:
-        """Downloads the GTFS feed zip file into a temporary directory.
+    def download_gtfs(
+        self,
+        chunk_size: int = 2**20,
+        manifest: FeedManifest | None = None,
+        **kwargs,
+    ) -> t.IO[bytes] | None:
+        """Streams the GTFS feed zip file into the `ArchiveCache`. \
+            the archive is never extracted; members are read straight from it.
+
+        the request is conditional on `manifest`'s validators, or else on the \
+            newest cached archive's, which is reused if the feed is unchanged. \
+            an interrupted download is resumed with `Range`/`If-Range`.
 
         args:
-            **kwargs: keyword arguments to pass to `requests.get()`
+            chunk_size (int, optional): bytes per streamed chunk. Defaults to 1 MiB.
+            manifest (FeedManifest, optional): makes the request conditional on \
+                its validators, which are then updated from the response.
+            **kwargs: keyword arguments to pass to `requests.Session.get()`
+        Returns:
+            IO[bytes] | None: the archive, at the start. the caller closes it. \
+                `None` if the server says `manifest`'s feed is not modified.
+        """
+        cache = self.archive_cache
+        cached = cache.latest
+        conditional = manifest is not None and bool(manifest.headers)
+        headers = kwargs.pop("headers", {}) | (
+            manifest.headers if conditional else cached.headers
+        )
+        offset, partial = cache.partial()
+        if offset:
+            headers |= {
+                "Range": f"bytes={offset}-",
+                "If-Range": partial.etag or partial.last_modified,
+            }
+        with self.session.get(
+            self.url, timeout=10, stream=True, headers=headers, **kwargs
+        ) as source:
+            if source.status_code == 304:
+                logging.info("%s not modified", self.url)
+                if conditional:
+                    return None
+                archive = cache.open(cached.sha256)
+                validators = cached
+            elif source.status_code == 416:  # partial download is stale
+                cache.discard_partial()
+                return self.download_gtfs(chunk_size, manifest, **kwargs)
+            elif not source.ok:
+                raise req.exceptions.HTTPError(
+                    f"download {self.url}: {source.status_code}"
+                )
+            else:
+                validators = FeedManifest(
+                    source.headers.get("ETag"), source.headers.get("Last-Modified")
+                )
+                resume = source.status_code == 206
+                if resume:
+                    logging.info("resuming %s at %s bytes", self.url, offset)
+                total = int(source.headers.get("Content-Length", 0)) + offset * resume
+                with cache.start_partial(validators, resume) as file:
+                    progress = self.PROGRESS_STEP
+                    for block in source.iter_content(chunk_size):
+                        file.write(block)
+                        if total and file.tell() >= progress * total:
+                            logging.info(
+                                "%s: %d%% of %s bytes",
+                                self.url,
+                                100 * file.tell() // total,
+                                total,
+                            )
+                            progress = file.tell() / total + self.PROGRESS_STEP
+                    size = file.tell()
+                validators.sha256, archive = cache.commit(validators)
+                logging.info("Downloaded %s bytes from %s", size, self.url)
+        if manifest is not None:
+            manifest.etag = validators.etag
+            manifest.last_modified = validators.last_modified
+            manifest.sha256 = validators.sha256
+        return archive
+
+    def _changed_orms(
+        self, manifest: FeedManifest, previous: FeedManifest, expired: bool
+    ) -> list[t.Type[Base]]:
+        """the orms to load: all of them, or with a `previous` manifest, \
+            those whose files changed and those referencing them.
+
+        Args:
+            manifest (FeedManifest): manifest of the downloaded feed, \
+                which keeps `previous.valid_until` if the calendars aren't reloaded
+            previous (FeedManifest): manifest of the last import, if incremental
+            expired (bool): services filtered out of `previous` are due back
+        Returns:
+            list[type[Base]]: orms in `SCHEDULE_ORMS` order; empty if unchanged
         """
+        if not previous:
+            return list(__class__.SCHEDULE_ORMS)
+        if manifest.feed_version != previous.feed_version:
+            logging.info(
+                "feed_version %s -> %s", previous.feed_version, manifest.feed_version
+            )
+        changed = manifest.changed_files(previous)
+        if expired:
+            logging.info("filtered services due on %s", previous.valid_until)
+            changed.add(Calendar.__filename__)
+        orms = self.dependent_orms(*changed)
+        if not orms:
+            logging.info("%s unchanged, skipping import", self.gtfs_name)
+        else:
+            logging.info("reloading %s", ", ".join(o.__tablename__ for o in orms))
+        if Calendar not in orms:
+            manifest.valid_until = previous.valid_until
+        return orms
 
-        source = req.get(self.url, timeout=10, **kwargs)
-        if not source.ok:
-            raise req.exceptions.HTTPError(f"download {self.url}: {source.status_code}")
-        with ZipFile(io.BytesIO(source.content)) as zipfile_bytes:
-            zipfile_bytes.extractall(self.zip_path)
-        logging.info("Downloaded zip from %s to %s", self.url, self.zip_path)
-
-    def remove_zip(self) -> None:
-        """Removes the GTFS zip file."""
-        if not os.path.exists(self.zip_path):
-            logging.warning("%s does not exist", self.zip_path)
-            return
-        shutil.rmtree(self.zip_path)
-        logging.info("Removed %s", self.zip_path)
+    def _stage(self, partial: bool, purge: bool) -> sa.Engine:
+        """the engine to load into: with `blue_green`, a fresh \
+            `{gtfs_name}.building.db`, or a copy of the live database \
+            for partial reloads; else the live database itself.
 
-    @property
-    def db_exists(self) -> bool:
-        """if the database exists"""
+        Args:
+            partial (bool): only some tables are reloaded
+            purge (bool): whether to purge the database before a full load
+        Returns:
+            sa.Engine: engine to load into
+        """
+        if not self.blue_green:
+            # a failed load leaves no manifest, so the next import is a full one
+            FeedManifest.remove(self.manifest_path)
+            return self.engine
+        building_path = f"{self.gtfs_name}.building.db"
+        self.remove_database(building_path)
+        if partial or not purge:
+            return self.backup_to_file(building_path, BULK_LOAD)
+        return BULK_LOAD.create_engine(building_path)
+
+    def _prepare_tables(
+        self,
+        engine: sa.Engine,
+        orms: list[t.Type[Base]],
+        partial: bool,
+        purge: bool,
+    ) -> None:
+        """empties the tables of `orms` for a partial reload, \
+            or recreates every table without indexes for a purged full load.
 
-        return all(
-            sa.inspect(self.engine).has_table(table)
-            for table in Base.metadata.tables.keys()
+        Args:
+            engine (sa.Engine): engine to load into
+            orms (list[type[Base]]): orms to load
+            partial (bool): only `orms` are reloaded
+            purge (bool): whether to purge the database before a full load
+        """
+        if partial:
+            self.drop_indexes(engine, *orms)
+            with engine.begin() as conn:
+                for orm in reversed(orms):
+                    conn.execute(Query.delete(orm))
+                    if orm is ShapePoint:
+                        conn.execute(Query.delete(Shape))
+        elif purge:
+            Base.metadata.drop_all(engine)
+            self.create_tables(engine, indexes=False)
+
+    def _load_archive(
+        self,
+        engine: sa.Engine,
+        reader: ChunkReader,
+        orms: list[t.Type[Base]],
+        date: datetime | None = None,
+        manifest: FeedManifest | None = None,
+    ) -> BulkLoader:
+        """loads `orms` into `engine`, whose tables are prepared; see `import_gtfs`.
+
+        when some tables aren't reloaded, rows whose parents aren't in the \
+            database are dropped, as the unchanged parents were filtered.
+
+        Args:
+            engine (sa.Engine): engine to load into
+            reader (ChunkReader): reader of the GTFS archive, with the parse options
+            orms (list[type[Base]]): orms to load, in `SCHEDULE_ORMS` order
+            date (datetime, optional): filter out services inactive around `date` \
+                once the calendars are loaded (default: None, load everything)
+            manifest (FeedManifest, optional): manifest to record `valid_until` in
+        Returns:
+            BulkLoader: the loader, with its counts
+        """
+        loader = BulkLoader(engine)
+        # services are filtered once the calendars are in, before any trip is
+        # written; every later table then drops the rows of filtered services
+        filtering = bool(date) and Calendar in orms
+        orphans = len(orms) < len(__class__.SCHEDULE_ORMS)
+        services_end = max(map(__class__.SCHEDULE_ORMS.index, __class__.SERVICE_ORMS))
+        shape_ids: set[str] = set()  # inserted from earlier `shapes.txt` chunks
+        chunk: pd.DataFrame
+        for orm, chunk in reader.iter_chunks(orms):
+            if filtering and __class__.SCHEDULE_ORMS.index(orm) > services_end:
+                with engine.begin() as conn:
+                    self.filter_services(conn, date, manifest)
+                filtering, orphans = False, True
+            if orm.__filename__ == "shapes.txt":
+                new_shapes = chunk["shape_id"].drop_duplicates()
+                new_shapes = new_shapes[~new_shapes.isin(shape_ids)]
+                loader.insert(new_shapes, Shape)
+                shape_ids.update(new_shapes)
+            if orphans:
+                chunk = loader.drop_orphans(chunk, orm)
+            loader.insert(chunk, orm)
+        if filtering:
+            with engine.begin() as conn:
+                self.filter_services(conn, date, manifest)
+        self.create_indexes(engine)
+        for table, coerced in reader.coerced.items():
+            if coerced:
+                logging.warning("%s values nulled in %s: wrong type", coerced, table)
+        self.telemetry.add(
+            loader.added | {f"{k}.coerced": v for k, v in reader.coerced.items()},
+            parse_seconds=reader.parse_seconds,
+            write_seconds=loader.write_seconds,
         )
+        return loader
 
     @timeit
-    def import_gtfs(self, *args, purge: bool = True, **kwargs) -> None:
-        """Dumps GTFS data into a SQLite database.
+    @records_import
+    def import_gtfs(
+        self,
+        *args,
+        purge: bool = True,
+        incremental: bool = False,
+        date: datetime | None = None,
+        workers: int = 0,
+        chunksize: int = 100_000,
+        **kwargs,
+    ) -> set[str]:
+        """Dumps GTFS data into a SQLite database, \
+            reading each csv straight out of the downloaded archive.
+
+        with `incremental`, the last import's `FeedManifest` is compared to the feed: \
+            the download is conditional on its `ETag`/`Last-Modified`, and only \
+            tables whose files changed (and the tables referencing them) are \
+            reloaded. nothing is reloaded if the feed is unchanged, unless services \
+            filtered out by `purge_and_filter` are due back.
+
+        with `blue_green`, the load goes into `{gtfs_name}.building.db`, \
+            a copy of the live database for partial reloads, which is \
+            validated and swapped in; a failed build leaves the live one as is. \
+            the build uses the `BULK_LOAD` connection profile.
+
+        with `workers > 1`, chunks are parsed in a process pool while this \
+            process writes earlier chunks in `SCHEDULE_ORMS` order.
+
+        with a `date`, services inactive around it are dropped as soon as the \
+            calendars are loaded, so their trips and stop times are never written.
 
         Args:
             *args: args to pass to pd.read_csv
-            purge (bool): whether to purge the database before loading (default: True)
-            **kwargs: keyword args for pd.read_csv
+            purge (bool): whether to purge the database before a full load (default: True)
+            incremental (bool): only reload what changed since the last import (default: False)
+            date (datetime, optional): filter out services inactive around `date` \
+                (default: None, load every service)
+            workers (int): parser processes, <= 1 parses inline (default: 0)
+            chunksize (int): rows per chunk (default: 100_000)
+            **kwargs: keyword args for `ChunkReader` (e.g. `arrow`) and pd.read_csv. \
+                unless `arrow=False`, columns are typed from the orms.
+        Returns:
+            set[str]: names of the tables loaded
         """
-        # ------------------------------- Create Tables ------------------------------- #
-        self.download_gtfs()
-        if purge:
-            Base.metadata.drop_all(self.engine)
-            Base.metadata.create_all(self.engine)
-        # ------------------------------- Dump Data ------------------------------- #
-        for orm in __class__.SCHEDULE_ORMS:
-            with pd.read_csv(
-                os.path.join(self.zip_path, orm.__filename__), *args, **kwargs
-            ) as read:
-                chunk: pd.DataFrame
-                for chunk in read:
-                    if orm.__filename__ == "shapes.txt":
-                        self.to_sql(
-                            chunk["shape_id"].drop_duplicates(), Shape, pk_offset=True
-                        )
-                    self.to_sql(chunk, orm, pk_offset=True)
-        self.remove_zip()
+        previous = FeedManifest()
+        if incremental and self.db_exists:
+            previous = FeedManifest.load(self.manifest_path)
+        expired = previous.expired(get_date())
+        validators = FeedManifest()
+        if previous and not expired:
+            validators = FeedManifest(previous.etag, previous.last_modified)
+        if (archive_file := self.download_gtfs(manifest=validators)) is None:
+            return set()
+        with archive_file, ZipFile(archive_file) as archive:
+            manifest = FeedManifest.from_archive(
+                archive,
+                etag=validators.etag,
+                last_modified=validators.last_modified,
+                sha256=validators.sha256,
+            )
+            if not (orms := self._changed_orms(manifest, previous, expired)):
+                manifest.save(self.manifest_path)
+                return set()
+            engine = self._stage(bool(previous), purge)
+            try:
+                self._prepare_tables(engine, orms, bool(previous), purge)
+                reader = ChunkReader(
+                    archive, *args, workers=workers, chunksize=chunksize, **kwargs
+                )
+                loader = self._load_archive(engine, reader, orms, date, manifest)
+                if engine is not self.engine:
+                    if not previous and purge:
+                        self._copy_realtime(engine)
+                    self.validate_database(engine)
+            except Exception:
+                if engine is not self.engine:
+                    engine.dispose()
+                    self.remove_database(engine.url.database)
+                raise
+        if engine is not self.engine:
+            self.swap_database(engine)
+        for table, rejected in loader.rejected.items():
+            if rejected:
+                logging.warning("%s rows rejected from %s", rejected, table)
+        for table, orphaned in loader.orphaned.items():
+            logging.info("%s orphaned rows dropped from %s", orphaned, table)
+        manifest.save(self.manifest_path)
         logging.info("Loaded %s", self.gtfs_name)
+        return set(loader.added)
 
     @timeit
+    @records_import
     @removes_session
-    def import_realtime(
-        self, orm: RealtimeOrms | str, use_cache: bool = True, chunksize: int = 1000
-    ) -> None:
-        """Imports realtime data into the database.
+    def purge_and_filter(self, date: datetime) -> int:
+        """Purges and filters the database.
+
+        also records in the manifest when the first filtered out service \
+            comes back into the window, which expires an unchanged feed.
 
         Args:
-            orm (RealtimeOrms | str): realtime ORM.
+            date (datetime): date to filter on
+        Returns:
+            int: number of rows deleted
         """
+        session = self._get_session()
+        manifest = FeedManifest.load(self.manifest_path)
+        calendars = self.filter_services(session, date, manifest)
+        stmt = Query.delete_facilities_query("parking-area", "bike-storage")
+        res: sa.CursorResult = session.execute(stmt)
+        logging.info("Deleted %s rows from %s", res.rowcount, stmt.table.name)
+        deleted = calendars + res.rowcount
+        session.commit()
+        self.telemetry.add(
+            {Calendar.__tablename__: calendars, stmt.table.name: res.rowcount}
+        )
+        if manifest:
+            manifest.save(self.manifest_path)
+        return deleted
 
-        if isinstance(orm, str):
-            orm = __class__.find_orm(orm)
-        if orm not in __class__.REALTIME_ORMS:
-            raise ValueError(f"{orm} is not a realtime ORM")
+    @staticmethod
+    def filter_services(
+        conn: sa.Connection | saorm.Session,
+        date: datetime,
+        manifest: FeedManifest | None = None,
+    ) -> int:
+        """deletes the calendars inactive around `date`, cascading to their trips; \
+            doesn't commit. their calendar dates and attributes are deleted \
+            explicitly, for connections without `foreign_keys`.
+
+        also records in `manifest` when the first filtered out service \
+            comes back into the window, which expires an unchanged feed.
 
-        dataset: LinkedDataset
-        if use_cache and (_tmp := LinkedDataset.cache.get(orm.__realtime_name__)):
-            dataset = LinkedDataset.from_dict(_tmp)
-            logging.info("Using cached LinkedDataset for %s", orm.__realtime_name__)
-        else:
-            session = self._get_session(readonly=True)
-            dataset = session.execute(
-                Query.get_dataset_query(orm.__realtime_name__)
-            ).one_or_none()[0]
-
-        if use_cache:
-            dataset.cache_key(key=orm.__realtime_name__)
-        if not dataset:
-            return
-
-        dataframe = dataset.as_dataframe()
-        for i, chunk in enumerate(
-            dataframe[i : i + chunksize]
-            for i in range(0, dataframe.shape[0], chunksize)
-        ):
-            self.to_sql(chunk, orm, purge=i == 0)
+        Args:
+            conn (sa.Connection | Session): connection or session to delete with
+            date (datetime): date to filter on
+            manifest (FeedManifest, optional): manifest to update
+        Returns:
+            int: number of calendars deleted
+        """
+        next_start, next_added = conn.execute(
+            Query.get_next_service_dates_query(date)
+        ).one()
+        stmt = Query.delete_calendars_query(date)
+        res: sa.CursorResult = conn.execute(stmt)
+        logging.info("Deleted %s rows from %s", res.rowcount, stmt.table.name)
+        for orm in __class__.SERVICE_ORMS:
+            if orm is not Calendar:
+                conn.execute(
+                    sa.delete(orm).where(
+                        orm.service_id.notin_(sa.select(Calendar.service_id))
+                    )
+                )
+        if manifest:
+            due = [d.strftime(FeedManifest.DATE_FORMAT) for d in [next_added] if d]
+            if next_start:
+                due.append(
+                    (next_start - timedelta(days=7)).strftime(FeedManifest.DATE_FORMAT)
+                )
+            if manifest.valid_until:  # services filtered out by earlier purges
+                due.append(manifest.valid_until)
+            manifest.valid_until = min(due, default=None)
+        return res.rowcount
 
     @timeit
-    @removes_session
-    def purge_and_filter(self, date: datetime) -> None:
-        """Purges and filters the database.
+    def export_snapshot(self, date: datetime | None = None) -> ScheduleSnapshot:
+        """writes a `ScheduleSnapshot` of the database to `snapshot_path`. \
+            realtime enrichment reads the shapes it interpolates bearings \
+            along from it, until the database is swapped.
 
         Args:
-            date (datetime): date to filter on
+            date (datetime, optional): first service day. Defaults to today.
+        Returns:
+            ScheduleSnapshot: the new snapshot
         """
-        session = self._get_session()
-        for stmt in [
-            Query.delete_calendars_query(date),
-            Query.delete_facilities_query("parking-area", "bike-storage"),
-        ]:
-            res: sa.CursorResult = session.execute(stmt)
-            logging.info("Deleted %s rows from %s", res.rowcount, stmt.table.name)
-        session.commit()
+        self._snapshot = ScheduleSnapshot.export(
+            self.reader_engine, self.snapshot_path, date
+        )
+        return self._snapshot
+
+    @property
+    def snapshot(self) -> ScheduleSnapshot:
+        """the newest `ScheduleSnapshot`, remapped once another process exports one.
+
+        Raises:
+            FileNotFoundError: if no snapshot was exported yet
+        """
+        generations = ScheduleSnapshot.generations(self.snapshot_path)
+        if not self._snapshot or generations[-1:] != [self._snapshot.path]:
+            self._snapshot = ScheduleSnapshot.load(self.snapshot_path)
+        return self._snapshot
 
     @timeit
+    @records_import
     def export_geojsons(self, key: str, *route_types: str, file_path: str) -> None:
         """exports static geojson files for routes, facilities and shapes
 
@@ -295,35 +639,36 @@ class Feed:
             - *route_types (str): route types to export
             - file_path (str): path to export files to
         """
-        # pylint:disable=unspecified-encoding
         query_obj = Query(*route_types)
         file_subpath = os.path.join(file_path, key)
         def_kwargs = {"mode": "w", "encoding": "utf-8"}
         for path in (file_path, file_subpath):
             if not os.path.exists(path):
                 os.mkdir(path)
+        exports: dict[str, t.Callable[[], gj.FeatureCollection]] = {
+            self.SHAPES_FILE: lambda: self.get_shape_features(
+                key, query_obj, "agency", "timestamp", "start_date", "end_date"
+            ),
+            self.PARKING_FILE: lambda: self.get_parking_features(
+                key, query_obj, "timestamp"
+            ),
+            self.STOPS_FILE: lambda: self.get_stop_features(
+                key, query_obj, "child_stops", "routes", "timestamp"
+            ),
+        }
         file: io.TextIOWrapper
-        with open(os.path.join(file_subpath, self.SHAPES_FILE), **def_kwargs) as file:
-            gj.dump(
-                self.get_shape_features(
-                    key, query_obj, "agency", "timestamp", "start_date", "end_date"
-                ),
-                file,
-            )
-            logging.info("Exported %s", file.name)
-
-        with open(os.path.join(file_subpath, self.PARKING_FILE), **def_kwargs) as file:
-            gj.dump(self.get_parking_features(key, query_obj, "timestamp"), file)
-            logging.info("Exported %s", file.name)
-
-        with open(os.path.join(file_subpath, self.STOPS_FILE), **def_kwargs) as file:
-            gj.dump(
-                self.get_stop_features(
-                    key, query_obj, "child_stops", "routes", "timestamp"
-                ),
-                file,
+        for filename, get_features in exports.items():
+            start = time.perf_counter()
+            features = get_features()
+            built = time.perf_counter()
+            with open(os.path.join(file_subpath, filename), **def_kwargs) as file:
+                gj.dump(features, file)
+                logging.info("Exported %s", file.name)
+            self.telemetry.add(
+                {f"{key}/{filename}": len(features["features"])},
+                parse_seconds=built - start,
+                write_seconds=time.perf_counter() - built,
             )
-            logging.info("Exported %s", file.name)
 
     @removes_session
     def get_stop_features(
@@ -401,59 +746,6 @@ class Feed:
             facils += session.execute(query_obj.ferry_parking_query).all()
         return gj.FeatureCollection([f[0].as_feature(*include) for f in facils])
 
-    @removes_session
-    def get_vehicles_feature(
-        self,
-        key: str,
-        query_obj: Query,
-        *include: str,
-        attempts: int = 10,
-        timeout: int = 0.5,
-    ) -> gj.FeatureCollection:
-        """Returns vehicles as FeatureCollection.
-
-        - early return if ferry data is requested.
-        - tries 10 times to get data
-
-        Args:
-            key (str): the type of data to export (RAPID_TRANSIT, BUS, etc.)
-            query_obj (Query): Query object
-            *include (str): other orms to include
-            attemps (int): num attempts default: 10
-            timeout (float): timeout to take between attempts default 0.5 seconds
-        Returns:
-            FeatureCollection: vehicles as FeatureCollection
-        """
-        session = self._get_session(readonly=True)
-        if key == "ferry":  # no ferry data :(
-            return gj.FeatureCollection([])
-        _routes: list[str] = []
-        if key == "rapid_transit":
-            _routes.extend(self.SL_ROUTES)
-            # _routes.extend([*self.SL_ROUTES, "Shuttle-Generic"])
-        data: list[tuple[Vehicle]] = []
-        for _ in range(attempts):
-            try:
-                data = session.execute(query_obj.get_vehicles_query(*_routes)).all()
-                # if any(v[0].predictions for v in data):
-                if data:
-                    break
-            except Exception as error:
-                logging.error("Failed to get vehicle data: %s", error)
-                continue
-
-            time.sleep(timeout)
-        if not data:
-            logging.error("No pred data returned in %s attemps", attempts)
-        try:
-            return gj.FeatureCollection([v[0].as_feature(*include) for v in data])
-        except Exception as error:
-            logging.error("Failed to parse vehicle data, retrying: %s", error)
-            time.sleep(timeout)
-            return self.get_vehicles_feature(
-                key, query_obj, *include, attempts=attempts - 1, timeout=timeout
-            )
-
     @removes_session
     def to_sql(
         self,
@@ -470,11 +762,18 @@ class Feed:
             orm (any): table to dump to
             purge (bool, optional): whether to purge table before dumping. Defaults to False.
             kwargs: keyword args to pass to pd.to_sql
-            pk_offset (bool, optional): whether to offset primary key by 1. Defaults to False.
+            pk_offset (bool, optional): whether to resolve duplicate primary keys \
+                with `orm.__conflict__` instead of raising. Defaults to False.
 
         Returns:
             int: number of rows added
         """
+        if pk_offset:
+            data = BulkLoader.dedupe(
+                data.to_frame() if isinstance(data, pd.Series) else data, orm
+            )
+            kwargs.setdefault("method", BulkLoader.to_sql_method(orm))
+        start = time.perf_counter()
         try:
             with self.engine.begin() as conn:
                 # with session.begin() as connL
@@ -489,23 +788,25 @@ class Feed:
                 )
 
         except exc.IntegrityError as error:
-            if not pk_offset:
-                logging.error(
-                    "failed import realtime data for %s: %s", orm.__name__, error
-                )
-                raise error
-            return self.to_sql(
-                data.iloc[1:], orm, purge=purge, pk_offset=pk_offset, **kwargs
-            )
+            logging.error("failed import data for %s: %s", orm.__name__, error)
+            raise error
 
         except (exc.OperationalError, exc.DatabaseError) as error:
             logging.error(
                 "retrying failed import realtime data for %s: %s", orm.__name__, error
             )
             time.sleep(1)
-            return self.to_sql(data, orm, purge=purge, **kwargs)
+            return self.to_sql(data, orm, purge=purge, pk_offset=pk_offset, **kwargs)
 
-        logging.info("Added %s rows to %s", res, orm.__tablename__)
+        logging.info(
+            "Added %s rows to %s (%s rejected)",
+            res,
+            orm.__tablename__,
+            len(data) - (res or 0) if pk_offset else 0,
+        )
+        self.telemetry.add(
+            {orm.__tablename__: res or 0}, write_seconds=time.perf_counter() - start
+        )
         return res
 
     def _get_orms(self, _orm: type[Base] | str, **params) -> list[tuple[Base]]:
@@ -609,7 +910,9 @@ class Feed:
     def get_orm_json(
         self, _orm: type[Base] | str, *include: str, geojson: bool = False, **params
     ) -> list[dict[str, t.Any]] | gj.FeatureCollection:
-        """Returns a dictionary of the ORM names and their corresponding JSON names.
+        """Returns a dictionary of the ORM names and their corresponding JSON names. \
+            realtime orms filtered by plain column values are read from \
+            `realtime_store` rather than the database.
 
         Args:
             _orm (str): ORM to return.
@@ -619,7 +922,9 @@ class Feed:
         Returns:
             list[dict[str]]: dictionary of the ORM names and their corresponding JSON names.
         """
-        data = self._get_orms(_orm, **params)
+        data = self._get_store_orms(_orm, *include, **params)
+        if data is None:
+            data = self._get_orms(_orm, **params)
         if geojson:
             if not data:
                 return gj.FeatureCollection([])
@@ -658,25 +963,8 @@ class Feed:
     def close(self) -> None:
         """Closes the connection to the database."""
         self.scoped_session.remove()
+        self.writer_session.remove()
         self.engine.dispose()
-
-    def backup_to_file(self, filename: PathLike = None) -> sa.engine.Engine:
-        """Backs up the in-memory database to a file-based database.
-
-        Args:
-            filename (PathLike, optional): pathlike
-
-        Returns:
-            sa.engine.Engine: engine connected to the file-based database.
-        """
-        filename = filename or f"{self.gtfs_name}_backup.db"
-        backup_engine = sa.create_engine(f"sqlite:///{filename}")
-        src_raw: sa.pool.base._ConnectionFairy = self.engine.raw_connection()
-        dst_raw: sa.pool.base._ConnectionFairy = backup_engine.raw_connection()
-        try:
-            src_raw.connection.backup(dst_raw.connection)
-        finally:
-            src_raw.close()
-            dst_raw.close()
-        logging.info("Backed up in-memory database to %s_backup.db", self.gtfs_name)
-        return backup_engine
+        self.reader_engine.dispose()
+        self.session.close()
+        self.fetcher.close()
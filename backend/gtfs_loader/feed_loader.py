@@ -2,15 +2,19 @@
 
 import logging
 import os
+import time
 import typing as t
+from datetime import datetime, timezone
 
 from apscheduler.job import Job
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
 from geojson import FeatureCollection
 
-from ..gtfs_orms import Alert, LinkedDataset, Prediction, Shape, Vehicle
+from ..gtfs_orms import Alert, Base, LinkedDataset, Prediction, Shape, Vehicle
 from ..helper_functions import PathLike, get_date, timeit
 from .feed import Feed
+from .poll_scheduler import PollScheduler
 from .query import Query
 
 # pylint: disable=line-too-long
@@ -27,6 +31,16 @@ class FeedLoader(Feed):
         kwargs: Keyword arguments to pass to `Feed`, such as `gtfs_name`
     """
 
+    # pylint: disable=too-many-instance-attributes
+
+    REALTIME_INTERVALS: dict[t.Type[Base], int] = {
+        Vehicle: 13,
+        Prediction: 37,
+        Alert: 60,
+    }
+    """seconds between imports of each realtime feed, until `PollScheduler` \
+        learns how often it's published"""
+
     @property
     def geojsons_exist(self) -> bool:
         """if *all* geojsons exist"""
@@ -78,28 +92,126 @@ class FeedLoader(Feed):
 
         self.vehicle_cache: dict[str, FeatureCollection] = {}
         """in-memory cache of vehicles"""
+        self.poll_scheduler = PollScheduler(
+            {
+                orm.__realtime_name__: seconds
+                for orm, seconds in self.REALTIME_INTERVALS.items()
+            }
+        )
+        """when each realtime feed is imported next"""
+
+        self.geojsons_stale: bool = True
+        """whether the database changed since the geojsons were last exported"""
 
     @timeit
-    def nightly_import(self, **kwargs) -> None:
-        """Runs the nightly import.
+    def nightly_import(self, force: bool = False, **kwargs) -> None:
+        """Runs the nightly import. \
+            only the tables whose files changed are reloaded, unless `force`, \
+            and the `ScheduleSnapshot` is rewritten for the new service day.
 
         Args:
-            kwargs: keyword arguments to pass to `import_gtfs`.
+            force (bool, optional): rebuild the whole database. Defaults to False.
+            kwargs: keyword arguments to pass to `import_gtfs`. \
+                `workers` defaults to one less than the cpu count, and \
+                files are parsed into typed arrow columns unless `arrow=False`.
         """
-        self.import_gtfs(chunksize=100000, dtype=object, **kwargs)
-        for orm in self.__class__.REALTIME_ORMS:
-            self.import_realtime(orm)
-        self.purge_and_filter(date=get_date())
+        kwargs.setdefault("workers", (os.cpu_count() or 1) - 1)
+        kwargs.setdefault("arrow", True)
+        loaded = self.import_gtfs(
+            chunksize=100000, incremental=not force, date=get_date(), **kwargs
+        )
+        self.import_realtime(*self.__class__.REALTIME_ORMS)
+        deleted = self.purge_and_filter(date=get_date())
+        self.geojsons_stale |= bool(loaded or deleted)
+        self.export_snapshot(get_date())
 
     @timeit
-    def geojson_exports(self) -> None:
-        """Exports geojsons all geojsons listed in `self.keys_dict`"""
+    def geojson_exports(self, force: bool = False) -> None:
+        """Exports geojsons all geojsons listed in `self.keys_dict`
+
+        Args:
+            force (bool, optional): export even if the database is unchanged. \
+                Defaults to False.
+        """
+        if not (force or self.geojsons_stale) and self.geojsons_exist:
+            logging.info("database unchanged, skipping geojson exports")
+            return
         for key, routes in self.keys_dict.items():
             self.export_geojsons(key, *routes, file_path=self.geojson_path)
+        self.geojsons_stale = False
+
+    def poll_realtime(self) -> None:
+        """imports the realtime feeds `poll_scheduler` has due, together, \
+            tells it which had a new version, and schedules itself for \
+            the next feed due. the vehicle cache is refreshed after new \
+            vehicles or predictions."""
+        now = time.time()
+        names = self.poll_scheduler.due(now)
+        due = [orm for orm in self.REALTIME_INTERVALS if orm.__realtime_name__ in names]
+        written: dict[t.Type[Base], int | None] = {}
+        try:
+            written = self.import_realtime(*due) if due else {}
+        except Exception as error:  # pylint: disable=broad-except
+            logging.error("Failed to poll %s: %s", due, error)
+        for orm in due:  # a new version without a header timestamp is dated now
+            published = (written[orm] or now) if orm in written else None
+            self.poll_scheduler.observe(orm.__realtime_name__, now, published)
+        self._schedule_poll()
+        if {Vehicle, Prediction} & written.keys():
+            self._update_vehicle_cache()
+
+    def _schedule_poll(self) -> None:
+        """schedules `poll_realtime` for when the next feed is due"""
+        run_date = max(self.poll_scheduler.next_run(), time.time())
+        self.scheduler.add_job(
+            self.poll_realtime,
+            "date",
+            run_date=datetime.fromtimestamp(run_date, tz=timezone.utc),
+            id="poll_realtime",
+            replace_existing=True,
+            misfire_grace_time=None,
+        )
+
+    def request_realtime(self, key: str, *names: str) -> None:
+        """records that `key` was requested with the realtime orms in `names`, \
+            and polls right away if that woke an idle feed.
+
+        Args:
+            key (str): route key, or what else was requested
+            *names (str): orms the response reads, e.g. `include`; \
+                anything that isn't realtime is ignored
+        """
+        feeds = {
+            orm.__realtime_name__
+            for name in names
+            if (orm := self.find_orm(name.strip().rstrip("s")))
+            in self.REALTIME_INTERVALS
+        }
+        if not self.poll_scheduler.request(key, *feeds):
+            return
+        try:  # only while it's waiting; a poll in progress reschedules itself
+            self.scheduler.modify_job(
+                "poll_realtime", next_run_time=datetime.now(timezone.utc)
+            )
+        except JobLookupError:
+            pass
+
+    def initial_import(self, force: bool = False, **kwargs) -> None:
+        """builds the database and then the geojsons.
+
+        Args:
+            force (bool, optional): rebuild both from scratch. Defaults to False.
+            kwargs: Keyword arguments to pass to `nightly import`.
+        """
+        self.nightly_import(force=force, **kwargs)
+        self.geojson_exports(force=force)
 
     def import_and_run(self, import_data: bool = False, **kwargs) -> t.NoReturn:
         """this is the main entrypoint for the application.
 
+        builds run in the scheduler, so the app answers (with an empty \
+            database on the first run) while they're in progress.
+
         Args:
             import_data (bool, optional): reloads the database and geojsons.\
                 Defaults to False.
@@ -107,10 +219,15 @@ class FeedLoader(Feed):
             kwargs: Keyword arguments to pass to `nightly import`.
         """
 
-        if import_data or not self.db_exists:
-            self.nightly_import(**kwargs)
-        if import_data or not self.geojsons_exist:
-            self.geojson_exports()
+        if not self.db_exists:
+            self.create_tables(self.engine)  # served until the build swaps in
+            import_data = True
+        if import_data:
+            self.scheduler.add_job(
+                self.initial_import, kwargs={"force": True, **kwargs}
+            )
+        elif not self.geojsons_exist:
+            self.scheduler.add_job(self.geojson_exports)
         self.run()
 
     def clear_caches(self) -> None:
@@ -141,6 +258,8 @@ class FeedLoader(Feed):
         """the same as the super method, `get_vehicles_feature`, but:
 
         - abstracts `Query` away
+        - records the request, so the vehicle and prediction feeds \
+            (and any realtime orm in `include`) are polled for `key`
         - and loads the result into the self.vehicle_cache
 
         Args:
@@ -152,6 +271,7 @@ class FeedLoader(Feed):
             FeatureCollection: vehicles as featurecollection
         """
 
+        self.request_realtime(key, Vehicle.__name__, Prediction.__name__, *include)
         if (cache_key := f"{key}-{','.join(include)}") not in self.vehicle_cache:
             res = self.get_vehicles_feature(
                 key, Query(*self.keys_dict[key]), *include, **kwargs
@@ -162,16 +282,43 @@ class FeedLoader(Feed):
                 self.vehicle_cache[cache_key] = res
         return self.vehicle_cache[cache_key]
 
+    def get_vehicle_history_cache(self, key: str, *args, **kwargs) -> FeatureCollection:
+        """the same as the super method, `get_vehicle_history`, but:
+
+        - abstracts `Query` away
+        - records the request, so the vehicle feed is polled for `key`
+
+        nothing is cached: the trails change with every vehicle import.
+
+        Args:
+            key (str): route key to use
+            *args: dumped to super class
+            **kwargs: dumped to super class
+
+        Returns:
+            FeatureCollection: vehicle trails as featurecollection
+        """
+
+        self.request_realtime(key, Vehicle.__name__)
+        return self.get_vehicle_history(
+            key, Query(*self.keys_dict[key]), *args, **kwargs
+        )
+
     @timeit
     def _update_vehicle_cache(self, **kwargs) -> dict[str, FeatureCollection]:
-        """updates cache and then returns the cache
+        """updates cache and then returns the cache. \
+            keys nobody requested lately are dropped rather than updated.
 
         Returns:
             dict[str, FeatureCollection]: the cache
         """
 
-        for cache_key in self.vehicle_cache:
+        keys = self.poll_scheduler.keys(Vehicle.__realtime_name__)
+        for cache_key in list(self.vehicle_cache):
             key, include = cache_key.split("-")
+            if key not in keys:
+                self.vehicle_cache.pop(cache_key)
+                continue
             self.vehicle_cache[cache_key] = self.get_vehicles_feature(
                 key, Query(*self.keys_dict[key]), *include.split(","), **kwargs
             )
@@ -196,17 +343,7 @@ class FeedLoader(Feed):
                 logging.warning("not adding jobs!")
                 return self
 
-        self.scheduler.add_job(
-            self.import_realtime, "interval", args=[Alert], minutes=1
-        )
-        self.scheduler.add_job(
-            self.import_realtime, "interval", args=[Vehicle], seconds=13
-        )
-        self.scheduler.add_job(
-            self.import_realtime, "interval", args=[Prediction], seconds=37
-        )
-
-        self.scheduler.add_job(self._update_vehicle_cache, "interval", seconds=10)
+        self._schedule_poll()  # reschedules itself; refreshes the vehicle cache
 
         self.scheduler.add_job(self.geojson_exports, "cron", hour=3, minute=45)
         self.scheduler.add_job(self.nightly_import, "cron", hour=3, minute=30)
@@ -0,0 +1,194 @@
+"""FeedManifest class."""
+
+import datetime as dt
+import json
+import logging
+import os
+import typing as t
+from zipfile import ZipFile
+
+import pandas as pd
+
+from ..helper_functions.types import PathLike
+
+
+class FeedManifest:
+    """What was loaded from the GTFS feed last time, \
+        stored as a json sidecar next to the database.
+
+    - `etag` and `last_modified` make the next download conditional
+    - `feed_version` is read from `feed_info.txt`
+    - `files` maps every archive member to its crc32 and size, \
+        read from the zip's central directory (no decompression)
+    - `valid_until` is the first date a service filtered out of \
+        the database comes back into the active window
+    - `sha256` is the hash of the archive, its key in the `ArchiveCache`
+
+    the other fields are set by `from_archive`, or `from_dict` for a saved one.
+
+    Args:
+        etag (str, optional): `ETag` of the last download
+        last_modified (str, optional): `Last-Modified` of the last download
+        sha256 (str, optional): hash of the downloaded archive
+    """
+
+    DATE_FORMAT = "%Y%m%d"
+
+    @classmethod
+    def load(cls, path: PathLike) -> t.Self:
+        """loads a manifest; empty if `path` is missing or unreadable.
+
+        Args:
+            path (PathLike): path to the json sidecar
+        Returns:
+            FeedManifest: the manifest
+        """
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return cls.from_dict(json.load(file))
+        except (OSError, ValueError, TypeError) as error:
+            logging.warning("ignoring unreadable manifest %s: %s", path, error)
+            return cls()
+
+    @classmethod
+    def from_dict(cls, data: dict[str, t.Any]) -> t.Self:
+        """builds a manifest from the fields of `as_dict`.
+
+        Args:
+            data (dict[str, Any]): fields; missing ones keep their defaults
+        Returns:
+            FeedManifest: the manifest
+        Raises:
+            TypeError: if `data` isn't a dict of manifest fields
+        """
+        manifest = cls()
+        if not isinstance(data, dict) or data.keys() - manifest.as_dict().keys():
+            raise TypeError(f"not a manifest: {data!r:.100}")
+        for field, value in data.items():
+            setattr(manifest, field, value)
+        manifest.files = manifest.files or {}
+        return manifest
+
+    @classmethod
+    def from_archive(cls, archive: ZipFile, **kwargs) -> t.Self:
+        """reads the feed version and member hashes of `archive`.
+
+        Args:
+            archive (ZipFile): the GTFS archive
+            **kwargs: the download's `etag`, `last_modified` and `sha256`
+        Returns:
+            FeedManifest: the manifest of `archive`
+        """
+        feed_version = None
+        if "feed_info.txt" in archive.namelist():
+            with archive.open("feed_info.txt") as member:
+                feed_info = pd.read_csv(member, dtype=object)
+            if "feed_version" in feed_info and not feed_info.empty:
+                feed_version = feed_info["feed_version"].iloc[0]
+        manifest = cls(**kwargs)
+        manifest.feed_version = feed_version
+        manifest.files = {
+            info.filename: f"{info.CRC:08x}-{info.file_size}"
+            for info in archive.infolist()
+        }
+        return manifest
+
+    def __init__(
+        self,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        sha256: str | None = None,
+    ) -> None:
+        """Initializes FeedManifest, of a download not loaded yet.
+
+        Args:
+            etag (str, optional): `ETag` of the last download
+            last_modified (str, optional): `Last-Modified` of the last download
+            sha256 (str, optional): hash of the downloaded archive
+        """
+        self.etag = etag
+        self.last_modified = last_modified
+        self.sha256 = sha256
+        self.feed_version: str | None = None
+        self.files: dict[str, str] = {}
+        self.valid_until: str | None = None
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}(feed_version={self.feed_version}, files={len(self.files)})>"  # pylint: disable=line-too-long
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __bool__(self) -> bool:
+        """whether the manifest describes a loaded feed"""
+        return bool(self.files)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        """conditional request headers from the stored validators"""
+        headers: dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def expired(self, date: dt.datetime) -> bool:
+        """whether services filtered out of the database are active on `date`.
+
+        Args:
+            date (datetime): date to check
+        Returns:
+            bool: whether the database needs the full calendar again
+        """
+        if not self.valid_until:
+            return False
+        return date.strftime(self.DATE_FORMAT) >= self.valid_until
+
+    def changed_files(self, other: "FeedManifest") -> set[str]:
+        """members whose content differs between `self` and `other`.
+
+        Args:
+            other (FeedManifest): the previous manifest
+        Returns:
+            set[str]: added, removed or modified member names
+        """
+        return {
+            name
+            for name in self.files.keys() | other.files.keys()
+            if self.files.get(name) != other.files.get(name)
+        }
+
+    def as_dict(self) -> dict[str, t.Any]:
+        """returns the manifest as a json serializable dict"""
+        return {
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "feed_version": self.feed_version,
+            "files": self.files,
+            "valid_until": self.valid_until,
+            "sha256": self.sha256,
+        }
+
+    def save(self, path: PathLike) -> None:
+        """writes the manifest atomically.
+
+        Args:
+            path (PathLike): path to the json sidecar
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.as_dict(), file, indent=2)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def remove(path: PathLike) -> None:
+        """removes the sidecar, forcing the next import to be a full one.
+
+        Args:
+            path (PathLike): path to the json sidecar
+        """
+        if os.path.exists(path):
+            os.remove(path)
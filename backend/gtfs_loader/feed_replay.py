@@ -0,0 +1,470 @@
+"""FeedReplay class."""
+
+# pylint: disable=no-name-in-module
+import bisect
+import hashlib
+import http.server
+import io
+import json
+import logging
+import os
+import threading
+import time
+import typing as t
+import urllib.parse
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import pandas as pd
+import requests as req
+from google.transit.gtfs_realtime_pb2 import FeedMessage
+
+from ..gtfs_orms import LinkedDataset
+from ..helper_functions.types import PathLike
+
+
+class FeedRecording:
+    """A GTFS feed and its realtime feeds, recorded to a directory.
+
+    - `recording.json` has the urls, when it started and how long it ran
+    - the static zip is saved as downloaded, under its url's path
+    - every realtime feed in its `linked_datasets.txt` is polled, and \
+        each payload that changed is saved as `frames/<feed>/<offset>.pb`, \
+        `offset` being seconds since the start
+
+    Args:
+        directory (PathLike): where the recording is
+        url (str, optional): url of the static zip. Defaults to "".
+        started (float, optional): epoch seconds it started at. Defaults to 0.
+        duration (float, optional): seconds it ran for. Defaults to 0.
+        feeds (dict[str, str], optional): url path -> url of each realtime feed
+    """
+
+    MANIFEST = "recording.json"
+
+    def __init__(
+        self,
+        directory: PathLike,
+        url: str = "",
+        started: float = 0,
+        duration: float = 0,
+        feeds: dict[str, str] | None = None,
+    ) -> None:
+        """Initializes FeedRecording.
+
+        Args:
+            directory (PathLike): where the recording is
+            url (str, optional): url of the static zip. Defaults to "".
+            started (float, optional): epoch seconds it started at. Defaults to 0.
+            duration (float, optional): seconds it ran for. Defaults to 0.
+            feeds (dict[str, str], optional): url path -> url of each realtime feed
+        """
+        self.directory = directory
+        self.url = url
+        self.started = started
+        self.duration = duration
+        self.feeds: dict[str, str] = feeds or {}
+        """url path -> url of each realtime feed"""
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.directory}, {self.duration:.0f}s)>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    @classmethod
+    def load(cls, directory: PathLike) -> t.Self:
+        """loads the recording in `directory`.
+
+        Args:
+            directory (PathLike): where the recording is
+        Returns:
+            FeedRecording: the recording
+        """
+        with open(os.path.join(directory, cls.MANIFEST), "r", -1, "utf-8") as file:
+            return cls(directory, **json.load(file))
+
+    def save(self) -> None:
+        """writes `recording.json`"""
+        with open(
+            os.path.join(self.directory, self.MANIFEST), "w", -1, "utf-8"
+        ) as file:
+            json.dump(
+                {
+                    "url": self.url,
+                    "started": self.started,
+                    "duration": self.duration,
+                    "feeds": self.feeds,
+                },
+                file,
+                indent=2,
+            )
+
+    @property
+    def static_path(self) -> str:
+        """url path of the static zip"""
+        return urllib.parse.urlsplit(self.url).path or "/"
+
+    def _file(self, path: str) -> str:
+        """file of a url path in the recording"""
+        return os.path.join(self.directory, *path.strip("/").split("/"))
+
+    def _frames_dir(self, path: str) -> str:
+        """directory of a realtime feed's frames"""
+        return os.path.join(self.directory, "frames", path.strip("/").replace("/", "_"))
+
+    def read_static(self) -> bytes:
+        """the static zip, as recorded"""
+        with open(self._file(self.static_path), "rb") as file:
+            return file.read()
+
+    def frames(self, path: str) -> list[float]:
+        """offsets of a realtime feed's frames, in order"""
+        if not os.path.isdir(directory := self._frames_dir(path)):
+            return []
+        return sorted(float(name[:-3]) for name in os.listdir(directory))
+
+    def read_frame(self, path: str, offset: float) -> bytes:
+        """the payload of a realtime feed at `offset`, as recorded"""
+        with open(
+            os.path.join(self._frames_dir(path), f"{offset:010.3f}.pb"), "rb"
+        ) as file:
+            return file.read()
+
+    def write_frame(self, path: str, offset: float, payload: bytes) -> None:
+        """saves a payload of a realtime feed at `offset`"""
+        os.makedirs(directory := self._frames_dir(path), exist_ok=True)
+        with open(os.path.join(directory, f"{offset:010.3f}.pb"), "wb") as file:
+            file.write(payload)
+
+    @staticmethod
+    def linked_urls(static: bytes) -> list[str]:
+        """urls of the realtime feeds in a static zip's `linked_datasets.txt`"""
+        with ZipFile(io.BytesIO(static)) as archive:
+            if LinkedDataset.__filename__ not in archive.namelist():
+                return []
+            with archive.open(LinkedDataset.__filename__) as member:
+                linked = pd.read_csv(member, dtype=str).fillna("0")
+        realtime = ["trip_updates", "vehicle_positions", "service_alerts"]
+        return linked.loc[(linked[realtime] != "0").any(axis=1), "url"].tolist()
+
+    @classmethod
+    def record(
+        cls,
+        url: str,
+        directory: PathLike,
+        duration: float = 600,
+        interval: float = 5,
+        session: req.Session | None = None,
+    ) -> t.Self:
+        """records the static zip at `url` and then its realtime feeds \
+            for `duration` seconds. it stops early on `KeyboardInterrupt`, \
+            keeping what was recorded.
+
+        Args:
+            url (str): url of the static zip, e.g. https://cdn.mbta.com/MBTA_GTFS.zip
+            directory (PathLike): where to save it
+            duration (float, optional): seconds to poll for. Defaults to 600.
+            interval (float, optional): seconds between polls. Defaults to 5.
+            session (req.Session, optional): session to request with. \
+                Defaults to a new one.
+        Returns:
+            FeedRecording: the recording
+        """
+        session = session or req.Session()
+        recording = cls(directory, url, time.time())
+        response = session.get(url, timeout=60)
+        response.raise_for_status()
+        os.makedirs(
+            os.path.dirname(static := recording._file(recording.static_path)),
+            exist_ok=True,
+        )
+        with open(static, "wb") as file:
+            file.write(response.content)
+        recording.feeds = {
+            urllib.parse.urlsplit(linked).path: linked
+            for linked in cls.linked_urls(response.content)
+        }
+        logging.info("recording %s: %s", url, ", ".join(recording.feeds.values()))
+        hashes: dict[str, str] = {}
+        try:
+            while (offset := time.time() - recording.started) < duration:
+                recording.poll(session, hashes, offset)
+                recording.duration = time.time() - recording.started
+                recording.save()
+                time.sleep(
+                    max(interval - (time.time() - recording.started - offset), 0)
+                )
+        except KeyboardInterrupt:
+            logging.info("recording of %s stopped", url)
+        recording.duration = time.time() - recording.started
+        recording.save()
+        return recording
+
+    def poll(self, session: req.Session, hashes: dict[str, str], offset: float) -> None:
+        """requests every realtime feed once, and saves those that changed \
+            as frames at `offset`. feeds that fail are logged and skipped.
+
+        Args:
+            session (req.Session): session to request with
+            hashes (dict[str, str]): sha256 of each feed's last frame, updated
+            offset (float): seconds since the recording started
+        """
+        for path, linked in self.feeds.items():
+            try:
+                response = session.get(linked, timeout=10)
+                response.raise_for_status()
+            except req.RequestException as error:
+                logging.error("failed to record %s: %s", linked, error)
+                continue
+            sha256 = hashlib.sha256(response.content).hexdigest()
+            if hashes.get(path) != sha256:
+                hashes[path] = sha256
+                self.write_frame(path, offset, response.content)
+
+
+class FeedReplay:
+    """Serves a `FeedRecording` over http, as a stand-in for the feed's servers.
+
+    - the static zip is served at its original path, with the urls in its \
+        `linked_datasets.txt` pointed at this server, so `Feed(url=...)` \
+        pointed at it loads its realtime feeds from it too
+    - each realtime feed serves the frame current at the replay's \
+        position: seconds since it started times `speed`, \
+        wrapping around at the recording's end if it `loop`s
+    - with `rebase`, every timestamp in a frame is shifted so its header \
+        is the time the frame came up, so replayed data is always fresh \
+        and later loops come after earlier ones
+    - responses have an `ETag` and answer `If-None-Match` with `304`, \
+        like the feed's servers; `/` is the replay's status as json
+
+    Args:
+        recording (FeedRecording): what to serve
+        speed (float, optional): replay speed. Defaults to 1, as recorded.
+        loop (bool, optional): start over at the end. Defaults to True.
+        rebase (bool, optional): shift timestamps to now. Defaults to True.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        recording: FeedRecording,
+        speed: float = 1,
+        loop: bool = True,
+        rebase: bool = True,
+    ) -> None:
+        """Initializes FeedReplay.
+
+        Args:
+            recording (FeedRecording): what to serve
+            speed (float, optional): replay speed. Defaults to 1, as recorded.
+            loop (bool, optional): start over at the end. Defaults to True.
+            rebase (bool, optional): shift timestamps to now. Defaults to True.
+        """
+        self.recording = recording
+        self.speed = speed
+        self.loop = loop
+        self.rebase = rebase
+        self.frames = {path: recording.frames(path) for path in recording.feeds}
+        """offsets of each realtime feed's frames"""
+        self.started = time.time()
+        """epoch seconds the replay started at"""
+        self._payloads: dict[tuple, tuple[bytes, str]] = {}
+        """payload and etag of the frame each feed served last, \
+            and of the static zip by host"""
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.recording}, {self.speed}x)>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def position(self, now: float | None = None) -> tuple[int, float]:
+        """the loop and the offset into the recording being replayed.
+
+        Args:
+            now (float, optional): epoch seconds. Defaults to now.
+        Returns:
+            tuple[int, float]: loop, offset in seconds
+        """
+        elapsed = ((time.time() if now is None else now) - self.started) * self.speed
+        duration = self.recording.duration
+        if not self.loop or duration <= 0:
+            return 0, min(elapsed, duration) if duration > 0 else elapsed
+        return int(elapsed // duration), elapsed % duration
+
+    @staticmethod
+    def shift(message: FeedMessage, seconds: int) -> None:
+        """adds `seconds` to every timestamp in a realtime feed"""
+
+        def _shift(obj: t.Any, field: str) -> None:
+            if obj.HasField(field):
+                setattr(obj, field, getattr(obj, field) + seconds)
+
+        _shift(message.header, "timestamp")
+        for entity in message.entity:
+            if entity.HasField("vehicle"):
+                _shift(entity.vehicle, "timestamp")
+            if entity.HasField("trip_update"):
+                _shift(entity.trip_update, "timestamp")
+                for update in entity.trip_update.stop_time_update:
+                    for event in ("arrival", "departure"):
+                        if update.HasField(event):
+                            _shift(getattr(update, event), "time")
+            if entity.HasField("alert"):
+                for period in entity.alert.active_period:
+                    _shift(period, "start")
+                    _shift(period, "end")
+
+    def frame(self, path: str, now: float | None = None) -> tuple[bytes, str] | None:
+        """the payload of a realtime feed at the replay's position, and its etag.
+
+        Args:
+            path (str): url path of the feed
+            now (float, optional): epoch seconds. Defaults to now.
+        Returns:
+            tuple[bytes, str] | None: payload and etag; `None` if the feed \
+                has no frames
+        """
+        if not (offsets := self.frames.get(path)):
+            return None
+        loop, offset = self.position(now)
+        index = max(bisect.bisect_right(offsets, offset) - 1, 0)
+        key = (path, loop, index)
+        with self._lock:
+            if (cached := self._payloads.get(key)) is not None:
+                return cached
+        payload = self.recording.read_frame(path, offsets[index])
+        if self.rebase:
+            message = FeedMessage()
+            message.ParseFromString(payload)
+            came_up = (
+                self.started
+                + (loop * self.recording.duration + offsets[index]) / self.speed
+            )
+            self.shift(message, round(came_up - message.header.timestamp))
+            payload = message.SerializeToString()
+        cached = (payload, f'"{hashlib.sha256(payload).hexdigest()}"')
+        with self._lock:
+            self._payloads = {k: v for k, v in self._payloads.items() if k[0] != path}
+            self._payloads[key] = cached
+        return cached
+
+    def static(self, host: str) -> tuple[bytes, str]:
+        """the static zip with its `linked_datasets.txt` urls on `host`, \
+            and its etag.
+
+        Args:
+            host (str): host[:port] the realtime feeds are served from
+        Returns:
+            tuple[bytes, str]: payload and etag
+        """
+        key = ("static", host)
+        with self._lock:
+            if (cached := self._payloads.get(key)) is not None:
+                return cached
+        source, buffer = ZipFile(io.BytesIO(self.recording.read_static())), io.BytesIO()
+        with source, ZipFile(buffer, "w", ZIP_DEFLATED) as archive:
+            for info in source.infolist():
+                data = source.read(info)
+                if info.filename == LinkedDataset.__filename__:
+                    linked = pd.read_csv(io.BytesIO(data), dtype=str)
+                    linked["url"] = [
+                        urllib.parse.urlsplit(url)
+                        ._replace(scheme="http", netloc=host)
+                        .geturl()
+                        for url in linked["url"]
+                    ]
+                    data = linked.to_csv(index=False).encode()
+                archive.writestr(info, data)
+        cached = (
+            payload := buffer.getvalue(),
+            f'"{hashlib.sha256(payload).hexdigest()}"',
+        )
+        with self._lock:
+            self._payloads[key] = cached
+        return cached
+
+    def status(self, now: float | None = None) -> dict[str, t.Any]:
+        """the replay's position and the frame each feed serves"""
+        loop, offset = self.position(now)
+        return {
+            "url": self.recording.url,
+            "speed": self.speed,
+            "loop": loop,
+            "offset": offset,
+            "duration": self.recording.duration,
+            "feeds": {
+                path: {
+                    "frames": len(offsets),
+                    "frame": max(bisect.bisect_right(offsets, offset) - 1, 0),
+                }
+                for path, offsets in self.frames.items()
+            },
+        }
+
+    def handler(self) -> type[http.server.BaseHTTPRequestHandler]:
+        """a request handler class serving this replay"""
+        replay = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """serves `replay`"""
+
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                """serves the static zip, a realtime feed or the status"""
+                path = urllib.parse.urlsplit(self.path).path
+                if path == "/":
+                    body = json.dumps(replay.status()).encode()
+                    return self._send(body, None, "application/json")
+                if path == replay.recording.static_path:
+                    host = self.headers.get("Host") or ":".join(
+                        map(str, self.server.server_address[:2])
+                    )
+                    return self._send(*replay.static(host), "application/zip")
+                if (frame := replay.frame(path)) is not None:
+                    return self._send(*frame, "application/x-protobuf")
+                return self.send_error(404)
+
+            def _send(self, body: bytes, etag: str | None, content_type: str) -> None:
+                """sends `body`, or `304` if the client has its etag"""
+                if etag and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if etag:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(
+                self, format: str, *args: t.Any
+            ) -> None:  # pylint: disable=redefined-builtin
+                logging.debug("%s: " + format, self.address_string(), *args)
+
+        return Handler
+
+    def serve(
+        self, host: str = "127.0.0.1", port: int = 8765
+    ) -> http.server.ThreadingHTTPServer:
+        """starts serving the replay on a background thread.
+
+        Args:
+            host (str, optional): address to listen on. Defaults to 127.0.0.1.
+            port (int, optional): port to listen on, 0 for any. Defaults to 8765.
+        Returns:
+            ThreadingHTTPServer: the server; `shutdown` stops it
+        """
+        server = http.server.ThreadingHTTPServer((host, port), self.handler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info(
+            "replaying %s at http://%s:%s%s",
+            self.recording,
+            *server.server_address[:2],
+            self.recording.static_path,
+        )
+        return server
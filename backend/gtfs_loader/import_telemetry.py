@@ -0,0 +1,377 @@
+"""ImportTelemetry class."""
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import typing as t
+
+import sqlalchemy as sa
+
+from ..helper_functions import get_current_time
+from ..helper_functions.types import PathLike
+from .connection_profile import REALTIME_WRITER
+
+METADATA = sa.MetaData()
+
+IMPORT_RUN = sa.Table(
+    "import_run",
+    METADATA,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("feed", sa.String, nullable=False),
+    sa.Column("stage", sa.String, nullable=False, index=True),
+    sa.Column("started_at", sa.String, nullable=False),
+    sa.Column("seconds", sa.Float, nullable=False),
+    sa.Column("parse_seconds", sa.Float, nullable=False),
+    sa.Column("write_seconds", sa.Float, nullable=False),
+    sa.Column("rows", sa.String, nullable=False),
+    sa.Column("rows_per_second", sa.Float, nullable=False),
+    sa.Column("runs", sa.Integer),
+    sa.Column("peak_rss", sa.Integer),
+    sa.Column("children_peak_rss", sa.Integer),
+    sa.Column("db_size", sa.Integer),
+    sa.Column("wal_size", sa.Integer),
+    sa.Column("error", sa.String),
+)
+"""one row per recorded run; kept out of `Base.metadata` so rebuilds don't drop it"""
+
+
+def rss() -> int | None:
+    """resident set size of this process, in bytes.
+
+    read from `/proc/self/status` on linux; elsewhere it's the lifetime peak. \
+        the process wide peak (`VmHWM`) isn't used, nor reset: stages run \
+        on several threads at once, so runs sample this instead.
+
+    Returns:
+        int | None: bytes, or `None` if it can't be read
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+def children_peak_rss() -> int | None:
+    """peak resident set size of the largest child process waited for, \
+        e.g. `ChunkReader`'s parse workers, in bytes.
+
+    it can't be reset, so it's the peak of every child so far, \
+        not only of the current run's.
+
+    Returns:
+        int | None: bytes, or `None` if it can't be read
+    """
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+
+        return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+def file_size(path: PathLike | None) -> int | None:
+    """size of `path` in bytes; `None` if it doesn't exist"""
+    if path and os.path.exists(path):
+        return os.path.getsize(path)
+    return None
+
+
+class ImportRun:
+    """Telemetry of one run of an import stage.
+
+    Args:
+        feed (str): name of the feed
+        stage (str): name of the stage, e.g. `import_gtfs`
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, feed: str, stage: str) -> None:
+        """Initializes ImportRun.
+
+        Args:
+            feed (str): name of the feed
+            stage (str): name of the stage, e.g. `import_gtfs`
+        """
+        self.feed = feed
+        self.stage = stage
+        self.started_at = get_current_time().isoformat(timespec="seconds")
+        self.rows: collections.Counter[str] = collections.Counter()
+        """rows loaded, deleted or exported per table"""
+        self.seconds = 0.0
+        self.parse_seconds = 0.0
+        self.write_seconds = 0.0
+        self.runs = 1
+        """runs of the stage merged into this one, see `ImportTelemetry.aggregate`"""
+        self.opened = time.monotonic()
+        self.peak_rss: int | None = None
+        """largest rss sampled during the run, see `sample`"""
+        self.children_peak_rss: int | None = None
+        self.db_size: int | None = None
+        self.wal_size: int | None = None
+        self.error: str | None = None
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.feed}.{self.stage}, {self.started_at})>"  # pylint: disable=line-too-long
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    @property
+    def rows_per_second(self) -> float:
+        """rows over the wall time of the run"""
+        return sum(self.rows.values()) / self.seconds if self.seconds else 0.0
+
+    def sample(self) -> None:
+        """samples the rss into `peak_rss`"""
+        if (current := rss()) is not None:
+            self.peak_rss = max(self.peak_rss or 0, current)
+
+    def merge(self, other: "ImportRun") -> None:
+        """adds a later run of the same stage to this one.
+
+        Args:
+            other (ImportRun): the later run
+        """
+        self.runs += other.runs
+        self.rows.update(other.rows)
+        self.seconds += other.seconds
+        self.parse_seconds += other.parse_seconds
+        self.write_seconds += other.write_seconds
+        self.peak_rss = max(self.peak_rss or 0, other.peak_rss or 0) or None
+        self.children_peak_rss = other.children_peak_rss
+        self.db_size, self.wal_size = other.db_size, other.wal_size
+        self.error = other.error or self.error
+
+    def as_dict(self) -> dict[str, t.Any]:
+        """returns the run as a json serializable dict"""
+        return {
+            "feed": self.feed,
+            "stage": self.stage,
+            "started_at": self.started_at,
+            "seconds": self.seconds,
+            "parse_seconds": self.parse_seconds,
+            "write_seconds": self.write_seconds,
+            "rows": dict(self.rows),
+            "rows_per_second": self.rows_per_second,
+            "runs": self.runs,
+            "peak_rss": self.peak_rss,
+            "children_peak_rss": self.children_peak_rss,
+            "db_size": self.db_size,
+            "wal_size": self.wal_size,
+            "error": self.error,
+        }
+
+
+class ImportTelemetry:
+    """Records import runs in a small sqlite history database.
+
+    stages run inside `record`, and whatever they call reports to the \
+        innermost run on its thread through `add`, so the loaders don't \
+        need to know whether they're being recorded.
+
+    stages in `aggregate`, like the realtime imports every few seconds, \
+        are merged into one row per window rather than one per run.
+
+    Args:
+        path (PathLike): history database
+        feed (str): name of the feed
+        keep (int, optional): runs kept per stage. Defaults to 1000.
+        aggregate (dict[str, float], optional): seconds per row, by stage.
+    """
+
+    def __init__(
+        self,
+        path: PathLike,
+        feed: str,
+        keep: int = 1000,
+        aggregate: dict[str, float] | None = None,
+    ) -> None:
+        """Initializes ImportTelemetry.
+
+        Args:
+            path (PathLike): history database
+            feed (str): name of the feed
+            keep (int, optional): runs kept per stage. Defaults to 1000.
+            aggregate (dict[str, float], optional): seconds per row, by stage.
+        """
+        self.feed = feed
+        self.keep = keep
+        self.aggregate = aggregate or {}
+        self.engine = REALTIME_WRITER.create_engine(path)
+        METADATA.create_all(self.engine)
+        self._add_columns()
+        self._local = threading.local()
+        self._pending: dict[str, ImportRun] = {}
+        """runs of the `aggregate` stages merged since their last row"""
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.engine.url.database})>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def _add_columns(self) -> None:
+        """adds the columns a history database from an older version lacks"""
+        with self.engine.begin() as conn:
+            have = {col["name"] for col in sa.inspect(conn).get_columns("import_run")}
+            for col in IMPORT_RUN.columns:
+                if col.name not in have:
+                    conn.execute(
+                        sa.text(
+                            f"ALTER TABLE import_run ADD COLUMN {col.name} "
+                            f"{col.type.compile(conn.dialect)}"
+                        )
+                    )
+
+    @property
+    def _runs(self) -> list[ImportRun]:
+        """runs in progress on this thread, innermost last"""
+        if not hasattr(self._local, "runs"):
+            self._local.runs = []
+        return self._local.runs
+
+    @property
+    def current(self) -> ImportRun | None:
+        """the innermost run in progress on this thread"""
+        return self._runs[-1] if self._runs else None
+
+    def add(
+        self,
+        rows: t.Mapping[str, int] | None = None,
+        parse_seconds: float = 0.0,
+        write_seconds: float = 0.0,
+    ) -> None:
+        """adds to the current run, and samples its rss; \
+            does nothing outside of `record`.
+
+        Args:
+            rows (Mapping[str, int], optional): rows per table
+            parse_seconds (float, optional): time spent parsing
+            write_seconds (float, optional): time spent writing
+        """
+        if (run := self.current) is None:
+            return
+        run.rows.update(rows or {})
+        run.parse_seconds += parse_seconds
+        run.write_seconds += write_seconds
+        run.sample()
+
+    @contextlib.contextmanager
+    def record(
+        self, stage: str, database: t.Callable[[], str | None] = lambda: None
+    ) -> t.Generator[ImportRun, None, None]:
+        """records a run of `stage`, failed or not; \
+            runs of `aggregate` stages are merged first.
+
+        Args:
+            stage (str): name of the stage
+            database (Callable[[], str | None], optional): returns the database \
+                path once the run is over, to measure its file and wal size.
+        Yields:
+            ImportRun: the run
+        """
+        run = ImportRun(self.feed, stage)
+        self._runs.append(run)
+        run.sample()
+        start = time.perf_counter()
+        try:
+            yield run
+        except Exception as error:
+            run.error = repr(error)
+            raise
+        finally:
+            self._runs.remove(run)
+            run.seconds = time.perf_counter() - start
+            run.sample()
+            run.children_peak_rss = children_peak_rss()
+            path = database()
+            run.db_size, run.wal_size = file_size(path), file_size(f"{path}-wal")
+            if stage in self.aggregate:
+                self._merge(run)
+            else:
+                self.save(run)
+
+    def _merge(self, run: ImportRun) -> None:
+        """merges `run` into its stage's pending run, \
+            which is saved once its window is over.
+
+        Args:
+            run (ImportRun): the finished run
+        """
+        with self._lock:
+            if (pending := self._pending.get(run.stage)) is None:
+                pending = self._pending[run.stage] = run
+            else:
+                pending.merge(run)
+            if time.monotonic() - pending.opened < self.aggregate[run.stage]:
+                return
+            del self._pending[run.stage]
+        self.save(pending)
+
+    def save(self, run: ImportRun) -> None:
+        """stores `run`, keeping the last `keep` runs of its stage. \
+            failures are logged, never raised.
+
+        Args:
+            run (ImportRun): the finished run
+        """
+        values = run.as_dict() | {"rows": json.dumps(dict(run.rows))}
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(IMPORT_RUN.insert().values(**values))
+                conn.execute(
+                    IMPORT_RUN.delete().where(
+                        IMPORT_RUN.c.feed == run.feed,
+                        IMPORT_RUN.c.stage == run.stage,
+                        IMPORT_RUN.c.id
+                        <= sa.select(IMPORT_RUN.c.id)
+                        .where(
+                            IMPORT_RUN.c.feed == run.feed,
+                            IMPORT_RUN.c.stage == run.stage,
+                        )
+                        .order_by(IMPORT_RUN.c.id.desc())
+                        .offset(self.keep)
+                        .limit(1)
+                        .scalar_subquery(),
+                    )
+                )
+        except sa.exc.SQLAlchemyError as error:
+            logging.warning("failed to record %s: %s", run, error)
+
+    def history(self, stage: str | None = None, limit: int = 50) -> list[dict]:
+        """the latest runs, newest first.
+
+        Args:
+            stage (str, optional): only runs of this stage. Defaults to all.
+            limit (int, optional): number of runs. Defaults to 50.
+        Returns:
+            list[dict]: runs as dicts, like `ImportRun.as_dict`
+        """
+        stmt = (
+            sa.select(IMPORT_RUN)
+            .where(IMPORT_RUN.c.feed == self.feed)
+            .order_by(IMPORT_RUN.c.id.desc())
+            .limit(limit)
+        )
+        if stage:
+            stmt = stmt.where(IMPORT_RUN.c.stage == stage)
+        with self.engine.connect() as conn:
+            return [
+                dict(row) | {"rows": json.loads(row["rows"])}
+                for row in conn.execute(stmt).mappings()
+            ]
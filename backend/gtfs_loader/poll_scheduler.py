@@ -0,0 +1,222 @@
+"""PollScheduler class."""
+
+import collections
+import statistics
+import threading
+import time
+import typing as t
+
+
+class PollScheduler:
+    """Decides when each realtime feed is fetched next.
+
+    - the publish cadence of a feed is learned from the header timestamps \
+        of the versions fetched, and the next fetch is aligned just after \
+        the next expected version, at the multiple of the cadence nearest \
+        the fallback interval, so fetches stay within the same budget
+    - how late a version becomes available after its header timestamp \
+        is learned from the fetches that were too early: the version came \
+        out between the one that missed it and the retry that found it
+    - a feed nobody asked for lately is fetched every `IDLE_SECONDS`, \
+        and woken as soon as a route key that depends on it is requested
+
+    times are unix seconds, like the header timestamps.
+
+    Args:
+        intervals (dict[str, float]): fallback seconds between fetches per \
+            feed, until its cadence is known
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    SAMPLES = 16
+    """versions kept per feed to learn its cadence"""
+    MIN_SAMPLES = 3
+    """versions needed before the cadence is trusted"""
+    MARGIN_SECONDS = 1.0
+    """fetched this long after a version is expected to be available"""
+    MIN_SECONDS = 2.0
+    """never fetched closer together than this; a fetch that found nothing \
+        new is retried after it, doubled for every miss in a row, up to the period"""
+    IDLE_AFTER_SECONDS = 600.0
+    """a feed is idle when none of its route keys were requested for this long"""
+    IDLE_SECONDS = 300.0
+    """seconds between fetches of an idle feed"""
+
+    def __init__(self, intervals: dict[str, float]) -> None:
+        """Initializes PollScheduler.
+
+        Args:
+            intervals (dict[str, float]): fallback seconds between fetches \
+                per feed, until its cadence is known
+        """
+        self.intervals = intervals
+        self._published: dict[str, collections.deque[float]] = {
+            feed: collections.deque(maxlen=self.SAMPLES) for feed in intervals
+        }
+        """header timestamps of the versions fetched"""
+        self._delays: dict[str, collections.deque[float]] = {
+            feed: collections.deque(maxlen=self.SAMPLES) for feed in intervals
+        }
+        """seconds from a version's header timestamp until it could be fetched"""
+        self._due: dict[str, float] = dict.fromkeys(intervals, 0.0)
+        self._misses: collections.Counter[str] = collections.Counter()
+        """fetches in a row that found nothing new"""
+        self._missed_at: dict[str, float] = {}
+        """when the last of them started"""
+        self._aimed: dict[str, float] = {}
+        """header timestamp of the version the next fetch is aligned on"""
+        self._demand: dict[str, dict[str, float]] = {feed: {} for feed in intervals}
+        """last request per route key, by feed"""
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({', '.join(self.intervals)})>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def cadence(self, feed: str) -> float | None:
+        """seconds between versions of `feed`: the smallest gap between \
+            the header timestamps fetched, `None` until there are enough. \
+            fetched less often than it's published, every gap is a multiple \
+            of the cadence, so the smallest is the closest to it."""
+        published = self._published[feed]
+        if len(published) < self.MIN_SAMPLES:
+            return None
+        gaps = [b - a for a, b in zip(published, list(published)[1:])]
+        return max(min(gaps), self.MIN_SECONDS)
+
+    def period(self, feed: str) -> float:
+        """seconds between fetches of `feed` while it's in demand: \
+            the multiple of its cadence nearest its interval"""
+        if (cadence := self.cadence(feed)) is None:
+            return self.intervals[feed]
+        return cadence * max(round(self.intervals[feed] / cadence), 1)
+
+    def idle(self, feed: str, now: float | None = None) -> bool:
+        """whether no route key depending on `feed` was requested lately"""
+        now = time.time() if now is None else now
+        return all(
+            now - requested > self.IDLE_AFTER_SECONDS
+            for requested in self._demand[feed].values()
+        )
+
+    def keys(self, feed: str, now: float | None = None) -> set[str]:
+        """route keys depending on `feed` that were requested lately"""
+        now = time.time() if now is None else now
+        return {
+            key
+            for key, requested in self._demand[feed].items()
+            if now - requested <= self.IDLE_AFTER_SECONDS
+        }
+
+    def request(self, key: str, *feeds: str, now: float | None = None) -> bool:
+        """records that `key` was requested, with data from `feeds`.
+
+        Args:
+            key (str): route key, or any name for what was requested
+            *feeds (str): feeds the response depends on
+            now (float, optional): time of the request. Defaults to now.
+        Returns:
+            bool: whether an idle feed was woken, i.e. is due now
+        """
+        now = time.time() if now is None else now
+        woken = False
+        with self._lock:
+            for feed in feeds:
+                if feed not in self._demand:
+                    continue
+                if self.idle(feed, now):
+                    self._due[feed] = min(self._due[feed], now)
+                    woken = True
+                self._demand[feed][key] = now
+        return woken
+
+    def observe(
+        self, feed: str, fetched_at: float, published: float | None = None
+    ) -> float:
+        """records a fetch of `feed` and schedules its next one.
+
+        Args:
+            feed (str): the feed
+            fetched_at (float): when the fetch started
+            published (float, optional): header timestamp of the version \
+                fetched if it's new, `None` if nothing new was found
+        Returns:
+            float: when `feed` is due next
+        """
+        with self._lock:
+            last = self._published[feed]
+            if published is not None and (not last or published > last[-1]):
+                last.append(published)
+            found = self._found(feed, fetched_at, published)
+            if found:
+                self._misses[feed] = 0
+            else:
+                self._misses[feed] += 1
+                self._missed_at[feed] = fetched_at
+            self._due[feed] = self._next(feed, fetched_at, found)
+            return self._due[feed]
+
+    def _found(self, feed: str, fetched_at: float, published: float | None) -> bool:
+        """whether a fetch found the version it was aligned on, or anything \
+            new if it wasn't; learns the delay from a retry that found it"""
+        if (aimed := self._aimed.get(feed)) is None:
+            return published is not None
+        jitter = min(self.cadence(feed) / 2, self.MIN_SECONDS)
+        if published is None or published < aimed - jitter:
+            return False  # too early, maybe for an older version than aimed
+        if self._misses[feed]:  # out between the fetch that missed it and this one
+            out = max(self._missed_at[feed], published)
+            self._delays[feed].append((out + fetched_at) / 2 - published)
+        return True
+
+    def delay(self, feed: str) -> float:
+        """seconds from a version's header timestamp until it can be fetched: \
+            the median of the ones learned, 0 until a fetch is early"""
+        return statistics.median(self._delays[feed]) if self._delays[feed] else 0.0
+
+    def _next(self, feed: str, now: float, found: bool) -> float:
+        """when `feed` is due after a fetch at `now`"""
+        if self.idle(feed, now) or (cadence := self.cadence(feed)) is None:
+            self._aimed.pop(feed, None)
+            return now + (
+                self.IDLE_SECONDS if self.idle(feed, now) else self.intervals[feed]
+            )
+        period = self.period(feed)
+        if not found and feed in self._aimed:  # early, or the feed stalled
+            retry = self.MIN_SECONDS * 2 ** (self._misses[feed] - 1)
+            return now + min(retry, period)
+        self._aimed[feed] = self._published[feed][-1] + period
+        delay = min(self.delay(feed), cadence)
+        return max(
+            self._aimed[feed] + delay + self.MARGIN_SECONDS, now + self.MIN_SECONDS
+        )
+
+    def due(self, now: float | None = None) -> list[str]:
+        """feeds due to be fetched at `now`"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return [feed for feed, due in self._due.items() if due <= now]
+
+    def next_run(self) -> float:
+        """when the next feed is due"""
+        with self._lock:
+            return min(self._due.values())
+
+    def as_dict(self, now: float | None = None) -> dict[str, dict[str, t.Any]]:
+        """returns the schedule of every feed as a json serializable dict"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return {
+                feed: {
+                    "cadence": self.cadence(feed),
+                    "period": self.period(feed),
+                    "delay": self.delay(feed),
+                    "idle": self.idle(feed, now),
+                    "keys": sorted(self.keys(feed, now)),
+                    "due_in": self._due[feed] - now,
+                }
+                for feed in self.intervals
+            }
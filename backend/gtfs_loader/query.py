@@ -176,6 +176,53 @@ class Query:
             )
         )
 
+    @staticmethod
+    def get_next_service_dates_query(
+        date: dt.datetime, days_ahead: int = 7
+    ) -> Select[tuple[dt.datetime | None, dt.datetime | None]]:
+        """
+        Returns a query for when calendars that are inactive on `date` \
+            would next be kept by `delete_calendars_query`.
+
+        Args:
+            date (datetime): date to query
+            days_ahead (int, optional): number of days ahead to query. Defaults to 7.
+        Returns:
+            Select[tuple[datetime | None, datetime | None]]: the earliest \
+                future `start_date` and the earliest future added `CalendarDate`.
+        """
+
+        active = select(
+            __class__.get_active_calendars_query(
+                date, days_ahead=days_ahead
+            ).columns.service_id
+        )
+        return select(
+            select(func.min(Calendar.start_date))
+            .join(
+                CalendarAttribute, Calendar.service_id == CalendarAttribute.service_id
+            )
+            .where(
+                Calendar.service_id.notin_(active),
+                CalendarAttribute.service_schedule_typicality != "6",
+                Calendar.start_date
+                > (date + dt.timedelta(days=days_ahead)).strftime("%Y%m%d"),
+            )
+            .scalar_subquery(),
+            select(func.min(CalendarDate.date))
+            .join(
+                CalendarAttribute,
+                CalendarDate.service_id == CalendarAttribute.service_id,
+            )
+            .where(
+                CalendarDate.service_id.notin_(active),
+                CalendarAttribute.service_schedule_typicality != "6",
+                CalendarDate.exception_type == "1",
+                CalendarDate.date > date.strftime("%Y%m%d"),
+            )
+            .scalar_subquery(),
+        )
+
     @staticmethod
     def delete_facilities_query(*exclude: str) -> Delete:
         """Returns a query to delete facilities.
@@ -0,0 +1,175 @@
+"""RealtimeDiff class."""
+
+import sqlite3
+import typing as t
+
+import pandas as pd
+
+from ..gtfs_orms import Base
+from .bulk_loader import BulkLoader
+
+
+def _changed(old: pd.Series, new: pd.Series) -> pd.Series:
+    """where `old` and `new` differ, with nulls equal to each other"""
+    same = (old == new).fillna(False).astype(bool) | (old.isna() & new.isna())
+    return ~same
+
+
+class RealtimeDiff:
+    """Changes from one snapshot of a realtime table to the next.
+
+    rows are matched on the orm's `__natural_key__`, so a vehicle or \
+        prediction that's still in the feed is updated in place, and only \
+        if a column outside `__volatile__` changed. a surrogate primary key \
+        (`Prediction.index`) is carried over from the previous snapshot \
+        and assigned past its largest value for new rows.
+
+    without a previous snapshot the table is rewritten.
+
+    Args:
+        orm (type[Base]): realtime table
+        current (pd.DataFrame): the new feed, decoded
+        previous (pd.DataFrame, optional): `snapshot` of the last diff \
+            applied to the same database. Defaults to a full rewrite.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        orm: t.Type[Base],
+        current: pd.DataFrame,
+        previous: pd.DataFrame | None = None,
+    ) -> None:
+        """Initializes RealtimeDiff.
+
+        Args:
+            orm (type[Base]): realtime table
+            current (pd.DataFrame): the new feed, decoded
+            previous (pd.DataFrame, optional): `snapshot` of the last diff \
+                applied to the same database. Defaults to a full rewrite.
+        """
+        self.orm = orm
+        self.keys = list(orm.__natural_key__ or orm.primary_keys)
+        self.columns = [c for c in orm.cols if c in current.columns]
+        self.surrogate = [k for k in orm.primary_keys if k not in self.columns]
+        """primary keys assigned here rather than read from the feed"""
+        self.full = previous is None
+        """whether the table is rewritten"""
+        current = current.drop_duplicates(self.keys, keep="last")[self.columns]
+        if self.full:
+            self.snapshot = self._numbered(current, 0)
+            self.inserts, self.updates = self.snapshot, self.snapshot.iloc[:0]
+            self.deletes = self.snapshot.iloc[:0]
+            self.changed = pd.DataFrame(index=self.updates.index)
+            self.unchanged = 0
+            return
+        old, new = previous.reset_index(drop=True), current.reset_index(drop=True)
+        # match keys to row positions only: merging the values themselves
+        # would upcast int columns to float wherever one side is missing
+        merged = pd.merge(
+            old[self.keys].assign(_old=old.index),
+            new[self.keys].assign(_new=new.index),
+            on=self.keys,
+            how="outer",
+            indicator=True,
+        )
+        which = merged.pop("_merge")
+        positions = merged[["_old", "_new"]].fillna(-1).astype(int)  # float after
+        self.deletes = old.loc[
+            positions.loc[which == "left_only", "_old"], orm.primary_keys
+        ]
+        both = positions[which == "both"]
+        kept = old.loc[both["_old"]].reset_index(drop=True)
+        updated = new.loc[both["_new"]].reset_index(drop=True)
+        compared = [
+            c for c in self.columns if c not in self.keys and c not in orm.__volatile__
+        ]
+        flags = pd.DataFrame(
+            {c: _changed(kept[c], updated[c]) for c in compared}, index=kept.index
+        )
+        changed = flags.any(axis=1)
+        updated[self.surrogate] = kept[self.surrogate]
+        self.updates = updated[changed]
+        self.changed = flags[changed]
+        """which compared columns changed, per row of `updates`"""
+        self.unchanged = int((~changed).sum())
+        self.inserts = self._numbered(
+            new.loc[positions.loc[which == "right_only", "_new"]],
+            (
+                int(old[self.surrogate].max().max()) + 1
+                if self.surrogate and len(old)
+                else 0
+            ),
+        )
+        self.snapshot = pd.concat(
+            [kept[~changed], self.updates, self.inserts], ignore_index=True
+        )[self.columns + self.surrogate]
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.orm.__tablename__}, {self.counts})>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def _numbered(self, frame: pd.DataFrame, start: int) -> pd.DataFrame:
+        """`frame` with its surrogate keys numbered from `start`"""
+        frame = frame.reset_index(drop=True)
+        for key in self.surrogate:
+            frame[key] = range(start, start + len(frame))
+        return frame
+
+    @property
+    def counts(self) -> dict[str, int]:
+        """rows inserted, updated, deleted and left unchanged"""
+        return {
+            "inserted": len(self.inserts),
+            "updated": len(self.updates),
+            "deleted": len(self.deletes),
+            "unchanged": self.unchanged,
+        }
+
+    def apply(self, cursor: sqlite3.Cursor) -> dict[str, int]:
+        """writes the changes; the caller owns the transaction.
+
+        Args:
+            cursor (sqlite3.Cursor): cursor on the writer connection
+        Returns:
+            dict[str, int]: `counts`, with the rows a rewrite deleted
+        """
+        table, pkeys = self.orm.__tablename__, self.orm.primary_keys
+        where = " AND ".join(f'"{k}" = ?' for k in pkeys)  # `index` is a keyword
+        counts = self.counts
+        if self.full:
+            cursor.execute(f"DELETE FROM {table}")
+            counts["deleted"] = max(cursor.rowcount, 0)
+        elif len(self.deletes):
+            cursor.executemany(
+                f"DELETE FROM {table} WHERE {where}", BulkLoader.rows(self.deletes)
+            )
+        # sqlite rewrites every index on a column in the SET list, changed or not,
+        # so each group of rows is updated with only the columns it changed
+        volatile = [c for c in self.orm.__volatile__ if c in self.columns]
+        groups = (
+            self.changed.groupby(list(self.changed.columns)).groups
+            if len(self.changed)
+            else {}
+        )
+        for changed, rows in groups.items():
+            changed = changed if isinstance(changed, tuple) else (changed,)
+            values = [c for c, flag in zip(self.changed.columns, changed) if flag]
+            values += volatile
+            assignments = ", ".join(f'"{c}" = ?' for c in values)
+            cursor.executemany(
+                f"UPDATE {table} SET {assignments} WHERE {where}",
+                BulkLoader.rows(self.updates.loc[rows, values + pkeys]),
+            )
+        if len(self.inserts):
+            columns = self.columns + self.surrogate
+            names = ", ".join(f'"{c}"' for c in columns)
+            cursor.executemany(
+                f"INSERT INTO {table} ({names}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                BulkLoader.rows(self.inserts[columns]),
+            )
+        return counts
@@ -0,0 +1,485 @@
+"""RealtimeEnrichment class."""
+
+import typing as t
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+from geographiclib.geodesic import Geodesic
+
+from ..gtfs_orms import Base, Prediction, Vehicle
+from ..helper_functions import get_date
+from .realtime_store import RealtimeStore
+from .schedule_snapshot import ScheduleSnapshot, times_to_seconds
+
+
+def lookup(table: pd.DataFrame, keys: pd.Series | pd.DataFrame) -> pd.DataFrame:
+    """rows of `table` by its (unique) index for each of `keys`, aligned \
+        with them, with a `found` column for whether there was one.
+
+    Args:
+        table (pd.DataFrame): rows indexed by id, or by several ids
+        keys (pd.Series | pd.DataFrame): ids, a column per level of the index
+    Returns:
+        pd.DataFrame: rows, with the index of `keys`; missing ones are null
+    """
+    if isinstance(keys, pd.DataFrame):
+        index = pd.MultiIndex.from_frame(keys)
+    else:
+        index = pd.Index(keys)
+    rows = table.reindex(index)
+    rows.index = keys.index
+    return rows.assign(found=index.isin(table.index))
+
+
+def truthy(values: pd.Series) -> pd.Series:
+    """whether each value is truthy, like `bool(value)` on a string or number"""
+    return values.notna() & (values != "") & (values != 0)
+
+
+class BearingKey(t.NamedTuple):
+    """what an interpolated bearing depends on"""
+
+    shape_id: str | None
+    dest_lon: float
+    dest_lat: float
+    lon: float
+    lat: float
+
+
+class RealtimeEnrichment:
+    """Derives the fields `Vehicle` and `Prediction` compute from the schedule \
+        and from each other, once per realtime snapshot instead of per row \
+        on every read.
+
+    - the schedule columns used are read once per schedule database, \
+        stop times only for the trips in the snapshots
+    - the results go into `RealtimeStore` as extra columns; instances \
+        it serves get them instead of running their reconstructor and \
+        `json_fields`, which stay the per row fallback
+    - the values are the same as per row: `Vehicle.__enriched__` and \
+        `Vehicle.json_fields`, `Prediction.__enriched__` and \
+        `Prediction.json_fields`
+    - prediction delays are also published as `RealtimeStore.delays`, \
+        for predictions loaded from the database
+    """
+
+    DEPENDS: dict[t.Type[Base], tuple[t.Type[Base], ...]] = {
+        Vehicle: (Vehicle, Prediction),
+        Prediction: (Prediction, Vehicle),
+    }
+    """tables whose derived columns change with each realtime table"""
+    CHUNK = 500
+    """trips per query for their stop times"""
+    STOP_TIME_COLUMNS = (*Prediction.DELAY_KEY, "stop_headsign")
+    """read per trip, named like the prediction columns they're compared to; \
+        `arrival` and `departure` are added as seconds past midnight"""
+
+    def __init__(self) -> None:
+        """Initializes RealtimeEnrichment."""
+        self.database: str | None = None
+        """schedule database the cached columns are from"""
+        self._schedule: dict[str, pd.DataFrame] = {}
+        self._stop_times = pd.DataFrame(
+            columns=[*self.STOP_TIME_COLUMNS, "arrival", "departure"]
+        )
+        """stop times of the trips in the last snapshots"""
+        self._shapes: dict[str, np.ndarray] = {}
+        """longitude, latitude of each shape's points, in order"""
+        self.snapshot: ScheduleSnapshot | None = None
+        """snapshot of the schedule database, shapes are read from if set"""
+        self._bearings: dict[BearingKey, float] = {}
+        """interpolated bearings of the last snapshot, by what they depend on"""
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.database})>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def enrich(
+        self,
+        store: RealtimeStore,
+        engine: sa.Engine,
+        *changed: t.Type[Base],
+        snapshot: ScheduleSnapshot | None = None,
+    ) -> RealtimeStore:
+        """derives the columns of every table in `store` that depends on `changed`.
+
+        Args:
+            store (RealtimeStore): store with the new snapshots
+            engine (sa.Engine): schedule database
+            *changed (type[Base]): realtime tables replaced in `store`
+            snapshot (ScheduleSnapshot, optional): mapped copy of the schedule, \
+                used for shapes if it was exported from `engine`'s database
+        Returns:
+            RealtimeStore: `store` with the derived columns
+        """
+        self.snapshot = (
+            snapshot
+            if snapshot is not None and snapshot.database == engine.url.database
+            else None
+        )
+        tables = {
+            orm
+            for table in changed
+            for orm in self.DEPENDS.get(table, ())
+            if orm in store
+        }
+        if not tables:
+            return store
+        frames = {orm: store.tables[orm].frame for orm in self.DEPENDS if orm in store}
+        with engine.connect() as conn:
+            self._load(conn, engine.url.database)
+            self._load_stop_times(
+                conn,
+                pd.concat([frame["trip_id"] for frame in frames.values()]),
+            )
+            if Vehicle in tables:
+                store = store.derive(
+                    Vehicle,
+                    self.vehicles(conn, frames[Vehicle], frames.get(Prediction)),
+                )
+        if Prediction in tables:
+            store = store.derive(
+                Prediction, self.predictions(frames[Prediction], frames.get(Vehicle))
+            )
+            store = RealtimeStore(
+                store.tables,
+                dict(
+                    zip(
+                        zip(
+                            *map(store.tables[Prediction].loaded, Prediction.DELAY_KEY)
+                        ),
+                        store.tables[Prediction].columns["delay"],
+                    )
+                ),
+            )
+        return store
+
+    def _load(self, conn: sa.Connection, database: str | None) -> None:
+        """reads the schedule columns, unless they're from `database` already"""
+        if database == self.database and self._schedule:
+            return
+        queries = {
+            "stop": "SELECT stop_id, stop_name, platform_code, platform_name, "
+            "stop_lat, stop_lon FROM stop",
+            "route": "SELECT route_id, route_type, route_short_name, route_color "
+            "FROM route",
+            "trip": "SELECT trip_id, trip_headsign, trip_short_name, bikes_allowed, "
+            "shape_id FROM trip",
+            "note": "SELECT trip_id, value FROM trip_property "
+            "WHERE trip_property_id = 'note' ORDER BY trip_id, `index`",
+        }
+        frames = {
+            table: pd.read_sql(sa.text(sql), conn) for table, sql in queries.items()
+        }
+        self._schedule = {
+            table: frame.drop_duplicates(frame.columns[0]).set_index(frame.columns[0])
+            for table, frame in frames.items()
+        }
+        self._stop_times = self._stop_times.iloc[:0]
+        self._shapes.clear()
+        self._bearings.clear()
+        self.database = database
+
+    def _load_stop_times(self, conn: sa.Connection, trip_ids: pd.Series) -> None:
+        """reads the stop times of the trips not read yet, parsing their times \
+            once, and forgets those of trips no longer in the snapshots"""
+        trip_ids = set(trip_ids.dropna())
+        cached = self._stop_times[self._stop_times["trip_id"].isin(trip_ids)]
+        trip_ids -= set(cached["trip_id"])
+        query = sa.text(
+            f"SELECT {', '.join(self.STOP_TIME_COLUMNS)} FROM stop_time "
+            "WHERE trip_id IN :trips"
+        ).bindparams(sa.bindparam("trips", expanding=True))
+        trip_ids = sorted(trip_ids)
+        read = [
+            pd.read_sql(query, conn, params={"trips": trip_ids[i : i + self.CHUNK]})
+            for i in range(0, len(trip_ids), self.CHUNK)
+        ]
+        read = [
+            frame.assign(
+                arrival=times_to_seconds(frame["arrival_time"]),
+                departure=times_to_seconds(frame["departure_time"]),
+            )
+            for frame in read
+            if not frame.empty
+        ]
+        self._stop_times = pd.concat([cached, *read], ignore_index=True).sort_values(
+            ["trip_id", "stop_sequence"], ignore_index=True
+        )
+
+    def _stop_time(self, keys: pd.DataFrame) -> pd.DataFrame:
+        """the stop time of each (trip_id, stop_id), like the `stop_time` \
+            relationships: the first if the trip stops there more than once"""
+        stop_times = self._stop_times.drop_duplicates(["trip_id", "stop_id"])
+        return lookup(stop_times.set_index(["trip_id", "stop_id"]), keys)
+
+    def delays(self, predictions: pd.DataFrame) -> np.ndarray:
+        """seconds each prediction is behind schedule, like `Prediction._get_delay`.
+
+        predictions are matched to the trip's stop time by stop sequence, \
+            or by stop when the sequence is missing or is another stop; \
+            a trip that stops somewhere twice gets the right one. \
+            the departure is compared if both have one, else the arrival, \
+            and a delay of more than ~16 hours early is a trip past midnight.
+
+        Args:
+            predictions (pd.DataFrame): prediction snapshot
+        Returns:
+            np.ndarray: delays, 0 without a stop time to compare to
+        """
+        stop_times = self._stop_times.assign(
+            stop_sequence=self._stop_times["stop_sequence"].astype(float)
+        ).set_index(["trip_id", "stop_sequence"])
+        by_sequence = lookup(
+            stop_times,
+            predictions[["trip_id", "stop_sequence"]].astype({"stop_sequence": float}),
+        )
+        by_stop = self._stop_time(predictions[["trip_id", "stop_id"]])
+        sequence = (
+            by_sequence["found"] & by_sequence["stop_id"].eq(predictions["stop_id"])
+        ).to_numpy()
+        found = sequence | by_stop["found"].to_numpy()
+
+        midnight = get_date().timestamp()
+        delay = np.zeros(len(predictions))
+        for column in ("arrival", "departure"):  # departure wins
+            scheduled = np.where(
+                sequence,
+                by_sequence[column].astype(float).fillna(-1).to_numpy(),
+                by_stop[column].astype(float).fillna(-1).to_numpy(),
+            )
+            actual = predictions[f"{column}_time"].astype(float).fillna(0).to_numpy()
+            use = found & (actual != 0) & (scheduled >= 0)
+            delay = np.where(use, actual - (scheduled + midnight), delay)
+        return np.where(delay <= -60_000, delay + 86_400, delay)
+
+    def _destinations(self) -> pd.DataFrame:
+        """stop id, longitude and latitude of the last stop of each trip"""
+        last = self._stop_times.drop_duplicates("trip_id", keep="last")
+        stops = lookup(self._schedule["stop"], last["stop_id"])
+        return pd.DataFrame(
+            {
+                "stop_id": last["stop_id"],
+                "stop_lon": stops["stop_lon"],
+                "stop_lat": stops["stop_lat"],
+            }
+        ).set_index(last["trip_id"])
+
+    @staticmethod
+    def _destination_label(stop_time: pd.DataFrame, trip: pd.DataFrame) -> pd.Series:
+        """`StopTime.destination_label` of each stop time"""
+        label = stop_time["stop_headsign"].where(
+            truthy(stop_time["stop_headsign"]), trip["trip_headsign"]
+        )
+        return label.where(trip["found"], "")
+
+    def _last_stops(self, predictions: pd.DataFrame | None) -> pd.DataFrame:
+        """the last prediction of each trip, `max(predictions)`: \
+            whether its stop exists and the stop's name"""
+        if predictions is None or predictions.empty:
+            return pd.DataFrame(columns=["stop_found", "stop_name"])
+        predictions = predictions[predictions["trip_id"].notna()]
+        sequence = pd.to_numeric(predictions["stop_sequence"]).fillna(0)
+        last = predictions.loc[sequence.groupby(predictions["trip_id"]).idxmax()]
+        stops = lookup(self._schedule["stop"], last["stop_id"])
+        return pd.DataFrame(
+            {"stop_found": stops["found"], "stop_name": stops["stop_name"]}
+        ).set_index(last["trip_id"])
+
+    def vehicles(
+        self,
+        conn: sa.Connection,
+        vehicles: pd.DataFrame,
+        predictions: pd.DataFrame | None,
+    ) -> pd.DataFrame:
+        """derived columns of a vehicle snapshot.
+
+        Args:
+            conn (sa.Connection): schedule database, for shapes not read yet
+            vehicles (pd.DataFrame): vehicle snapshot
+            predictions (pd.DataFrame, optional): prediction snapshot
+        Returns:
+            pd.DataFrame: `Vehicle.__enriched__` and `Vehicle.json_fields`, \
+                aligned with `vehicles`
+        """
+        trip = lookup(self._schedule["trip"], vehicles["trip_id"])
+        route = lookup(self._schedule["route"], vehicles["route_id"])
+        stop_time = self._stop_time(vehicles[["trip_id", "stop_id"]])
+        last = lookup(self._last_stops(predictions), vehicles["trip_id"])
+        has_last = last["found"]
+        note = lookup(self._schedule["note"], vehicles["trip_id"])
+
+        headsign = (
+            self._destination_label(stop_time, trip)
+            .where(stop_time["found"], trip["trip_headsign"].where(trip["found"]))
+            .where(
+                stop_time["found"] | trip["found"],
+                last["stop_name"].where(has_last & last["stop_found"].eq(True)),
+            )
+            .fillna("unknown")
+        )
+
+        return pd.DataFrame(
+            {
+                "bearing": self._vehicle_bearings(conn, vehicles, trip),
+                "current_stop_sequence": vehicles["current_stop_sequence"].fillna(0),
+                "trip_short_name": trip["trip_short_name"].where(
+                    trip["found"] & truthy(trip["trip_short_name"]),
+                    vehicles["trip_id"],
+                ),
+                "route_color": route["route_color"].where(route["found"]),
+                "bikes_allowed": trip["found"] & (trip["bikes_allowed"] == 1),
+                "headsign": headsign,
+                "display_name": self._display_names(vehicles, trip, route, last),
+                "trip_note": note["value"].where(note["found"]),
+            },
+            index=vehicles.index,
+        )
+
+    @staticmethod
+    def _display_names(
+        vehicles: pd.DataFrame,
+        trip: pd.DataFrame,
+        route: pd.DataFrame,
+        last: pd.DataFrame,
+    ) -> pd.Series:
+        """`Vehicle.display_name` of each vehicle, from the `lookup`s of its \
+            trip, route and last prediction (`_last_stops`)"""
+        trip_id = vehicles["trip_id"].fillna("")
+        route_id = vehicles["route_id"].fillna("")
+        short_name = route["route_short_name"]
+        display_name = pd.Series("", index=vehicles.index, dtype=object)
+        for code, dest in reversed([("A", "Ashmont"), ("B", "Braintree")]):
+            display_name = display_name.mask(
+                (route_id == "Red")
+                & (
+                    (trip["found"] & (trip["trip_headsign"] == dest))
+                    | (last["found"] & (last["stop_name"] == dest))
+                ),
+                code,
+            )
+        display_name = display_name.mask(
+            route["found"]
+            & truthy(route_id)
+            & ((route["route_type"] == "3") | route_id.str.startswith("Green"))
+            & truthy(short_name)
+            & (short_name.str.len() <= 4),
+            short_name,
+        )
+        display_name = display_name.mask(
+            trip["found"] & truthy(trip["trip_short_name"]), trip["trip_short_name"]
+        )
+        return display_name.mask(trip_id.str.contains("NONREV"), "NR")
+
+    def _vehicle_bearings(
+        self, conn: sa.Connection, vehicles: pd.DataFrame, trip: pd.DataFrame
+    ) -> list[float]:
+        """`bearing` after the reconstructor: the feed's if it has one, \
+            interpolated along the trip's shape if not"""
+        bearings = vehicles["bearing"].astype(float).fillna(0).to_numpy()
+        missing = np.flatnonzero(bearings == 0)
+        destinations = lookup(self._destinations(), vehicles["trip_id"])
+        known: dict[BearingKey, float] = {}
+        for i in missing:
+            if not trip["found"].iat[i]:
+                continue
+            key = BearingKey(
+                trip["shape_id"].iat[i],
+                destinations["stop_lon"].iat[i],
+                destinations["stop_lat"].iat[i],
+                vehicles["longitude"].iat[i],
+                vehicles["latitude"].iat[i],
+            )
+            if key not in self._bearings:
+                self._bearings[key] = self._interpolate(conn, key)
+            bearings[i] = known[key] = self._bearings[key]
+        self._bearings = known
+        return [round(float(bearing), 2) for bearing in bearings]
+
+    def _interpolate(self, conn: sa.Connection, key: BearingKey) -> float:
+        """`Vehicle._get_interpolated_bearing`: the azimuth from the shape's \
+            point nearest the vehicle to its neighbour towards the destination; \
+            0 if any of it is missing"""
+        if not np.isfinite(np.array(key[1:], float)).all():  # all but the shape
+            return 0.0  # no destination or position
+        try:
+            coords = self._shape(conn, key.shape_id)
+            nearest_i = int(np.argmin(((coords - (key.lon, key.lat)) ** 2).sum(axis=1)))
+            if nearest_i == len(coords) - 1:
+                next_i = nearest_i - 1
+            elif nearest_i == 0:
+                next_i = 1
+            else:
+                prev, after = np.hypot(
+                    *(
+                        coords[[nearest_i - 1, nearest_i + 1]]
+                        - (key.dest_lon, key.dest_lat)
+                    ).T
+                )
+                next_i = nearest_i - 1 if prev < after else nearest_i + 1
+            (x1, y1), (x2, y2) = coords[nearest_i], coords[next_i]
+            azimuth = Geodesic.WGS84.Inverse(y1, x1, y2, x2)["azi1"]
+        except Exception:  # pylint: disable=broad-except
+            return 0.0
+        return 0.0 if np.isnan(azimuth) else azimuth
+
+    def _shape(self, conn: sa.Connection, shape_id: str | None) -> np.ndarray:
+        """longitude, latitude of a shape's points, mapped from `snapshot` \
+            or read once"""
+        if self.snapshot is not None:
+            return self.snapshot.shape(shape_id)[:, ::-1]
+        if shape_id not in self._shapes:
+            self._shapes[shape_id] = pd.read_sql(
+                sa.text(
+                    "SELECT shape_pt_lon, shape_pt_lat FROM shape_point "
+                    "WHERE shape_id = :shape_id ORDER BY shape_pt_sequence"
+                ),
+                conn,
+                params={"shape_id": shape_id},
+            ).to_numpy(np.float64)
+        return self._shapes[shape_id]
+
+    def predictions(
+        self, predictions: pd.DataFrame, vehicles: pd.DataFrame | None
+    ) -> pd.DataFrame:
+        """derived columns of a prediction snapshot.
+
+        Args:
+            predictions (pd.DataFrame): prediction snapshot
+            vehicles (pd.DataFrame, optional): vehicle snapshot
+        Returns:
+            pd.DataFrame: `Prediction.__enriched__` and \
+                `Prediction.json_fields`, aligned with `predictions`
+        """
+        stop = lookup(self._schedule["stop"], predictions["stop_id"])
+        trip = lookup(self._schedule["trip"], predictions["trip_id"])
+        stop_time = self._stop_time(predictions[["trip_id", "stop_id"]])
+
+        headsign = pd.Series("", index=predictions.index, dtype=object)
+        if vehicles is not None and not vehicles.empty:
+            vehicle = lookup(
+                vehicles.drop_duplicates("vehicle_id").set_index("vehicle_id"),
+                predictions["vehicle_id"],
+            )
+            last = lookup(self._last_stops(predictions), vehicle["trip_id"])
+            headsign = headsign.mask(
+                vehicle["found"] & last["found"], last["stop_name"].fillna("")
+            )
+        headsign = headsign.mask(
+            stop_time["found"], self._destination_label(stop_time, trip)
+        )
+
+        return pd.DataFrame(
+            {
+                "stop_sequence": predictions["stop_sequence"].fillna(0),
+                "stop_name": stop["stop_name"].where(stop["found"]),
+                "platform_code": stop["platform_code"].where(stop["found"]),
+                "platform_name": stop["platform_name"].where(stop["found"]),
+                "delay": self.delays(predictions),
+                "headsign": headsign,
+            },
+            index=predictions.index,
+        )
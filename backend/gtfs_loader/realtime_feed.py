@@ -0,0 +1,397 @@
+"""RealtimeFeed class."""
+
+import logging
+import sqlite3
+import threading
+import time
+import typing as t
+
+import geojson as gj
+import pandas as pd
+import sqlalchemy as sa
+from sqlalchemy import orm as saorm
+
+from ..gtfs_orms import Base, LinkedDataset, RealtimeOrms, Route, Vehicle
+from ..helper_functions import records_import, removes_session, timeit
+from .import_telemetry import ImportTelemetry
+from .query import Query
+from .realtime_diff import RealtimeDiff
+from .realtime_enrichment import RealtimeEnrichment
+from .realtime_fetcher import RealtimeFetcher
+from .realtime_store import RealtimeStore
+from .schedule_snapshot import ScheduleSnapshot
+from .vehicle_history import VehicleHistory
+
+
+class RealtimeFeed:
+    """The realtime side of a `Feed`: importing the GTFS-realtime feeds \
+        and serving what they hold.
+
+    - `import_realtime` fetches the feeds and `upsert_realtime` writes each \
+        one as a diff, then replaces its table in `realtime_store`
+    - vehicles and plain realtime queries are served from `realtime_store`, \
+        and vehicle trails from `vehicle_history`
+    """
+
+    WRITE_RETRIES = 3
+    """retries of a feed's write after a database error, a second apart; \
+        the lock and the writer are held meanwhile"""
+
+    # set by `Feed`
+    SL_ROUTES: tuple[str, ...]
+    REALTIME_ORMS: tuple[t.Type[Base], ...]
+    find_orm: t.Callable[[str], t.Type[Base] | None]
+    _get_session: t.Callable[..., saorm.Session]
+    engine: sa.Engine
+    reader_engine: sa.Engine
+    fetcher: RealtimeFetcher
+    telemetry: ImportTelemetry
+    realtime_store: RealtimeStore
+    realtime_enrichment: RealtimeEnrichment
+    vehicle_history: VehicleHistory
+    _realtime: dict[str, tuple[str | None, pd.DataFrame]]
+    _realtime_lock: threading.Lock
+    _enrich_lock: threading.Lock
+    _vehicle_filters: dict[tuple, tuple[set[str], ...]]
+    snapshot: ScheduleSnapshot
+
+    def _get_dataset(self, orm: t.Type[Base], use_cache: bool) -> LinkedDataset | None:
+        """the `LinkedDataset` of a realtime orm, from the cache or the database.
+
+        Args:
+            orm (type[Base]): realtime ORM
+            use_cache (bool): reuse and fill `LinkedDataset.cache`
+        Returns:
+            LinkedDataset | None: the dataset; `None` before a schedule is loaded
+        """
+        if use_cache and (_tmp := LinkedDataset.cache.get(orm.__realtime_name__)):
+            logging.info("Using cached LinkedDataset for %s", orm.__realtime_name__)
+            return LinkedDataset.from_dict(_tmp)
+        session = self._get_session(readonly=True)
+        row = session.execute(
+            Query.get_dataset_query(orm.__realtime_name__)
+        ).one_or_none()
+        if not row:
+            return None
+        if use_cache:
+            row[0].cache_key(key=orm.__realtime_name__)
+        return row[0]
+
+    @timeit
+    @records_import
+    @removes_session
+    def import_realtime(
+        self, *orms: RealtimeOrms | str, use_cache: bool = True
+    ) -> dict[t.Type[Base], int | None]:
+        """Imports realtime data into the database, \
+            as the difference from the last import (see `upsert_realtime`). \
+            feeds that haven't changed are skipped before they're decoded \
+            and counted as `{table}.skipped` in the telemetry.
+
+        the feeds are fetched and decoded concurrently by `Feed.fetcher`, \
+            and written one at a time as they arrive.
+
+        Args:
+            *orms (RealtimeOrms | str): realtime ORMs.
+            use_cache (bool, optional): reuse the cached `LinkedDataset`. \
+                Defaults to True.
+        Returns:
+            dict[type[Base], int | None]: header timestamp of each feed written, \
+                `None` if it has none; feeds skipped or failed are left out
+        """
+        datasets: dict[str, tuple[t.Type[Base], LinkedDataset]] = {}
+        for orm in orms:
+            if isinstance(orm, str):
+                orm = self.find_orm(orm)
+            if orm not in self.REALTIME_ORMS:
+                raise ValueError(f"{orm} is not a realtime ORM")
+            if not (dataset := self._get_dataset(orm, use_cache)):
+                logging.warning("no LinkedDataset for %s", orm.__realtime_name__)
+                continue  # no schedule loaded yet
+            datasets[orm.__realtime_name__] = (orm, dataset)
+
+        errors: list[Exception] = []
+        written: dict[t.Type[Base], int | None] = {}
+        for name, dataframe, seconds in self.fetcher.fetch(
+            {name: dataset for name, (_, dataset) in datasets.items()}
+        ):
+            orm, dataset = datasets[name]
+            self.telemetry.add(parse_seconds=seconds)
+            if dataframe is None:  # unchanged since the last import
+                self.telemetry.add({f"{orm.__tablename__}.skipped": 1})
+                continue
+            if dataframe.columns.empty:  # failed; keep the last feed, retry the next
+                dataset.forget_validators()
+                continue
+            try:
+                self.upsert_realtime(dataframe, orm)
+            except Exception as error:  # pylint: disable=broad-except
+                dataset.forget_validators()  # so the next cycle retries this feed
+                errors.append(error)
+                continue
+            written[orm] = LinkedDataset.validators.get(dataset.url, {}).get(
+                "timestamp"
+            )
+        if errors:  # the other feeds are still written
+            raise errors[0]
+        return written
+
+    def upsert_realtime(self, data: pd.DataFrame, orm: t.Type[Base]) -> dict[str, int]:
+        """Writes a realtime feed as the inserts, updates and deletes \
+            since the last one written to the same database, in one transaction.
+
+        the first feed after startup or a swap rewrites the table, \
+            as does the next one after a write that failed (database errors \
+            are retried `WRITE_RETRIES` times first). \
+            then the snapshot replaces the table in `realtime_store`, \
+            vehicle positions are added to `vehicle_history`, and the lock \
+            is released before `_enrich` derives the store's columns \
+            (counted as parsing).
+
+        Args:
+            data (pd.DataFrame): the decoded feed
+            orm (type[Base]): realtime table
+        Returns:
+            dict[str, int]: rows inserted, updated, deleted and unchanged
+        """
+        table = orm.__tablename__
+        with self._realtime_lock:
+            database, previous = self._realtime.get(table, (None, None))
+            if database != self.engine.url.database:
+                previous = None
+            diff = RealtimeDiff(orm, data, previous)
+            start = time.perf_counter()
+            for attempt in range(self.WRITE_RETRIES + 1):
+                raw = self.engine.raw_connection()
+                try:
+                    cursor = raw.cursor()
+                    counts = diff.apply(cursor)
+                    cursor.close()
+                    raw.commit()
+                    break
+                except sqlite3.IntegrityError as error:
+                    raw.rollback()
+                    self._realtime.pop(table, None)  # out of step; rewrite next time
+                    logging.error("failed import data for %s: %s", orm.__name__, error)
+                    raise error
+                except sqlite3.DatabaseError as error:
+                    raw.rollback()
+                    if attempt == self.WRITE_RETRIES:  # e.g. disk full, corrupt
+                        self._realtime.pop(table, None)
+                        logging.error(
+                            "failed import realtime data for %s: %s",
+                            orm.__name__,
+                            error,
+                        )
+                        raise error
+                    logging.error(
+                        "retrying failed import realtime data for %s: %s",
+                        orm.__name__,
+                        error,
+                    )
+                    time.sleep(1)
+                finally:
+                    raw.close()
+            self._realtime[table] = (self.engine.url.database, diff.snapshot)
+            self.realtime_store = self.realtime_store.replace(orm, diff.snapshot)
+            if orm is Vehicle:
+                self.vehicle_history.record(diff.snapshot)
+        enrich_start = time.perf_counter()
+        self._enrich(orm)
+        enrich_seconds = time.perf_counter() - enrich_start
+        logging.info(
+            "Applied %s to %s (%s)",
+            "rewrite" if diff.full else "diff",
+            table,
+            ", ".join(f"{n} {kind}" for kind, n in counts.items()),
+        )
+        self.telemetry.add(
+            {f"{table}.{k}": n for k, n in counts.items() if k != "unchanged"},
+            parse_seconds=enrich_seconds,
+            write_seconds=time.perf_counter() - start - enrich_seconds,
+        )
+        return counts
+
+    def _schedule_snapshot(self) -> ScheduleSnapshot | None:
+        """the newest `snapshot`, `None` if none was exported yet"""
+        try:
+            return self.snapshot
+        except FileNotFoundError:
+            return None
+
+    def _enrich(self, orm: t.Type[Base]) -> None:
+        """derives the columns of `realtime_store` that depend on `orm`, \
+            reading the schedule through the reader pool, so the writer and \
+            `_realtime_lock` are free for the next feed.
+
+        other imports may replace their tables meanwhile: only the tables \
+            still as they were enriched are published, the others are \
+            enriched after their own import.
+
+        Args:
+            orm (type[Base]): realtime table just replaced
+        """
+        with self._enrich_lock:  # `realtime_enrichment` caches per snapshot
+            base = self.realtime_store
+            try:  # without it, rows are served as loaded from the database
+                store = self.realtime_enrichment.enrich(
+                    base, self.reader_engine, orm, snapshot=self._schedule_snapshot()
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                logging.error("failed to enrich %s: %s", orm.__name__, error)
+                return
+            with self._realtime_lock:
+                current = self.realtime_store.tables
+                self.realtime_store = RealtimeStore(
+                    current
+                    | {
+                        key: table
+                        for key, table in store.tables.items()
+                        if current.get(key) is base.tables.get(key)
+                    },
+                    store.delays,
+                )
+
+    def _vehicle_filter(
+        self, session: saorm.Session, query_obj: Query, *add_routes: str
+    ) -> tuple[set[str], ...]:
+        """what `Query.get_vehicles_query` keeps, as sets for `realtime_store` \
+            vehicles; read once per schedule database.
+
+        Args:
+            session (Session): session to read the schedule with
+            query_obj (Query): Query object
+            *add_routes (str): routes kept on top of the query's
+        Returns:
+            tuple[set[str], ...]: routes kept, trips kept if their route \
+                exists, and the routes that exist
+        """
+        cache_key = (self.reader_engine.url.database, query_obj.route_types, add_routes)
+        if (cached := self._vehicle_filters.get(cache_key)) is None:
+            known = set(session.scalars(sa.select(Route.route_id)))
+            routes = set(
+                session.scalars(
+                    sa.select(query_obj.get_routes_query().subquery().c.route_id)
+                )
+            )
+            trips = set(
+                session.scalars(sa.select(query_obj.trip_query.subquery().c.trip_id))
+            )
+            cached = ((routes | set(add_routes)) & known, trips, known)
+            self._vehicle_filters = {  # only for the live database
+                k: v for k, v in self._vehicle_filters.items() if k[0] == cache_key[0]
+            } | {cache_key: cached}
+        return cached
+
+    def _vehicle_routes(self, key: str) -> list[str]:
+        """routes whose vehicles `key` shows besides its route types'"""
+        _routes: list[str] = []
+        if key == "rapid_transit":
+            _routes.extend(self.SL_ROUTES)
+            # _routes.extend([*self.SL_ROUTES, "Shuttle-Generic"])
+        return _routes
+
+    def get_vehicles_feature(
+        self, key: str, query_obj: Query, *include: str
+    ) -> gj.FeatureCollection:
+        """Returns vehicles as FeatureCollection.
+
+        - early return if ferry data is requested.
+        - vehicles come from `realtime_store` once it has them, \
+            with the realtime relationships in `include` filled from it.
+        - realtime imports commit whole feeds and the session reads one \
+            snapshot, so an empty result means there are no vehicles; \
+            it isn't retried.
+
+        Args:
+            key (str): the type of data to export (RAPID_TRANSIT, BUS, etc.)
+            query_obj (Query): Query object
+            *include (str): other orms to include
+        Returns:
+            FeatureCollection: vehicles as FeatureCollection
+        """
+        session = self._get_session(readonly=True)
+        if key == "ferry":  # no ferry data :(
+            return gj.FeatureCollection([])
+        _routes = self._vehicle_routes(key)
+        try:
+            if Vehicle in (store := self.realtime_store):
+                vehicles = store.tables[Vehicle]
+                routes, trips, known = self._vehicle_filter(
+                    session, query_obj, *_routes
+                )
+                positions = [
+                    i
+                    for i, (route_id, trip_id) in enumerate(
+                        zip(vehicles.columns["route_id"], vehicles.columns["trip_id"])
+                    )
+                    if route_id in routes or (trip_id in trips and route_id in known)
+                ]
+                data = store.instances(session, Vehicle, positions, *include)
+                return gj.FeatureCollection([v.as_feature(*include) for v in data])
+            data = session.execute(query_obj.get_vehicles_query(*_routes)).all()
+            return gj.FeatureCollection([v[0].as_feature(*include) for v in data])
+        except Exception as error:  # pylint: disable=broad-except
+            logging.error("Failed to get vehicle data: %s", error)
+            return gj.FeatureCollection([])
+
+    def get_vehicle_history(
+        self,
+        key: str,
+        query_obj: Query,
+        minutes: float | None = None,
+        vehicle_ids: t.Iterable[str] | None = None,
+    ) -> gj.FeatureCollection:
+        """Returns the recent trails of the vehicles `get_vehicles_feature` \
+            would return, from `vehicle_history`.
+
+        Args:
+            key (str): the type of data to export (RAPID_TRANSIT, BUS, etc.)
+            query_obj (Query): Query object
+            minutes (float, optional): how far back. \
+                Defaults to all `vehicle_history` keeps.
+            vehicle_ids (Iterable[str], optional): only these vehicles
+        Returns:
+            FeatureCollection: a linestring feature per vehicle
+        """
+        if key == "ferry":  # no ferry data :(
+            return gj.FeatureCollection([])
+        try:
+            routes, trips, known = self._vehicle_filter(
+                self._get_session(readonly=True), query_obj, *self._vehicle_routes(key)
+            )
+            history = self.vehicle_history.query(minutes, vehicle_ids)
+            history = history[
+                history["route_id"].isin(routes)
+                | (history["trip_id"].isin(trips) & history["route_id"].isin(known))
+            ]
+            return VehicleHistory.as_features(history)
+        except Exception as error:  # pylint: disable=broad-except
+            logging.error("Failed to get vehicle history: %s", error)
+            return gj.FeatureCollection([])
+
+    def _get_store_orms(
+        self, _orm: type[Base] | str, *include: str, **params
+    ) -> list[tuple[Base]] | None:
+        """`_get_orms` from `realtime_store`, for a realtime orm \
+            filtered only by its columns equalling values.
+
+        Args:
+            _orm (str): ORM to return.
+            *include (str): realtime relationships to fill from the store
+            **params: column -> value
+        Returns:
+            list[tuple[Base]] | None: like `_get_orms`; \
+                `None` if the store can't answer it
+        """
+        if isinstance(_orm, str):
+            _orm = self.find_orm(_orm)
+        if _orm not in (store := self.realtime_store):
+            return None
+        if any(
+            key not in _orm.cols or value in {"null", "None", "none"}
+            for key, value in params.items()
+        ):
+            return None
+        session = self._get_session(readonly=True)
+        return [(orm,) for orm in store.query(session, _orm, *include, **params)]
@@ -0,0 +1,158 @@
+"""RealtimeFetcher class."""
+
+import collections
+import concurrent.futures as cf
+import logging
+import threading
+import time
+import typing as t
+
+import pandas as pd
+import requests as req
+from requests.adapters import HTTPAdapter
+
+from ..gtfs_orms import LinkedDataset
+
+
+class RealtimeFetcher:
+    """Fetches realtime feeds concurrently over one pooled, keep-alive session.
+
+    - each feed has its own request timeout and retry budget, \
+        by `__realtime_name__`
+    - connection errors, timeouts, `429` and `5xx` are retried with \
+        exponential backoff while the feed has retries and time left
+    - `fetch` fetches and decodes feeds on a thread pool; the fetcher \
+        is the `session` their `LinkedDataset` requests go through
+
+    Args:
+        workers (int, optional): feeds fetched at once. Defaults to 3.
+        timeouts (dict[str, float], optional): seconds per request by feed, \
+            over `TIMEOUTS`
+        retries (dict[str, int], optional): retries per fetch by feed, \
+            over `RETRIES`
+    """
+
+    TIMEOUTS = {"vehicle_positions": 5.0, "trip_updates": 10.0, "service_alerts": 10.0}
+    """seconds to wait on one request"""
+    RETRIES = {"vehicle_positions": 2, "trip_updates": 2, "service_alerts": 1}
+    """requests retried per fetch"""
+    BUDGET_SECONDS = 12.0
+    """a fetch stops retrying when another attempt could run past this; \
+        under the fastest polling interval, so fetches don't pile up"""
+    BACKOFF_SECONDS = 0.5
+    """first retry delay, doubled every retry"""
+    RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(
+        self,
+        workers: int = 3,
+        timeouts: dict[str, float] | None = None,
+        retries: dict[str, int] | None = None,
+    ) -> None:
+        """Initializes RealtimeFetcher.
+
+        Args:
+            workers (int, optional): feeds fetched at once. Defaults to 3.
+            timeouts (dict[str, float], optional): seconds per request by feed, \
+                over `TIMEOUTS`
+            retries (dict[str, int], optional): retries per fetch by feed, \
+                over `RETRIES`
+        """
+        self.timeouts = self.TIMEOUTS | (timeouts or {})
+        self.retries = self.RETRIES | (retries or {})
+        self.session = req.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = cf.ThreadPoolExecutor(workers, thread_name_prefix="realtime")
+        self.stats: collections.defaultdict[str, collections.Counter[str]] = (
+            collections.defaultdict(collections.Counter)
+        )
+        """requests, retries and failures per feed"""
+        self._names: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.executor._max_workers} workers)>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def _count(self, name: str, stat: str) -> None:
+        """adds one to `stats[name][stat]`"""
+        with self._lock:
+            self.stats[name][stat] += 1
+
+    def get(self, url: str, **kwargs) -> req.Response:
+        """`GET` with the feed's timeout and retry budget.
+
+        Args:
+            url (str): url of a feed passed to `fetch`, or any other url \
+                (no retries)
+            **kwargs: keyword arguments for `requests.Session.get`; \
+                `timeout` is the feed's
+        Returns:
+            req.Response: the last response; a `429` or `5xx` once \
+                the budget is spent
+        Raises:
+            req.RequestException: if the last attempt didn't get a response
+        """
+        name = self._names.get(url, "")
+        kwargs["timeout"] = self.timeouts.get(name, kwargs.get("timeout", 10))
+        retries = self.retries.get(name, 0)
+        deadline = time.monotonic() + self.BUDGET_SECONDS
+        for attempt in range(retries + 1):
+            self._count(name, "requests")
+            try:
+                response = self.session.get(url, **kwargs)
+                if response.status_code not in self.RETRY_STATUS:
+                    return response
+                error: Exception | None = None
+            except (req.ConnectionError, req.Timeout) as exc:
+                response, error = None, exc
+            delay = self.BACKOFF_SECONDS * 2**attempt
+            if attempt == retries or (
+                time.monotonic() + delay + kwargs["timeout"] > deadline
+            ):
+                break
+            logging.warning(
+                "retrying %s in %.1f s (%s)",
+                url,
+                delay,
+                error or response.status_code,
+            )
+            self._count(name, "retries")
+            time.sleep(delay)
+        self._count(name, "failures")
+        if response is None:
+            raise error
+        return response
+
+    def fetch(
+        self, datasets: dict[str, LinkedDataset]
+    ) -> t.Iterator[tuple[str, pd.DataFrame | None, float]]:
+        """fetches and decodes feeds concurrently, yielding each as it's done.
+
+        Args:
+            datasets (dict[str, LinkedDataset]): dataset per `__realtime_name__`
+        Yields:
+            tuple[str, pd.DataFrame | None, float]: name, \
+                `LinkedDataset.as_dataframe` and seconds it took
+        """
+
+        def _fetch(dataset: LinkedDataset) -> tuple[pd.DataFrame | None, float]:
+            start = time.perf_counter()
+            dataframe = dataset.as_dataframe(session=self)
+            return dataframe, time.perf_counter() - start
+
+        futures: dict[cf.Future, str] = {}
+        for name, dataset in datasets.items():
+            self._names[dataset.url] = name
+            futures[self.executor.submit(_fetch, dataset)] = name
+        for future in cf.as_completed(futures):
+            yield futures[future], *future.result()
+
+    def close(self) -> None:
+        """waits for fetches in progress and closes the session"""
+        self.executor.shutdown(wait=True)
+        self.session.close()
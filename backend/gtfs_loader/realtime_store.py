@@ -0,0 +1,305 @@
+"""RealtimeStore class."""
+
+import copy
+import typing as t
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import orm as saorm
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ..gtfs_orms import Base
+
+
+def _affinity(python_type: type, value: t.Any) -> t.Any:
+    """`value` as sqlite would store it in a column of `python_type`: \
+        cast if that loses nothing, else as is"""
+    if value is None or isinstance(value, python_type):
+        return value
+    if python_type is bool:
+        return bool(value) if value in (0, 1) else value
+    if python_type is int and isinstance(value, float) and not value.is_integer():
+        return value
+    try:
+        return python_type(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class RealtimeTable:
+    """One snapshot of a realtime table, in memory.
+
+    columns are object arrays of plain python values, nulls as `None`, \
+        cast to the python type of their orm column the way sqlite's type \
+        affinity would have stored them (e.g. `1.0` in a string column is \
+        `"1.0"`); `INDEXED` columns get a hash index of value -> row positions. \
+        `derive` adds columns computed from the snapshot, like \
+        `RealtimeEnrichment`'s.
+
+    Args:
+        orm (type[Base]): realtime table
+        frame (pd.DataFrame): the snapshot, like `RealtimeDiff.snapshot`
+    """
+
+    __slots__ = ("orm", "frame", "columns", "indexes", "length", "derived")
+
+    INDEXED = ("vehicle_id", "trip_id", "stop_id", "route_id")
+
+    def __init__(self, orm: t.Type[Base], frame: pd.DataFrame) -> None:
+        """Initializes RealtimeTable.
+
+        Args:
+            orm (type[Base]): realtime table
+            frame (pd.DataFrame): the snapshot, like `RealtimeDiff.snapshot`
+        """
+        self.orm = orm
+        self.frame = frame.reset_index(drop=True)
+        """the snapshot, as given"""
+        self.length = len(self.frame)
+        self.columns: dict[str, np.ndarray] = {
+            col: self._values(self.frame[col], self._python_type(col))
+            for col in orm.cols
+            if col in self.frame.columns
+        }
+        self.derived: tuple[str, ...] = ()
+        """columns added by `derive`"""
+        self.indexes: dict[str, dict[t.Any, np.ndarray]] = {
+            col: dict(
+                pd.Series(self.columns[col])
+                .groupby(self.columns[col], sort=False)
+                .indices
+            )
+            for col in self.INDEXED
+            if col in self.columns
+        }
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.orm.__tablename__}, {self.length})>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __len__(self) -> int:
+        return self.length
+
+    @staticmethod
+    def _values(values: pd.Series, python_type: type | None = None) -> np.ndarray:
+        """`values` as an object array of python values, nulls as `None`, \
+            cast to `python_type` where it's a sqlite affinity"""
+        array = values.astype(object).where(values.notna(), None).to_numpy()
+        if python_type not in (str, int, float, bool):
+            return array
+        return np.fromiter(
+            (_affinity(python_type, value) for value in array),
+            dtype=object,
+            count=len(array),
+        )
+
+    def _python_type(self, col: str) -> type | None:
+        """python type of `col`, `None` if it isn't a column of the orm"""
+        if col not in self.orm.__table__.columns:
+            return None
+        return self.orm.__table__.columns[col].type.python_type
+
+    def derive(self, derived: pd.DataFrame) -> "RealtimeTable":
+        """a copy of the table with the columns of `derived` added, \
+            or replaced if they're in the snapshot too.
+
+        Args:
+            derived (pd.DataFrame): columns aligned with the snapshot
+        Returns:
+            RealtimeTable: the new table; the snapshot and indexes are shared
+        """
+        table = copy.copy(self)
+        table.columns = self.columns | {
+            col: self._values(
+                derived[col].reset_index(drop=True), self._python_type(col)
+            )
+            for col in derived.columns
+        }
+        table.derived = tuple(derived.columns)
+        return table
+
+    def loaded(self, col: str) -> np.ndarray:
+        """`col` as in the snapshot, even if `derive` replaced it"""
+        return self._values(self.frame[col], self._python_type(col))
+
+    def _coerce(self, col: str, value: t.Any) -> t.Any:
+        """`value`, e.g. a query parameter, as the python type of `col`"""
+        python_type = self._python_type(col)
+        try:
+            return python_type(value)
+        except (TypeError, ValueError):
+            return value
+
+    def select(self, **equals: t.Any) -> np.ndarray:
+        """positions of the rows where every column equals its value.
+
+        Args:
+            **equals: column -> value, coerced to the column's type
+        Returns:
+            np.ndarray: row positions, in snapshot order
+        """
+        positions = np.arange(self.length)
+        for col, value in equals.items():
+            if value is None:  # like sql, null equals nothing
+                return positions[:0]
+            value = self._coerce(col, value)
+            if col in self.indexes:
+                matched = self.indexes[col].get(value, np.empty(0, dtype=int))
+                positions = np.intersect1d(positions, matched, assume_unique=True)
+            else:
+                positions = positions[self.columns[col][positions] == value]
+        return positions
+
+    def row(self, position: int) -> dict[str, t.Any]:
+        """the row at `position` as column -> value"""
+        return {col: values[position] for col, values in self.columns.items()}
+
+
+class RealtimeStore:
+    """The latest snapshot of every realtime table, in memory.
+
+    a store is never changed: each ingest builds a new one with `replace`, \
+        and readers take `Feed.realtime_store` once, so all they read \
+        comes from the same snapshots.
+
+    rows are served as orm instances attached to the caller's session \
+        without a query: their schedule relationships lazy load as usual, \
+        and the relationships between realtime tables asked for in \
+        `include` are filled from the store's indexes. instances of a table \
+        with derived columns get them instead of running their reconstructor.
+
+    Args:
+        tables (dict[type[Base], RealtimeTable], optional): tables in the store
+        delays (dict[tuple, float], optional): prediction delays by \
+            `Prediction.DELAY_KEY`
+    """
+
+    __slots__ = ("tables", "delays")
+
+    def __init__(
+        self,
+        tables: dict[t.Type[Base], RealtimeTable] | None = None,
+        delays: dict[tuple, float] | None = None,
+    ) -> None:
+        """Initializes RealtimeStore.
+
+        Args:
+            tables (dict[type[Base], RealtimeTable], optional): tables in the store
+            delays (dict[tuple, float], optional): prediction delays by \
+                `Prediction.DELAY_KEY`
+        """
+        self.tables: dict[t.Type[Base], RealtimeTable] = tables or {}
+        self.delays: dict[tuple, float] = delays or {}
+        """delays from `RealtimeEnrichment`, for predictions loaded from \
+            the database; they depend only on the key and the schedule, \
+            so they're kept across snapshots until the next enrichment"""
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({', '.join(map(str, self.tables.values()))})>"  # pylint: disable=line-too-long
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __contains__(self, orm: t.Type[Base]) -> bool:
+        return orm in self.tables
+
+    def replace(self, orm: t.Type[Base], frame: pd.DataFrame) -> "RealtimeStore":
+        """a new store with `orm`'s table replaced by the snapshot `frame`"""
+        return self.__class__(
+            self.tables | {orm: RealtimeTable(orm, frame)}, self.delays
+        )
+
+    def derive(self, orm: t.Type[Base], derived: pd.DataFrame) -> "RealtimeStore":
+        """a new store with the columns of `derived` added to `orm`'s table"""
+        return self.__class__(
+            self.tables | {orm: self.tables[orm].derive(derived)}, self.delays
+        )
+
+    def _links(self, orm: t.Type[Base], *include: str) -> dict[str, t.Any]:
+        """relationships in `include` from `orm` to another table in the store"""
+        return {
+            name: rel
+            for name, rel in orm.__mapper__.relationships.items()
+            if name in include and rel.mapper.class_ in self.tables
+        }
+
+    def instances(
+        self,
+        session: saorm.Session,
+        orm: t.Type[Base],
+        positions: t.Iterable[int],
+        *include: str,
+    ) -> list[Base]:
+        """the rows at `positions` as persistent instances in `session`.
+
+        an instance already in the session is reused. new ones get the \
+            table's derived columns: `orm.__enriched__` as attributes and \
+            the rest as its `json_fields`; without them, they run their \
+            `reconstructor` like rows loaded from the database.
+
+        Args:
+            session (Session): session to attach them to
+            orm (type[Base]): realtime table
+            positions (Iterable[int]): row positions, e.g. from `select`
+            *include (str): relationships to other realtime tables to fill
+        Returns:
+            list[Base]: instances, in the order of `positions`
+        """
+        # pylint: disable=too-many-locals
+        table = self.tables[orm]
+        links = self._links(orm, *include)
+        instances: list[Base] = []
+        for position in positions:
+            row = table.row(position)
+            key = saorm.util.identity_key(orm, tuple(row[k] for k in orm.primary_keys))
+            if (instance := session.identity_map.get(key)) is not None:
+                instances.append(instance)
+                continue
+            instance = orm(**{col: row[col] for col in orm.cols if col in row})
+            saorm.make_transient_to_detached(instance)
+            session.add(instance)
+            for name, rel in links.items():
+                related = self.tables[rel.mapper.class_].select(
+                    **{
+                        remote.key: row[local.key]
+                        for local, remote in rel.local_remote_pairs
+                    }
+                )
+                related = self.instances(session, rel.mapper.class_, related)
+                set_committed_value(
+                    instance,
+                    name,
+                    related if rel.uselist else next(iter(related), None),
+                )
+            if table.derived:
+                for col in table.derived:
+                    if col not in orm.__enriched__:
+                        continue
+                    if col not in orm.cols:
+                        setattr(instance, col, row[col])
+                instance._json_fields = {  # pylint: disable=protected-access
+                    col: row[col]
+                    for col in table.derived
+                    if col not in orm.__enriched__
+                }
+            elif callable(reconstruct := getattr(instance, "_init_on_load_", None)):
+                reconstruct()
+            instances.append(instance)
+        return instances
+
+    def query(
+        self, session: saorm.Session, orm: t.Type[Base], *include: str, **equals: t.Any
+    ) -> list[Base]:
+        """the rows of `orm` where every column equals its value, as instances.
+
+        Args:
+            session (Session): session to attach them to
+            orm (type[Base]): realtime table in the store
+            *include (str): relationships to other realtime tables to fill
+            **equals: column -> value
+        Returns:
+            list[Base]: instances
+        """
+        return self.instances(session, orm, self.tables[orm].select(**equals), *include)
@@ -0,0 +1,467 @@
+"""ScheduleSnapshot class."""
+
+import datetime as dt
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import typing as t
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+from ..helper_functions import get_date
+from ..helper_functions.types import PathLike
+
+
+def intern(values: pd.Series, ids: np.ndarray) -> np.ndarray:
+    """replaces `values` by their position in the sorted `ids`; -1 if missing.
+
+    Args:
+        values (pd.Series): ids to intern
+        ids (np.ndarray): sorted, unique ids
+    Returns:
+        np.ndarray: int32 codes
+    """
+    values = values.fillna("").astype(str).to_numpy(dtype=ids.dtype)
+    codes = np.searchsorted(ids, values).clip(max=max(len(ids) - 1, 0))
+    found = ids[codes] == values if len(ids) else np.zeros(len(values), bool)
+    return np.where(found, codes, -1).astype(np.int32)
+
+
+def offsets(codes: np.ndarray, size: int) -> np.ndarray:
+    """start of each code's rows in `codes`, which must be sorted.
+
+    rows of code `i` are `offsets[i]:offsets[i + 1]`.
+
+    Args:
+        codes (np.ndarray): sorted codes
+        size (int): number of codes
+    Returns:
+        np.ndarray: int64 offsets, of length `size + 1`
+    """
+    return np.searchsorted(codes, np.arange(size + 1)).astype(np.int64)
+
+
+def times_to_seconds(times: pd.Series) -> np.ndarray:
+    """vectorized `to_seconds`; null times become -1.
+
+    Args:
+        times (pd.Series): HH:MM:SS strings, hours can be past 24
+    Returns:
+        np.ndarray: int32 seconds past midnight
+    """
+    parts = times.fillna("-1:0:0").astype(str).str.split(":", expand=True)
+    hours, minutes, seconds = (parts[i].astype(np.int32) for i in range(3))
+    return np.where(hours < 0, -1, hours * 3600 + minutes * 60 + seconds).astype(
+        np.int32
+    )
+
+
+class ScheduleSnapshot:
+    """Read-only, columnar copy of the schedule, memory-mapped from `.npy` files.
+
+    every column is its own `{table}.{column}.npy` under the snapshot \
+        directory. string ids are interned: `stop.stop_id`, `trip.trip_id`, \
+        `route.route_id`, `shape.shape_id` and `calendar.service_id` are \
+        sorted string arrays, and every other table refers to them by int32 \
+        position. `stop_time` rows are sorted by stop then departure, `trip` \
+        rows by route and `shape_point` rows by shape, with `*.offsets` \
+        arrays giving each id's slice, so lookups never scan.
+
+    `calendar.days` holds which services run on each of the `DAYS` service \
+        days from the snapshot's `date`.
+
+    since the arrays are mapped read-only, processes that load the same \
+        snapshot share its pages through the OS page cache. `export` writes \
+        a new `{path}.{generation}` directory and only then makes it the \
+        newest, so a snapshot is never read half written.
+
+    Args:
+        path (PathLike): snapshot directory
+    """
+
+    VERSION = 1
+    DAYS = 8
+    """service days covered by `calendar.days`, from the snapshot's `date`"""
+
+    META_FILE = "meta.json"
+
+    QUERIES = {
+        "stop": "SELECT stop_id, stop_name, stop_lat, stop_lon, "
+        "parent_station, location_type FROM stop",
+        "route": "SELECT route_id, route_type, route_short_name, "
+        "route_long_name, route_color FROM route",
+        "calendar": "SELECT * FROM calendar",
+        "calendar_date": "SELECT service_id, date, exception_type FROM calendar_date",
+        "trip": "SELECT trip_id, route_id, service_id, shape_id, "
+        "direction_id, trip_headsign FROM trip",
+        "stop_time": "SELECT trip_id, stop_id, stop_sequence, "
+        "arrival_time, departure_time FROM stop_time",
+        "shape": "SELECT shape_id FROM shape",
+        "shape_point": "SELECT shape_id, shape_pt_lat, shape_pt_lon "
+        "FROM shape_point ORDER BY shape_id, shape_pt_sequence",
+    }
+    """schedule rows read by `export`, by table"""
+
+    @classmethod
+    def generations(cls, path: PathLike) -> list[str]:
+        """complete snapshot directories for `path`, oldest first.
+
+        Args:
+            path (PathLike): snapshot path, without generation
+        Returns:
+            list[str]: directories
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        pattern = re.compile(rf"{re.escape(name)}\.(\d+)")
+        found = [
+            (int(match.group(1)), os.path.join(directory, entry))
+            for entry in os.listdir(directory)
+            if (match := pattern.fullmatch(entry))
+            and os.path.exists(os.path.join(directory, entry, cls.META_FILE))
+        ]
+        return [p for _, p in sorted(found)]
+
+    @classmethod
+    def load(cls, path: PathLike) -> t.Self:
+        """maps the newest snapshot written to `path`.
+
+        Args:
+            path (PathLike): snapshot path, without generation
+        Returns:
+            ScheduleSnapshot: the snapshot
+        Raises:
+            FileNotFoundError: if no snapshot was exported to `path`
+        """
+        if not (generations := cls.generations(path)):
+            raise FileNotFoundError(f"no snapshot at {path}")
+        return cls(generations[-1])
+
+    @classmethod
+    def export(
+        cls, engine: sa.Engine, path: PathLike, date: dt.datetime | None = None
+    ) -> t.Self:
+        """writes a snapshot of the schedule in `engine`, \
+            keeping the previous one for processes still mapping it.
+
+        Args:
+            engine (sa.Engine): schedule database
+            path (PathLike): snapshot path, without generation
+            date (datetime, optional): first service day. Defaults to today.
+        Returns:
+            ScheduleSnapshot: the new snapshot
+        """
+        date = date or get_date()
+        with engine.connect() as conn:
+            frames: dict[str, pd.DataFrame] = {
+                table: pd.read_sql(sa.text(sql), conn)
+                for table, sql in cls.QUERIES.items()
+            }
+        columns = cls._columns(frames, date)
+
+        directory = f"{os.path.abspath(path)}.{time.time_ns()}"
+        os.makedirs(directory)
+        for name, array in columns.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        # written last: a directory without meta isn't a snapshot yet
+        with open(
+            os.path.join(directory, cls.META_FILE), "w", encoding="utf-8"
+        ) as file:
+            json.dump(
+                {
+                    "version": cls.VERSION,
+                    "date": date.strftime("%Y%m%d"),
+                    "database": engine.url.database,
+                    "rows": {k: len(v) for k, v in columns.items()},
+                },
+                file,
+            )
+        for old in cls.generations(path)[:-2]:
+            shutil.rmtree(old, ignore_errors=True)
+        logging.info("Exported snapshot %s", directory)
+        return cls(directory)
+
+    @classmethod
+    def _columns(
+        cls, frames: dict[str, pd.DataFrame], date: dt.datetime
+    ) -> dict[str, np.ndarray]:
+        """the snapshot's arrays, from the rows of `QUERIES`.
+
+        Args:
+            frames (dict[str, pd.DataFrame]): rows by table
+            date (datetime): first service day
+        Returns:
+            dict[str, np.ndarray]: arrays by `{table}.{column}`
+        """
+        ids = {
+            table: np.unique(frames[table][column].astype(str).to_numpy(str))
+            for table, column in {
+                "stop": "stop_id",
+                "route": "route_id",
+                "calendar": "service_id",
+                "trip": "trip_id",
+                "shape": "shape_id",
+            }.items()
+        }
+        columns: dict[str, np.ndarray] = {f"{k}.id": v for k, v in ids.items()}
+
+        stop = frames["stop"].sort_values("stop_id")
+        columns |= {
+            "stop.name": stop["stop_name"].fillna("").to_numpy(str),
+            "stop.coords": stop[["stop_lat", "stop_lon"]].to_numpy(np.float64),
+            "stop.parent": intern(stop["parent_station"], ids["stop"]),
+            "stop.location_type": stop["location_type"].fillna("").to_numpy(str),
+        }
+        route = frames["route"].sort_values("route_id")
+        columns |= {
+            f"route.{c.removeprefix('route_')}": route[c].fillna("").to_numpy(str)
+            for c in [
+                "route_type",
+                "route_short_name",
+                "route_long_name",
+                "route_color",
+            ]
+        }
+        columns["calendar.days"] = cls._service_days(
+            frames["calendar"], frames["calendar_date"], ids["calendar"], date
+        )
+
+        trip = frames["trip"].sort_values("trip_id")
+        trip_route = intern(trip["route_id"], ids["route"])
+        order = np.argsort(trip_route, kind="stable")
+        columns |= {
+            "trip.route": trip_route,
+            "trip.service": intern(trip["service_id"], ids["calendar"]),
+            "trip.shape": intern(trip["shape_id"], ids["shape"]),
+            "trip.direction": trip["direction_id"].fillna(-1).to_numpy(np.int8),
+            "trip.headsign": trip["trip_headsign"].fillna("").to_numpy(str),
+            "trip.by_route": order.astype(np.int32),
+            "trip.offsets": offsets(trip_route[order], len(ids["route"])),
+        }
+
+        stop_time = frames["stop_time"]
+        stop_codes = intern(stop_time["stop_id"], ids["stop"])
+        departures = times_to_seconds(stop_time["departure_time"])
+        order = np.lexsort((departures, stop_codes))
+        columns |= {
+            "stop_time.trip": intern(stop_time["trip_id"], ids["trip"])[order],
+            "stop_time.stop_sequence": stop_time["stop_sequence"].to_numpy(np.int32)[
+                order
+            ],
+            "stop_time.arrival": times_to_seconds(stop_time["arrival_time"])[order],
+            "stop_time.departure": departures[order],
+            "stop_time.offsets": offsets(stop_codes[order], len(ids["stop"])),
+        }
+
+        shape_point = frames["shape_point"]
+        columns |= {
+            "shape_point.coords": shape_point[
+                ["shape_pt_lat", "shape_pt_lon"]
+            ].to_numpy(np.float64),
+            "shape_point.offsets": offsets(
+                intern(shape_point["shape_id"], ids["shape"]), len(ids["shape"])
+            ),
+        }
+        return columns
+
+    @classmethod
+    def _service_days(
+        cls,
+        calendar: pd.DataFrame,
+        calendar_date: pd.DataFrame,
+        service_ids: np.ndarray,
+        date: dt.datetime,
+    ) -> np.ndarray:
+        """which services run on each of the `DAYS` days from `date`, \
+            with the same rules as `Calendar.operates_on`.
+
+        Args:
+            calendar (pd.DataFrame): calendar rows
+            calendar_date (pd.DataFrame): calendar_date rows
+            service_ids (np.ndarray): interned service ids
+            date (datetime): first service day
+        Returns:
+            np.ndarray: bool array of shape `(len(service_ids), DAYS)`
+        """
+        calendar = calendar.set_index(calendar["service_id"].astype(str)).reindex(
+            service_ids
+        )
+        start = pd.to_datetime(calendar["start_date"].astype(str), format="mixed")
+        end = pd.to_datetime(calendar["end_date"].astype(str), format="mixed")
+        exceptions = calendar_date.assign(
+            date=pd.to_datetime(calendar_date["date"].astype(str), format="mixed"),
+            service=intern(calendar_date["service_id"], service_ids),
+        )
+        days = np.zeros((len(service_ids), cls.DAYS), dtype=bool)
+        for i in range(cls.DAYS):
+            day = pd.Timestamp((date + dt.timedelta(days=i)).strftime("%Y%m%d"))
+            weekday = calendar[day.strftime("%A").lower()].fillna(0).astype(bool)
+            days[:, i] = ((start <= day) & (day <= end) & weekday).to_numpy()
+            cls._apply_exceptions(days[:, i], exceptions[exceptions["date"] == day])
+        return days
+
+    @staticmethod
+    def _apply_exceptions(day: np.ndarray, exceptions: pd.DataFrame) -> None:
+        """removes (type 2), then adds (type 1) the services of a day's \
+            `calendar_date` rows, in place.
+
+        Args:
+            day (np.ndarray): whether each service runs that day
+            exceptions (pd.DataFrame): the day's rows, with interned `service`
+        """
+        for exception_type, value in [("2", False), ("1", True)]:
+            service = exceptions.loc[
+                exceptions["exception_type"].astype(str) == exception_type, "service"
+            ]
+            day[service[service >= 0]] = value
+
+    def __init__(self, path: PathLike) -> None:
+        """Initializes ScheduleSnapshot.
+
+        Args:
+            path (PathLike): snapshot directory
+        """
+        self.path = path
+        with open(os.path.join(path, self.META_FILE), "r", encoding="utf-8") as file:
+            meta: dict[str, t.Any] = json.load(file)
+        if meta.get("version") != self.VERSION:
+            raise ValueError(f"{path}: unsupported snapshot version {meta}")
+        self.date = dt.datetime.strptime(meta["date"], "%Y%m%d").date()
+        self.database: str | None = meta.get("database")
+        """schedule database the snapshot was exported from"""
+        self.columns: dict[str, np.ndarray] = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in meta["rows"]
+        }
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.path}, date={self.date})>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """the mapped `{table}.{column}` array"""
+        return self.columns[name]
+
+    def code(self, table: str, _id: str) -> int:
+        """interned code of `_id` in `table`.
+
+        Args:
+            table (str): stop, route, calendar, trip or shape
+            _id (str): id to look up
+        Returns:
+            int: position in `{table}.id`
+        Raises:
+            KeyError: if `_id` isn't in the snapshot
+        """
+        ids = self.columns[f"{table}.id"]
+        code = int(np.searchsorted(ids, _id))
+        if code >= len(ids) or ids[code] != _id:
+            raise KeyError(f"{table} {_id} not in snapshot")
+        return code
+
+    def day(self, date: dt.datetime | dt.date | None = None) -> int:
+        """column of `calendar.days` for `date`.
+
+        Args:
+            date (datetime | date, optional): service day. Defaults to today.
+        Returns:
+            int: day index
+        Raises:
+            ValueError: if `date` is outside the snapshot
+        """
+        date = date or get_date()
+        if isinstance(date, dt.datetime):
+            date = date.date()
+        if not 0 <= (index := (date - self.date).days) < self.DAYS:
+            raise ValueError(f"{date} is outside snapshot of {self.date}")
+        return index
+
+    def _rows(self, table: str, code: int) -> slice:
+        """rows of `table` grouped under `code` by its offsets"""
+        table_offsets = self.columns[f"{table}.offsets"]
+        return slice(int(table_offsets[code]), int(table_offsets[code + 1]))
+
+    def stop_times(
+        self, stop_id: str, date: dt.datetime | dt.date | None = None
+    ) -> pd.DataFrame:
+        """stop times at `stop_id` (and its child stops) on a service day, \
+            ordered by departure.
+
+        Args:
+            stop_id (str): stop or parent station
+            date (datetime | date, optional): service day. Defaults to today.
+        Returns:
+            pd.DataFrame: trip_id, route_id, stop_id, stop_sequence, \
+                and arrival/departure in seconds past midnight
+        """
+        code, day = self.code("stop", stop_id), self.day(date)
+        stops = np.union1d([code], np.flatnonzero(self.columns["stop.parent"] == code))
+        rows = [self._rows("stop_time", int(s)) for s in stops]
+        trips = np.concatenate([self.columns["stop_time.trip"][r] for r in rows])
+        runs = self.columns["calendar.days"][self.columns["trip.service"][trips], day]
+        frame = pd.DataFrame(
+            {
+                "trip_id": self.columns["trip.id"][trips],
+                "route_id": self.columns["route.id"][self.columns["trip.route"][trips]],
+                "stop_id": self.columns["stop.id"][
+                    np.repeat(stops, [r.stop - r.start for r in rows])
+                ],
+            }
+            | {
+                column: np.concatenate(
+                    [self.columns[f"stop_time.{column}"][r] for r in rows]
+                )
+                for column in ["stop_sequence", "arrival", "departure"]
+            }
+        )[runs]
+        return frame.sort_values("departure", kind="stable", ignore_index=True)
+
+    def trips(
+        self, route_id: str, date: dt.datetime | dt.date | None = None
+    ) -> pd.DataFrame:
+        """trips of `route_id`, optionally only those running on `date`.
+
+        Args:
+            route_id (str): route
+            date (datetime | date, optional): service day. Defaults to every day.
+        Returns:
+            pd.DataFrame: trip_id, service_id, shape_id, direction_id, trip_headsign
+        """
+        trips = self.columns["trip.by_route"][
+            self._rows("trip", self.code("route", route_id))
+        ]
+        if date is not None:
+            services = self.columns["trip.service"][trips]
+            trips = trips[self.columns["calendar.days"][services, self.day(date)]]
+        shapes = self.columns["trip.shape"][trips]
+        return pd.DataFrame(
+            {
+                "trip_id": self.columns["trip.id"][trips],
+                "service_id": self.columns["calendar.id"][
+                    self.columns["trip.service"][trips]
+                ],
+                "shape_id": np.where(
+                    shapes >= 0, self.columns["shape.id"][shapes.clip(min=0)], ""
+                ),
+                "direction_id": self.columns["trip.direction"][trips],
+                "trip_headsign": self.columns["trip.headsign"][trips],
+            }
+        )
+
+    def shape(self, shape_id: str) -> np.ndarray:
+        """coordinates of `shape_id`, in sequence; a view of the mapped array.
+
+        Args:
+            shape_id (str): shape
+        Returns:
+            np.ndarray: `(n, 2)` array of lat, lon
+        """
+        return self.columns["shape_point.coords"][
+            self._rows("shape_point", self.code("shape", shape_id))
+        ]
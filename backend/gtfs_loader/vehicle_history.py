@@ -0,0 +1,248 @@
+"""VehicleHistory class."""
+
+import threading
+import time
+import typing as t
+
+import geojson as gj
+import numpy as np
+import pandas as pd
+
+
+class VehicleHistory:
+    """Recent positions of every vehicle, in a fixed amount of memory.
+
+    - positions are rows of preallocated column arrays, used as one ring: \
+        once it's full, the oldest rows are overwritten
+    - the ring holds `max_bytes` worth of rows; positions older than \
+        `minutes` are never returned, even if they're still in it
+    - a vehicle's position is recorded when its timestamp changes, \
+        so feeds imported faster than vehicles report add nothing; \
+        positions already older than `minutes` aren't recorded
+    - vehicle, route and trip ids are stored as codes into small id tables, \
+        rebuilt from the rows in the window when they grow past `MAX_IDS`
+
+    Args:
+        minutes (float, optional): how far back positions are kept. \
+            Defaults to `MINUTES`.
+        max_bytes (int, optional): memory for the rows. Defaults to `MAX_BYTES`.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    COLUMNS: dict[str, type[np.generic]] = {
+        "vehicle": np.int32,
+        "route": np.int32,
+        "trip": np.int32,
+        "timestamp": np.int64,
+        "latitude": np.float64,
+        "longitude": np.float64,
+        "bearing": np.float32,
+        "speed": np.float32,
+        "current_stop_sequence": np.int32,
+    }
+    """row columns; ids are codes, nulls are -1 or NaN"""
+    IDS = {"vehicle": "vehicle_id", "route": "route_id", "trip": "trip_id"}
+    """columns stored as codes, and the snapshot columns they're from"""
+    MINUTES = 30.0
+    MAX_BYTES = 32 * 2**20
+    MAX_IDS = 2**16
+    """vehicle, route or trip ids kept before the id tables are rebuilt"""
+
+    def __init__(self, minutes: float = MINUTES, max_bytes: int = MAX_BYTES) -> None:
+        """Initializes VehicleHistory.
+
+        Args:
+            minutes (float, optional): how far back positions are kept. \
+                Defaults to `MINUTES`.
+            max_bytes (int, optional): memory for the rows. Defaults to `MAX_BYTES`.
+        """
+        self.minutes = minutes
+        row_bytes = sum(np.dtype(dtype).itemsize for dtype in self.COLUMNS.values())
+        self.capacity = max(max_bytes // row_bytes, 1)
+        """rows the ring holds"""
+        self.columns: dict[str, np.ndarray] = {
+            name: np.zeros(self.capacity, dtype) for name, dtype in self.COLUMNS.items()
+        }
+        self.size = 0
+        """rows written, up to `capacity`"""
+        self._next = 0
+        """position of the next row"""
+        self._ids: dict[str, list[str]] = {name: [] for name in self.IDS}
+        self._codes: dict[str, dict[str, int]] = {name: {} for name in self.IDS}
+        self._last: dict[str, int] = {}
+        """last timestamp recorded per vehicle"""
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.size}/{self.capacity} rows)>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        """memory used by the rows"""
+        return sum(column.nbytes for column in self.columns.values())
+
+    def _intern(self, name: str, values: pd.Series) -> np.ndarray:
+        """codes of `values` in the `name` id table, adding new ids; -1 for null"""
+        codes, ids = self._codes[name], self._ids[name]
+        for value in values.dropna().unique():
+            if value not in codes:
+                codes[value] = len(ids)
+                ids.append(value)
+        return values.map(codes).fillna(-1).to_numpy(np.int32)
+
+    def record(self, vehicles: pd.DataFrame, now: float | None = None) -> int:
+        """appends the positions in a vehicle snapshot that are new.
+
+        Args:
+            vehicles (pd.DataFrame): vehicle snapshot, like `RealtimeDiff.snapshot`
+            now (float, optional): time of the snapshot, for vehicles \
+                without a timestamp. Defaults to now.
+        Returns:
+            int: positions recorded
+        """
+        now = time.time() if now is None else now
+        oldest = now - self.minutes * 60
+        timestamps = vehicles["timestamp"].astype(float).fillna(now).astype(np.int64)
+        last = vehicles["vehicle_id"].map(self._last).fillna(-1)
+        new = vehicles[
+            (timestamps > last)
+            & (timestamps >= oldest)  # else `_last` forgets it, and it's re-added
+            & vehicles["vehicle_id"].notna()
+        ]
+        new = new.iloc[-self.capacity :]
+        timestamps = timestamps[new.index]
+        if new.empty:
+            return 0
+        with self._lock:
+            if max(len(ids) for ids in self._ids.values()) > self.MAX_IDS:
+                self._rebuild_ids(now)
+            rows = (self._next + np.arange(len(new))) % self.capacity
+            values = {
+                name: self._intern(name, new[col]) for name, col in self.IDS.items()
+            } | {
+                "timestamp": timestamps.to_numpy(),
+                "latitude": new["latitude"].astype(float).to_numpy(),
+                "longitude": new["longitude"].astype(float).to_numpy(),
+                "bearing": new["bearing"].astype(float).to_numpy(),
+                "speed": new["speed"].astype(float).to_numpy(),
+                "current_stop_sequence": new["current_stop_sequence"]
+                .astype(float)
+                .fillna(-1)
+                .to_numpy(),
+            }
+            for name, column in values.items():
+                self.columns[name][rows] = column
+            self._next = int(rows[-1] + 1) % self.capacity
+            self.size = min(self.size + len(new), self.capacity)
+            self._last.update(zip(new["vehicle_id"], timestamps))
+            self._last = {k: v for k, v in self._last.items() if v >= oldest}
+        return len(new)
+
+    def _rebuild_ids(self, now: float) -> None:
+        """renumbers the ids of the rows in the window, forgetting the rest"""
+        window = np.flatnonzero(self._window(now, self.minutes))
+        for name in self._ids:
+            codes = self.columns[name]
+            used = np.unique(codes[window][codes[window] >= 0])
+            renumber = np.full(len(self._ids[name]), -1, np.int32)
+            renumber[used] = np.arange(len(used))
+            codes[window] = np.where(codes[window] >= 0, renumber[codes[window]], -1)
+            self._ids[name] = [self._ids[name][code] for code in used]
+            self._codes[name] = {_id: i for i, _id in enumerate(self._ids[name])}
+        keep = np.zeros(self.capacity, bool)
+        keep[window] = True
+        self.columns["timestamp"][~keep] = np.iinfo(np.int64).min  # out of window
+
+    def _window(self, now: float, minutes: float) -> np.ndarray:
+        """mask of the rows written in the last `minutes`"""
+        mask = self.columns["timestamp"] >= now - minutes * 60
+        mask[self.size :] = False
+        return mask
+
+    def query(
+        self,
+        minutes: float | None = None,
+        vehicle_ids: t.Iterable[str] | None = None,
+        now: float | None = None,
+    ) -> pd.DataFrame:
+        """recent positions, by vehicle and then time.
+
+        Args:
+            minutes (float, optional): how far back, at most `minutes`. \
+                Defaults to all of it.
+            vehicle_ids (Iterable[str], optional): only these vehicles
+            now (float, optional): end of the window. Defaults to now.
+        Returns:
+            pd.DataFrame: vehicle_id, route_id, trip_id and the other `COLUMNS`
+        """
+        now = time.time() if now is None else now
+        minutes = min(minutes or self.minutes, self.minutes)
+        with self._lock:
+            mask = self._window(now, minutes)
+            if vehicle_ids is not None:
+                codes = self._codes["vehicle"]
+                mask &= np.isin(
+                    self.columns["vehicle"],
+                    [codes[i] for i in vehicle_ids if i in codes],
+                )
+            rows = {name: column[mask] for name, column in self.columns.items()}
+            ids = {  # code -1, for null, is the last one
+                name: np.array(self._ids[name] + [None], dtype=object)
+                for name in self.IDS
+            }
+        order = np.lexsort((rows["timestamp"], rows["vehicle"]))
+        frame = pd.DataFrame({name: column[order] for name, column in rows.items()})
+        return frame.assign(
+            **{name: ids[name][frame[name]] for name in self.IDS}
+        ).rename(columns=self.IDS)
+
+    @staticmethod
+    def as_features(history: pd.DataFrame) -> gj.FeatureCollection:
+        """positions from `query` as one feature per vehicle: \
+            its trail as a linestring, oldest first, and the other \
+            columns as lists in its properties.
+
+        Args:
+            history (pd.DataFrame): positions from `query`
+        Returns:
+            gj.FeatureCollection: the trails
+        """
+        history = history.astype(
+            {"bearing": float, "speed": float, "current_stop_sequence": object}
+        )
+        history["current_stop_sequence"] = history["current_stop_sequence"].mask(
+            history["current_stop_sequence"] < 0
+        )
+        history = history.astype(object).where(history.notna(), None)
+        features = []
+        for vehicle_id, trail in history.groupby("vehicle_id", sort=False):
+            features.append(
+                gj.Feature(
+                    id=vehicle_id,
+                    geometry=gj.LineString(
+                        list(zip(trail["longitude"], trail["latitude"]))
+                    ),
+                    properties={
+                        "vehicle_id": vehicle_id,
+                        "route_id": trail["route_id"].iloc[-1],
+                        "trip_id": trail["trip_id"].iloc[-1],
+                    }
+                    | {
+                        col: trail[col].tolist()
+                        for col in [
+                            "timestamp",
+                            "bearing",
+                            "speed",
+                            "current_stop_sequence",
+                        ]
+                    },
+                )
+            )
+        return gj.FeatureCollection(features)
@@ -25,17 +25,18 @@ class Alert(Base):
 
     __tablename__ = "alert"
     __realtime_name__ = "service_alerts"
+    __volatile__ = ("timestamp",)
 
     alert_id: Mapped[str] = mapped_column(primary_key=True)
     cause: Mapped[t.Optional[str]]
     effect: Mapped[t.Optional[str]]
     severity: Mapped[t.Optional[str]]
-    stop_id: Mapped[t.Optional[str]]
+    stop_id: Mapped[t.Optional[str]] = mapped_column(index=True)
     agency_id: Mapped[t.Optional[str]]
-    route_id: Mapped[t.Optional[str]]
+    route_id: Mapped[t.Optional[str]] = mapped_column(index=True)
     route_type: Mapped[t.Optional[str]]
     direction_id: Mapped[t.Optional[str]]
-    trip_id: Mapped[t.Optional[str]]
+    trip_id: Mapped[t.Optional[str]] = mapped_column(index=True)
     active_period_end: Mapped[t.Optional[int]]
     header: Mapped[t.Optional[str]]
     description: Mapped[t.Optional[str]]
@@ -1,14 +1,25 @@
 """Holds the base class for all GTFS elements"""
 
+import datetime as dt
 import json
 import typing as t
 
 from sqlalchemy import orm
 
 from ..helper_functions import classproperty
+from ..helper_functions.types import ConflictPolicy
 
 # pylint: disable=unused-argument
 
+CSV_DTYPES: dict[type, str] = {
+    str: "string",
+    int: "int64",
+    float: "double",
+    bool: "bool",
+    dt.datetime: "string",  # YYYYMMDD, as stored
+}
+"""python type -> arrow type name, for `ChunkReader`"""
+
 
 class Base(orm.DeclarativeBase):
     """Base class for all GTFS elements
@@ -18,12 +29,29 @@ class Base(orm.DeclarativeBase):
         __table_args__ (dict[str, Any]): table arguments
         __filename__ (str): name of the associated txt file, if applicable
         __realtime_name__ (str): name of the realtime operation in LinkedDatasets, if applicable
+        __conflict__ (ConflictPolicy): what bulk inserts do with duplicate primary keys
+        __categoricals__ (tuple[str, ...]): low-cardinality columns read as dictionaries
+        __natural_key__ (tuple[str, ...]): columns realtime snapshots are diffed on
+        __volatile__ (tuple[str, ...]): realtime columns ignored when diffing
+        __enriched__ (tuple[str, ...]): realtime attributes derived per snapshot
     """
 
     __filename__: str
     """name of the file within the gtfs feed"""
     __realtime_name__: str
     """only used for realtime orms"""
+    __conflict__: ConflictPolicy = "ignore"
+    """conflict policy for bulk inserts; duplicates are skipped by default"""
+    __categoricals__: tuple[str, ...] = ()
+    """string columns with few distinct values, read by arrow as dictionaries"""
+    __natural_key__: tuple[str, ...] = ()
+    """identifies a realtime row across feeds; the primary keys by default"""
+    __volatile__: tuple[str, ...] = ()
+    """realtime columns that change with every feed, like the header timestamp; \
+        a row isn't rewritten for them alone"""
+    __enriched__: tuple[str, ...] = ()
+    """realtime attributes the reconstructor derives from other tables; \
+        rows served from the `RealtimeStore` get them from its enrichment instead"""
     # __table_args__ = {"sqlite_autoincrement": False, "sqlite_with_rowid": False}
 
     # pylint: disable=no-self-argument
@@ -37,6 +65,22 @@ class Base(orm.DeclarativeBase):
         """list of string columns for the class."""
         return cls.__table__.columns.keys()
 
+    @classmethod
+    def csv_dtypes(cls: t.Type[t.Self]) -> dict[str, str]:
+        """arrow types for the class's file, derived from its column types.
+
+        Returns:
+            dict[str, str]: column name -> arrow type name, or `category`
+        """
+        return {
+            column.name: (
+                "category"
+                if column.name in cls.__categoricals__
+                else CSV_DTYPES.get(column.type.python_type, CSV_DTYPES[str])
+            )
+            for column in cls.__table__.columns
+        }
+
     @classmethod
     def from_dict(cls: t.Type[t.Self], data: dict[str, t.Any]) -> t.Self:
         """Creates an instance of the class from a dictionary.
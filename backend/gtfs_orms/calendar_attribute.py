@@ -25,6 +25,7 @@ class CalendarAttribute(Base):
 
     __tablename__ = "calendar_attribute"
     __filename__ = "calendar_attributes.txt"
+    __categoricals__ = ("service_schedule_type", "service_schedule_typicality")
 
     service_id: Mapped[str] = mapped_column(
         ForeignKey("calendar.service_id", onupdate="CASCADE", ondelete="CASCADE"),
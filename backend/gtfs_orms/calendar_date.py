@@ -27,6 +27,7 @@ class CalendarDate(Base):  # pylint: disable=too-few-public-methods
 
     __tablename__ = "calendar_date"
     __filename__ = "calendar_dates.txt"
+    __categoricals__ = ("exception_type",)
 
     service_id: Mapped[str] = mapped_column(
         ForeignKey("calendar.service_id", onupdate="CASCADE", ondelete="CASCADE"),
@@ -31,6 +31,7 @@ class Facility(Base):
 
     __tablename__ = "facility"
     __filename__ = "facilities.txt"
+    __categoricals__ = ("facility_type",)
 
     facility_id: Mapped[str] = mapped_column(primary_key=True)
     facility_code: Mapped[t.Optional[str]]
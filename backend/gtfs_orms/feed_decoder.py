@@ -0,0 +1,279 @@
+"""FeedDecoder class."""
+
+# pylint: disable=no-name-in-module
+import typing as t
+
+import numpy as np
+import pandas as pd
+from google.transit.gtfs_realtime_pb2 import Alert as AlertMessage
+from google.transit.gtfs_realtime_pb2 import FeedMessage, VehiclePosition
+
+if t.TYPE_CHECKING:
+    # pylint: disable=shadowed-import
+    from google.protobuf.message import Message as FeedMessage
+
+
+def _enum_names(enum: t.Any) -> dict[int, str]:
+    """maps the numbers of a protobuf enum wrapper to their names"""
+    return {value.number: value.name for value in enum.DESCRIPTOR.values}
+
+
+def _optional(message: t.Any, field: str) -> t.Any:
+    """`message.field` if it's set, else `None`"""
+    return getattr(message, field) if message.HasField(field) else None
+
+
+def _floats(values: list[float | None]) -> np.ndarray:
+    """float32 protobuf values as float64, rounded to their shortest repr \
+        like `json_format` does, so coordinates don't gain noise digits"""
+    return (
+        np.array([np.nan if v is None else v for v in values], dtype=np.float32)
+        .astype(str)
+        .astype(np.float64)
+    )
+
+
+def _translation(text: t.Any, language: str = "en") -> str | None:
+    """the `language` translation of a `TranslatedString`, if any"""
+    return next((tr.text for tr in text.translation if tr.language == language), None)
+
+
+class FeedDecoder:
+    """Decodes a GTFS-realtime `FeedMessage` straight into columns.
+
+    each feed is walked once, appending to one list per column, without \
+        `MessageToDict` or `json_normalize`; columns come out named like \
+        the realtime orms, with unset optional fields as nulls and enums \
+        as their names.
+
+    https://github.com/google/transit/blob/master/gtfs-realtime/spec/en/reference.md
+    """
+
+    VEHICLE_STATUS = _enum_names(VehiclePosition.VehicleStopStatus)
+    OCCUPANCY_STATUS = _enum_names(VehiclePosition.OccupancyStatus)
+    CAUSE = _enum_names(AlertMessage.Cause)
+    EFFECT = _enum_names(AlertMessage.Effect)
+    SEVERITY = _enum_names(AlertMessage.SeverityLevel)
+
+    INT_COLUMNS = {
+        "arrival_time",
+        "departure_time",
+        "direction_id",
+        "stop_sequence",
+        "current_stop_sequence",
+        "occupancy_percentage",
+        "timestamp",
+        "active_period_start",
+        "active_period_end",
+    }
+    """columns built as nullable `Int64`"""
+
+    @classmethod
+    def _frame(cls, columns: dict[str, list[t.Any]]) -> pd.DataFrame:
+        """builds the dataframe, typing int columns as nullable `Int64`"""
+        return pd.DataFrame(
+            {
+                name: (
+                    pd.array(values, dtype="Int64")
+                    if name in cls.INT_COLUMNS
+                    else values
+                )
+                for name, values in columns.items()
+            }
+        )
+
+    @classmethod
+    def vehicles(cls, message: FeedMessage) -> pd.DataFrame:
+        """one row per vehicle position, like the `vehicle` table.
+
+        Args:
+            message (FeedMessage): parsed VehiclePositions feed
+        Returns:
+            pd.DataFrame: vehicles
+        """
+        header_timestamp = _optional(message.header, "timestamp")
+        columns: dict[str, list[t.Any]] = {
+            name: []
+            for name in [
+                "vehicle_id",
+                "trip_id",
+                "route_id",
+                "direction_id",
+                "current_stop_sequence",
+                "current_status",
+                "timestamp",
+                "stop_id",
+                "label",
+                "occupancy_status",
+                "occupancy_percentage",
+            ]
+        }
+        coordinates: dict[str, list[float | None]] = {
+            name: [] for name in ["latitude", "longitude", "bearing", "speed"]
+        }
+        for entity in message.entity:
+            if not entity.HasField("vehicle"):
+                continue
+            vehicle, trip = entity.vehicle, entity.vehicle.trip
+            position = vehicle.position
+            status = _optional(vehicle, "current_status")
+            occupancy = _optional(vehicle, "occupancy_status")
+            columns["vehicle_id"].append(entity.id)
+            columns["trip_id"].append(_optional(trip, "trip_id"))
+            columns["route_id"].append(_optional(trip, "route_id"))
+            columns["direction_id"].append(_optional(trip, "direction_id"))
+            columns["current_stop_sequence"].append(
+                _optional(vehicle, "current_stop_sequence")
+            )
+            columns["current_status"].append(
+                None if status is None else cls.VEHICLE_STATUS[status]
+            )
+            columns["timestamp"].append(
+                vehicle.timestamp if vehicle.HasField("timestamp") else header_timestamp
+            )
+            columns["stop_id"].append(_optional(vehicle, "stop_id"))
+            columns["label"].append(_optional(vehicle.vehicle, "label"))
+            columns["occupancy_status"].append(
+                None if occupancy is None else cls.OCCUPANCY_STATUS[occupancy]
+            )
+            columns["occupancy_percentage"].append(
+                _optional(vehicle, "occupancy_percentage")
+            )
+            for name, values in coordinates.items():
+                values.append(_optional(position, name))
+        frame = cls._frame(columns)
+        for name, values in coordinates.items():
+            frame[name] = _floats(values)
+        return frame
+
+    @classmethod
+    def trip_updates(cls, message: FeedMessage) -> pd.DataFrame:
+        """one row per stop time update, like the `prediction` table. \
+            a trip update without any gets a single row with null stop fields.
+
+        Args:
+            message (FeedMessage): parsed TripUpdates feed
+        Returns:
+            pd.DataFrame: predictions
+        """
+        # pylint: disable=too-many-locals
+        timestamp = _optional(message.header, "timestamp")
+        columns: dict[str, list[t.Any]] = {
+            name: []
+            for name in [
+                "prediction_id",
+                "arrival_time",
+                "departure_time",
+                "direction_id",
+                "stop_sequence",
+                "route_id",
+                "stop_id",
+                "trip_id",
+                "vehicle_id",
+                "timestamp",
+            ]
+        }
+        arrival_time = columns["arrival_time"].append
+        departure_time = columns["departure_time"].append
+        stop_sequence = columns["stop_sequence"].append
+        stop_id = columns["stop_id"].append
+        for entity in message.entity:
+            if not entity.HasField("trip_update"):
+                continue
+            update, trip = entity.trip_update, entity.trip_update.trip
+            updates = update.stop_time_update or [None]
+            count = len(updates)
+            columns["prediction_id"] += [entity.id] * count
+            columns["direction_id"] += [_optional(trip, "direction_id")] * count
+            columns["route_id"] += [_optional(trip, "route_id")] * count
+            columns["trip_id"] += [_optional(trip, "trip_id")] * count
+            columns["vehicle_id"] += [_optional(update.vehicle, "id")] * count
+            columns["timestamp"] += [timestamp] * count
+            for stu in updates:  # the hot loop: ~20 per trip, inlined
+                if stu is None:
+                    arrival_time(None)
+                    departure_time(None)
+                    stop_sequence(0)
+                    stop_id(None)
+                    continue
+                arrival, departure = stu.arrival, stu.departure
+                arrival_time(arrival.time if arrival.HasField("time") else None)
+                departure_time(departure.time if departure.HasField("time") else None)
+                stop_sequence(stu.stop_sequence)
+                stop_id(stu.stop_id if stu.HasField("stop_id") else None)
+        return cls._frame(columns)
+
+    @classmethod
+    def alerts(cls, message: FeedMessage) -> pd.DataFrame:
+        """one row per informed entity and active period of each alert, \
+            like the `alert` table before it's deduplicated on `alert_id`.
+
+        Args:
+            message (FeedMessage): parsed Alerts feed
+        Returns:
+            pd.DataFrame: alerts
+        """
+        timestamp = _optional(message.header, "timestamp")
+        columns: dict[str, list[t.Any]] = {
+            name: []
+            for name in [
+                "alert_id",
+                "cause",
+                "effect",
+                "severity",
+                "stop_id",
+                "agency_id",
+                "route_id",
+                "route_type",
+                "direction_id",
+                "trip_id",
+                "active_period_start",
+                "active_period_end",
+                "header",
+                "description",
+                "url",
+                "timestamp",
+            ]
+        }
+        for entity in message.entity:
+            if not entity.HasField("alert"):
+                continue
+            alert = entity.alert
+            cause = _optional(alert, "cause")
+            effect = _optional(alert, "effect")
+            severity = _optional(alert, "severity_level")
+            shared = {
+                "alert_id": entity.id,
+                "cause": None if cause is None else cls.CAUSE[cause],
+                "effect": None if effect is None else cls.EFFECT[effect],
+                "severity": None if severity is None else cls.SEVERITY[severity],
+                "header": _translation(alert.header_text),
+                "description": _translation(alert.description_text),
+                "url": _translation(alert.url),
+                "timestamp": timestamp,
+            }
+            for informed in alert.informed_entity or [None]:
+                for period in alert.active_period or [None]:
+                    for name, value in shared.items():
+                        columns[name].append(value)
+                    for name in ["stop_id", "agency_id", "route_id", "route_type"]:
+                        columns[name].append(
+                            None if informed is None else _optional(informed, name)
+                        )
+                    columns["direction_id"].append(
+                        None
+                        if informed is None
+                        else _optional(informed, "direction_id")
+                    )
+                    columns["trip_id"].append(
+                        _optional(informed.trip, "trip_id")
+                        if informed is not None and informed.HasField("trip")
+                        else None
+                    )
+                    columns["active_period_start"].append(
+                        None if period is None else _optional(period, "start")
+                    )
+                    columns["active_period_end"].append(
+                        None if period is None else _optional(period, "end")
+                    )
+        return cls._frame(columns)
@@ -1,9 +1,11 @@
 """File to hold the LinkedDataset class and its associated methods."""
 
 # pylint: disable=no-name-in-module
+import hashlib
 import logging
 import typing as t
 
+import numpy as np
 import pandas as pd
 import requests as req
 from google.protobuf.json_format import MessageToDict
@@ -12,7 +14,7 @@ from sqlalchemy.orm import Mapped, mapped_column
 
 from ..helper_functions.misc import df_unpack
 from .base import Base
-import numpy as np
+from .feed_decoder import FeedDecoder
 
 if t.TYPE_CHECKING:
     # pylint: disable=shadowed-import
@@ -39,6 +41,9 @@ class LinkedDataset(Base):
 
     cache: dict[str, dict[str, t.Any]] = {}
     """Cache for linked datasets to avoid multiple requests."""
+    validators: dict[str, dict[str, t.Any]] = {}
+    """`etag`, `last_modified`, `sha256` and header `timestamp` of the last feed \
+        fetched per url, so unchanged feeds are skipped"""
 
     @property
     def rename_dict(self) -> dict[str, str]:
@@ -115,7 +120,12 @@ class LinkedDataset(Base):
             self.__class__.cache[key] = self.as_dict()
         return self.__class__.cache[key]
 
-    def as_dataframe(self, ignore_errors: bool = True, **kwargs) -> pd.DataFrame:
+    def forget_validators(self) -> None:
+        """forgets the last feed fetched, so the next one is decoded \
+            even if it hasn't changed; e.g. after it failed to load."""
+        self.__class__.validators.pop(self.url, None)
+
+    def as_dataframe(self, ignore_errors: bool = True, **kwargs) -> pd.DataFrame | None:
         """Returns realtime data from the linked dataset\
             as a dataframe.
             
@@ -124,7 +134,8 @@ class LinkedDataset(Base):
                 loading the dataframe. Defaults to True.
             kwargs: Additional keyword arguments passed to the request.
         Returns:
-            pd.DataFrame: Realtime data from the linked dataset.
+            pd.DataFrame | None: Realtime data from the linked dataset, \
+                `None` if the feed hasn't changed since it was last fetched.
         """
 
         if not ignore_errors:
@@ -135,36 +146,113 @@ class LinkedDataset(Base):
             logging.error("Error retrieving data from %s: %s", self.url, str(e))
             return pd.DataFrame()
 
-    def _as_dataframe(self, **kwargs) -> pd.DataFrame:
+    def _as_dataframe(self, **kwargs) -> pd.DataFrame | None:
         """Returns realtime data from the linked dataset as a dataframe.
         args:
             **kwargs: Additional keyword arguments passed to the request.
         Returns:
-            pd.DataFrame: Realtime data from the linked dataset."""
+            pd.DataFrame | None: Realtime data from the linked dataset, \
+                `None` if the feed hasn't changed."""
 
+        if (message := self._load_message(**kwargs)) is None:
+            return None
+        return self.decode(message)
+
+    def decode(self, message: FeedMessage, columnar: bool = True) -> pd.DataFrame:
+        """Returns a parsed feed of this linked dataset as a dataframe.
+
+        args:
+            message (FeedMessage): the parsed feed.
+            columnar (bool, optional): decode with `FeedDecoder`; otherwise \
+                through `MessageToDict` and `json_normalize`. Defaults to True.
+        Returns:
+            pd.DataFrame: Realtime data from the linked dataset.
+        """
+        if columnar:
+            return self._decode_columns(message)
         if self.trip_updates:
-            return self._process_trip_updates(**kwargs)
+            return self._process_trip_updates(message)
         if self.vehicle_positions:
-            return self._process_vehicle_positions(**kwargs)
+            return self._process_vehicle_positions(message)
         if self.service_alerts:
-            return self._process_service_alerts(**kwargs)
+            return self._process_service_alerts(message)
         return pd.DataFrame()
 
-    def _load_dataframe(self, **kwargs) -> pd.DataFrame:
-        """Returns realtime data from the linked dataset. any errors result in an empty dict
+    def _decode_columns(self, message: FeedMessage) -> pd.DataFrame:
+        """`decode` through `FeedDecoder`"""
+        if self.trip_updates:
+            return FeedDecoder.trip_updates(message)
+        if self.vehicle_positions:
+            dataframe = FeedDecoder.vehicles(message)
+        elif self.service_alerts:
+            dataframe = FeedDecoder.alerts(message)
+        else:
+            return pd.DataFrame()
+        return dataframe.drop_duplicates([self.rename_dict["id"]], ignore_index=True)
+
+    def _load_message(
+        self, session: req.Session | None = None, **kwargs
+    ) -> FeedMessage | None:
+        """Fetches and parses the feed of the linked dataset, \
+            unless it's the same as the last one fetched.
+
+        the feed is unchanged if the server answers the conditional request \
+            with `304`, if the payload hashes the same, or if its header \
+            timestamp hasn't moved past the last one.
 
         args:
+            session (req.Session, optional): session to request with, \
+                anything with its `get`. Defaults to a new connection.
             **kwargs: Additional keyword arguments passed to the request.
         Returns:
-            pd.DataFrame: Realtime data from the linked dataset.
+            FeedMessage | None: the parsed feed, `None` if it hasn't changed.
+        Raises:
+            req.HTTPError: if it couldn't be retrieved.
         """
+        last = self.__class__.validators.get(self.url, {})
+        headers = kwargs.pop("headers", {}) | {
+            header: last[key]
+            for header, key in [
+                ("If-None-Match", "etag"),
+                ("If-Modified-Since", "last_modified"),
+            ]
+            if last.get(key)
+        }
+        kwargs.setdefault("timeout", 10)
+        response = (session or req).get(self.url, headers=headers, **kwargs)
+        if response.status_code == 304:
+            logging.info("%s not modified, skipped", self.url)
+            return None
+        response.raise_for_status()
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": hashlib.sha256(response.content).hexdigest(),
+            "timestamp": last.get("timestamp"),
+        }
+        self.__class__.validators[self.url] = validators
+        if validators["sha256"] == last.get("sha256"):
+            logging.info("%s unchanged, skipped", self.url)
+            return None
         feed_entity = FeedMessage()
-        response = req.get(self.url, timeout=10, **kwargs)
-        if not response.ok:
-            logging.error("Error retrieving data from %s", self.url)
-            return pd.DataFrame()
-        logging.info("Retrieved data from %s", self.url)
         feed_entity.ParseFromString(response.content)
+        if feed_entity.header.HasField("timestamp"):
+            timestamp = feed_entity.header.timestamp
+            if last.get("timestamp") and timestamp <= last["timestamp"]:
+                logging.info("%s still at %s, skipped", self.url, last["timestamp"])
+                return None
+            validators["timestamp"] = timestamp
+        logging.info("Retrieved data from %s", self.url)
+        return feed_entity
+
+    def _load_dataframe(self, feed_entity: FeedMessage) -> pd.DataFrame:
+        """Returns a parsed feed as a normalized dataframe.
+
+        args:
+            feed_entity (FeedMessage): the parsed feed.
+        Returns:
+            pd.DataFrame: Realtime data from the linked dataset.
+        """
         if not hasattr(feed_entity, "entity"):
             logging.error("No data found in %s", self.url)
             return pd.DataFrame()
@@ -194,13 +282,17 @@ class LinkedDataset(Base):
         dataframe.rename(columns=self.rename_dict, inplace=True)
         return dataframe
 
-    def _process_trip_updates(self) -> pd.DataFrame:
+    def _process_trip_updates(self, message: FeedMessage) -> pd.DataFrame:
         """Returns realtime data from the linked dataset.
 
+        Args:
+            message (FeedMessage): the parsed feed.
         Returns:
             pd.DataFrame: Realtime data from the linked dataset.
         """
-        dataframe = df_unpack(self._load_dataframe(), "trip_update_stop_time_update")
+        dataframe = df_unpack(
+            self._load_dataframe(message), "trip_update_stop_time_update"
+        )
         for col in [
             "trip_update_stop_time_update_departure",
             "trip_update_stop_time_update_arrival",
@@ -217,22 +309,26 @@ class LinkedDataset(Base):
 
         return self._post_process(dataframe)
 
-    def _process_vehicle_positions(self) -> pd.DataFrame:
+    def _process_vehicle_positions(self, message: FeedMessage) -> pd.DataFrame:
         """Returns realtime data from the linked dataset.
 
+        Args:
+            message (FeedMessage): the parsed feed.
         Returns:
             pd.DataFrame: Realtime data from the linked dataset.
         """
 
-        return self._post_process(self._load_dataframe())
+        return self._post_process(self._load_dataframe(message))
 
-    def _process_service_alerts(self) -> pd.DataFrame:
+    def _process_service_alerts(self, message: FeedMessage) -> pd.DataFrame:
         """Returns realtime data from the linked dataset.
 
+        Args:
+            message (FeedMessage): the parsed feed.
         Returns:
             pd.DataFrame: Realtime data from the linked dataset.
         """
-        pre_explode = self._load_dataframe()
+        pre_explode = self._load_dataframe(message)
         for col in [
             "alert_header_text_translation",
             "alert_description_text_translation",
@@ -5,6 +5,7 @@
 import typing as t
 
 from sqlalchemy.orm import Mapped, mapped_column, reconstructor, relationship
+from sqlalchemy.orm.session import object_session
 
 from .base import Base
 
@@ -34,6 +35,28 @@ class Prediction(Base):
 
     __tablename__ = "prediction"
     __realtime_name__ = "trip_updates"
+    __natural_key__ = ("prediction_id", "stop_sequence", "stop_id")
+    __volatile__ = ("timestamp",)
+    __enriched__ = (
+        "stop_sequence",
+        "stop_name",
+        "platform_code",
+        "platform_name",
+        "delay",
+    )
+
+    _json_fields = None
+    """`json_fields` computed for the whole snapshot, if it was"""
+
+    DELAY_KEY = (
+        "trip_id",
+        "stop_sequence",
+        "stop_id",
+        "arrival_time",
+        "departure_time",
+    )
+    """columns a delay depends on, besides the schedule, as loaded; \
+        `RealtimeStore.delays` is keyed on them"""
 
     prediction_id: Mapped[str]
     arrival_time: Mapped[t.Optional[int]]
@@ -41,9 +64,9 @@ class Prediction(Base):
     direction_id: Mapped[t.Optional[int]]
     stop_sequence: Mapped[t.Optional[int]]
     route_id: Mapped[t.Optional[str]]
-    stop_id: Mapped[t.Optional[str]]
-    trip_id: Mapped[t.Optional[str]]
-    vehicle_id: Mapped[t.Optional[str]]
+    stop_id: Mapped[t.Optional[str]] = mapped_column(index=True)
+    trip_id: Mapped[t.Optional[str]] = mapped_column(index=True)
+    vehicle_id: Mapped[t.Optional[str]] = mapped_column(index=True)
     timestamp: Mapped[t.Optional[int]]
     index: Mapped[int] = mapped_column(primary_key=True)
 
@@ -89,12 +112,12 @@ class Prediction(Base):
     def _init_on_load_(self) -> None:
         """Converts arrival_time and departure_time to datetime objects."""
         # pylint: disable=attribute-defined-outside-init
+        self.delay = self._get_delay()  # keyed on the stop_sequence as loaded
         self.stop_sequence = self.stop_sequence or 0
         self.stop_name = self.stop.stop_name if self.stop else None
         self.platform_code = self.stop.platform_code if self.stop else None
         self.platform_name = self.stop.platform_name if self.stop else None
         # self.stop_url = self.stop.stop_url if self.stop else None
-        self.delay = self._get_delay()
 
     def __repr__(self) -> str:
         """override for `Base.__repr__`"""
@@ -130,9 +153,22 @@ class Prediction(Base):
     def _get_delay(self) -> int | float | None:
         """Returns the delay of the prediction.
 
+        the delay computed with the latest snapshot is used if the session \
+            is a feed's (`session.info["feed"]`) and its `realtime_store` \
+            has it, so the stop time isn't loaded.
+
         Returns:
             int: the delay of the prediction
         """
+        session = object_session(self)
+        delays = (
+            feed.realtime_store.delays
+            if session and (feed := session.info.get("feed"))
+            else {}
+        )
+        key = tuple(getattr(self, col) for col in self.DELAY_KEY)
+        if (delay := delays.get(key)) is not None:
+            return delay
         delay = 0
         if not self.stop_time:
             return delay
@@ -156,6 +192,14 @@ class Prediction(Base):
             return max(self.vehicle.predictions).stop.stop_name
         return ""
 
+    def json_fields(self) -> dict[str, t.Any]:
+        """Returns the fields `as_json` derives from the stop time and vehicle.
+
+        Returns:
+            dict[str, Any]: the headsign
+        """
+        return {"headsign": self.get_headsign()}
+
     @t.override
     def as_json(self, *include: str, **kwargs) -> dict[str, t.Any]:
         """returns `Prediction` as a dictionary.\
@@ -168,4 +212,6 @@ class Prediction(Base):
         Returns:
             dict[str, Any]: `Prediction` as a dictionary.
         """
-        return super().as_json(*include, **kwargs) | {"headsign": self.get_headsign()}
+        return super().as_json(*include, **kwargs) | (
+            self._json_fields or self.json_fields()
+        )
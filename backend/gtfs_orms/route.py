@@ -32,6 +32,7 @@ class Route(Base):
 
     __tablename__ = "route"
     __filename__ = "routes.txt"
+    __categoricals__ = ("route_desc", "route_type", "route_fare_class", "network_id")
 
     route_id: Mapped[str] = mapped_column(primary_key=True)
     agency_id: Mapped[str] = mapped_column(
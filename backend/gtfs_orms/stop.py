@@ -39,6 +39,12 @@ class Stop(Base):
 
     __tablename__ = "stop"
     __filename__ = "stops.txt"
+    __categoricals__ = (
+        "location_type",
+        "wheelchair_boarding",
+        "municipality",
+        "vehicle_type",
+    )
 
     stop_id: Mapped[str] = mapped_column(primary_key=True)
     stop_code: Mapped[t.Optional[str]]
@@ -54,7 +60,8 @@ class Stop(Base):
     level_id: Mapped[t.Optional[str]]
     location_type: Mapped[str]  # consider as int?
     parent_station: Mapped[t.Optional[str]] = mapped_column(
-        ForeignKey("stop.stop_id", ondelete="CASCADE", onupdate="CASCADE")
+        ForeignKey("stop.stop_id", ondelete="CASCADE", onupdate="CASCADE"),
+        index=True,
     )
     wheelchair_boarding: Mapped[str]  # consider as int?
     municipality: Mapped[str]
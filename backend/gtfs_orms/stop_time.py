@@ -32,6 +32,13 @@ class StopTime(Base):
 
     __tablename__ = "stop_time"
     __filename__ = "stop_times.txt"
+    __categoricals__ = (
+        "pickup_type",
+        "drop_off_type",
+        "timepoint",
+        "continuous_pickup",
+        "continuous_drop_off",
+    )
 
     trip_id: Mapped[str] = mapped_column(
         ForeignKey("trip.trip_id", onupdate="CASCADE", ondelete="CASCADE"),
@@ -40,7 +47,8 @@ class StopTime(Base):
     arrival_time: Mapped[str]
     departure_time: Mapped[str]
     stop_id: Mapped[str] = mapped_column(
-        ForeignKey("stop.stop_id", onupdate="CASCADE", ondelete="CASCADE")
+        ForeignKey("stop.stop_id", onupdate="CASCADE", ondelete="CASCADE"),
+        index=True,
     )
     stop_sequence: Mapped[int] = mapped_column(primary_key=True)
     stop_headsign: Mapped[t.Optional[str]]
@@ -25,6 +25,7 @@ class Transfer(Base):
 
     __tablename__ = "transfer"
     __filename__ = "transfers.txt"
+    __categoricals__ = ("transfer_type",)
 
     from_stop_id: Mapped[t.Optional[str]] = mapped_column(
         ForeignKey("stop.stop_id", onupdate="CASCADE", ondelete="CASCADE"),
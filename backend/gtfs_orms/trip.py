@@ -36,12 +36,15 @@ class Trip(Base):
 
     __tablename__ = "trip"
     __filename__ = "trips.txt"
+    __categoricals__ = ("trip_route_type",)
 
     route_id: Mapped[str] = mapped_column(
-        ForeignKey("route.route_id", onupdate="CASCADE", ondelete="CASCADE")
+        ForeignKey("route.route_id", onupdate="CASCADE", ondelete="CASCADE"),
+        index=True,
     )
     service_id: Mapped[str] = mapped_column(
         ForeignKey("calendar.service_id", ondelete="CASCADE", onupdate="CASCADE"),
+        index=True,
     )
     trip_id: Mapped[str] = mapped_column(primary_key=True)
     trip_headsign: Mapped[str]
@@ -49,7 +52,8 @@ class Trip(Base):
     direction_id: Mapped[int]
     block_id: Mapped[t.Optional[str]]
     shape_id: Mapped[str] = mapped_column(
-        ForeignKey("shape.shape_id", ondelete="CASCADE", onupdate="CASCADE")
+        ForeignKey("shape.shape_id", ondelete="CASCADE", onupdate="CASCADE"),
+        index=True,
     )
     wheelchair_accessible: Mapped[int]
     trip_route_type: Mapped[t.Optional[str]]
@@ -36,10 +36,14 @@ class Vehicle(Base):
 
     __tablename__ = "vehicle"
     __realtime_name__ = "vehicle_positions"
+    __enriched__ = ("bearing", "current_stop_sequence", "trip_short_name")
+
+    _json_fields = None
+    """`json_fields` computed for the whole snapshot, if it was"""
 
     vehicle_id: Mapped[str] = mapped_column(primary_key=True)
-    trip_id: Mapped[t.Optional[str]]
-    route_id: Mapped[t.Optional[str]]
+    trip_id: Mapped[t.Optional[str]] = mapped_column(index=True)
+    route_id: Mapped[t.Optional[str]] = mapped_column(index=True)
     direction_id: Mapped[t.Optional[int]]
     latitude: Mapped[t.Optional[float]]
     longitude: Mapped[t.Optional[float]]
@@ -142,14 +146,11 @@ class Vehicle(Base):
             dict: vehicle as a json
         """
 
-        _dict = super().as_json(*include, **kwargs) | {
-            "route_color": self.route.route_color if self.route else None,
-            "bikes_allowed": self.trip.bikes_allowed == 1 if self.trip else False,
-            "speed_mph": self._speed_mph(),
-            "headsign": self._headsign(),
-            "display_name": self._display_name(),
-            "trip_note": self.get_trip_note(),
-        }
+        _dict = (
+            super().as_json(*include, **kwargs)
+            | {"speed_mph": self._speed_mph()}
+            | (self._json_fields or self.json_fields())
+        )
 
         # if "trip_properties" in include:
         #     _dict["trip_properties"] = (
@@ -169,6 +170,20 @@ class Vehicle(Base):
             )
         return _dict
 
+    def json_fields(self) -> dict[str, t.Any]:
+        """Returns the fields `as_json` derives from the trip, route and predictions.
+
+        Returns:
+            dict: route_color, bikes_allowed, headsign, display_name and trip_note
+        """
+        return {
+            "route_color": self.route.route_color if self.route else None,
+            "bikes_allowed": self.trip.bikes_allowed == 1 if self.trip else False,
+            "headsign": self._headsign(),
+            "display_name": self._display_name(),
+            "trip_note": self.get_trip_note(),
+        }
+
     def as_feature(self, *include: str) -> Feature:
         """Returns vehicle as feature.
 
@@ -3,7 +3,7 @@
 This module contains functions that are used in multiple places in the
 GTFS package. They are kept here to avoid code duplication."""
 
-from .decorators import classproperty, removes_session, timeit
+from .decorators import classproperty, records_import, removes_session, timeit
 from .gtfs_helper_time_functions import get_current_time, get_date, to_seconds
 from .misc import df_unpack, get_gitinfo
 from .types import *
@@ -30,12 +30,14 @@ def removes_session(_func: t.Callable[P, R]) -> t.Callable[t.Concatenate[int, P]
         try:
             return _func(*args, **kwargs)
         finally:
-            if self is not None and hasattr(self, "scoped_session"):
+            for name in ["scoped_session", "writer_session"]:
+                if self is None or not hasattr(self, name):
+                    continue
                 try:
-                    self.scoped_session.remove()
+                    getattr(self, name).remove()
                 except Exception:  # pylint: disable=broad-exception-caught
                     # don't let cleanup errors mask the real error
-                    logging.exception("failed to remove scoped_session")
+                    logging.exception("failed to remove %s", name)
 
     return _removes_session
 
@@ -64,6 +66,27 @@ def removes_session(_func: t.Callable[P, R]) -> t.Callable[t.Concatenate[int, P]
 #     return _removes_session
 
 
+def records_import(_func: t.Callable[P, R]) -> t.Callable[P, R]:
+    """Decorator to record a run of a Feed import stage in `Feed.telemetry`, \
+    named after the function. failed runs are recorded too.
+
+    Args:
+        _func (function): Function to wrap.
+    Returns:
+        function: Wrapped function.
+    """
+
+    @functools.wraps(_func)
+    def _records_import(*args, **kwargs):
+        self: "Feed" | None = args[0] if args else None
+        if self is None or not hasattr(self, "telemetry"):
+            return _func(*args, **kwargs)
+        with self.telemetry.record(_func.__name__, lambda: self.engine.url.database):
+            return _func(*args, **kwargs)
+
+    return _records_import
+
+
 def timeit(
     _func: t.Callable[P, R], round_to: int = 3, show_args: bool = True
 ) -> t.Callable[t.Concatenate[int, P], R]:
@@ -17,6 +17,16 @@ TimeZones = t.Literal["America/New_York"]
 
 PathLike = os.PathLike[str] | str | pathlib.Path
 
+ConflictPolicy = t.Literal["abort", "ignore", "replace", "dedupe"]
+"""how a bulk insert treats rows that collide on the primary key:
+
+- `abort`: raise and roll back the chunk
+- `ignore`: `ON CONFLICT (...) DO NOTHING`; the existing row wins. only key \
+    conflicts are skipped, NOT NULL and CHECK violations still raise
+- `replace`: upsert; the incoming row wins
+- `dedupe`: drop duplicate keys within the chunk, then plain insert
+"""
+
 
 class RouteKey(t.TypedDict):
     """Route key type definition."""
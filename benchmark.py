@@ -0,0 +1,608 @@
+# !/usr/bin/env python3
+
+"""Benchmarks for the backend's hot paths. Each benchmark builds its own \\
+    synthetic data in a temporary directory, so no network or database is needed.
+
+    python3 benchmark.py bulk_load --rows 500000
+    python3 benchmark.py parse
+    python3 benchmark.py snapshot
+    python3 benchmark.py profiles --threads 16
+    python3 benchmark.py realtime_decode
+    python3 benchmark.py realtime_upsert --rows 40000
+
+johan cho | 2023-2025
+
+"""
+
+# pylint: disable=no-name-in-module, wildcard-import, unused-wildcard-import
+import argparse
+import concurrent.futures as cf
+import datetime as dt
+import logging
+import os
+import sys
+import tempfile
+import time
+import typing as t
+
+import pandas as pd
+import sqlalchemy as sa
+from google.transit.gtfs_realtime_pb2 import FeedMessage
+from sqlalchemy import orm as saorm
+
+from backend.gtfs_loader import BulkLoader, ChunkReader, Feed, RealtimeDiff
+from backend.gtfs_loader import connection_profile as profiles
+from backend.gtfs_loader.schedule_snapshot import ScheduleSnapshot
+from backend.gtfs_orms import *
+
+# pylint: disable=invalid-name
+
+LEGACY = profiles.ConnectionProfile(
+    "legacy",
+    [
+        "journal_mode=WAL",
+        "synchronous=OFF",
+        "foreign_keys=ON",
+        "temp_store=MEMORY",
+        "shrink_memory",
+        "read_uncommitted=1",
+    ],
+    optimize=True,
+)
+"""the one pragma list every engine used before connection profiles"""
+
+
+def _timed(func: t.Callable[[], t.Any], repeat: int) -> float:
+    """runs `func` `repeat` times and returns the best wall time.
+
+    Args:
+        func (Callable[[], Any]): function to time
+        repeat (int): number of runs
+    Returns:
+        float: best time in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _temp_engine(
+    directory: str,
+    name: str,
+    profile: profiles.ConnectionProfile = profiles.REALTIME_WRITER,
+) -> sa.Engine:
+    """creates a fresh sqlite database with the full schema.
+
+    Args:
+        directory (str): directory for the database file
+        name (str): database file name, without extension
+        profile (ConnectionProfile, optional): connection profile. \
+            Defaults to `REALTIME_WRITER`.
+    Returns:
+        sa.Engine: engine bound to the new database
+    """
+    path = os.path.join(directory, f"{name}.db")
+    Feed.remove_database(path)
+    engine = profile.create_engine(path)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def _stop_times_frame(rows: int, trips: int = 1000, stops: int = 500) -> pd.DataFrame:
+    """a `stop_times.txt`-shaped dataframe of strings, as `read_csv` returns it.
+
+    Args:
+        rows (int): number of rows
+        trips (int, optional): number of distinct trips. Defaults to 1000.
+        stops (int, optional): number of distinct stops. Defaults to 500.
+    Returns:
+        pd.DataFrame: synthetic stop times
+    """
+    seq = pd.RangeIndex(rows)
+    return pd.DataFrame(
+        {
+            "trip_id": (seq // max(rows // trips, 1)).map(lambda i: f"trip-{i}"),
+            "arrival_time": (seq % 86400).map(
+                lambda s: f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}"
+            ),
+            "departure_time": (seq % 86400).map(
+                lambda s: f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}"
+            ),
+            "stop_id": (seq % stops).map(str),
+            "stop_sequence": seq.map(str),
+            "stop_headsign": None,
+            "pickup_type": "0",
+            "drop_off_type": "0",
+            "timepoint": "1",
+            "checkpoint_id": None,
+            "continuous_pickup": None,
+            "continuous_drop_off": None,
+        },
+        dtype=object,
+    )
+
+
+def _load_parents(engine: sa.Engine, frame: pd.DataFrame) -> None:
+    """inserts the trips and stops that `frame` references, \
+        along with one placeholder agency, calendar, route and shape.
+
+    Args:
+        engine (sa.Engine): engine to load into
+        frame (pd.DataFrame): stop times to satisfy
+    """
+    loader = BulkLoader(engine)
+    placeholders: dict[t.Type[Base], dict[str, t.Any]] = {
+        Agency: {
+            "agency_id": "1",
+            "agency_name": "MBTA",
+            "agency_url": "https://www.mbta.com",
+            "agency_timezone": "America/New_York",
+            "agency_lang": "EN",
+            "agency_phone": "",
+            "agency_fare_url": "",
+        },
+        Calendar: {"service_id": "1", "start_date": "20250101", "end_date": "20251231"}
+        | {day: 1 for day in ["monday", "tuesday", "wednesday", "thursday"]}
+        | {day: 1 for day in ["friday", "saturday", "sunday"]},
+        Route: {
+            "route_id": "1",
+            "agency_id": "1",
+            "route_desc": "Local Bus",
+            "route_type": "3",
+            "route_color": "FFC72C",
+            "route_text_color": "000000",
+            "route_sort_order": 1,
+            "route_fare_class": "Local Bus",
+            "network_id": "local_bus",
+        },
+        Shape: {"shape_id": "1"},
+    }
+    for orm, row in placeholders.items():
+        loader.insert(pd.DataFrame([row]), orm)
+    stop_ids = frame["stop_id"].drop_duplicates()
+    loader.insert(
+        pd.DataFrame(
+            {
+                "stop_id": stop_ids,
+                "stop_name": stop_ids,
+                "location_type": "0",
+                "wheelchair_boarding": "0",
+                "municipality": "Boston",
+            }
+        ),
+        Stop,
+    )
+    trip_ids = frame["trip_id"].drop_duplicates()
+    loader.insert(
+        pd.DataFrame(
+            {
+                "route_id": "1",
+                "service_id": "1",
+                "trip_id": trip_ids,
+                "trip_headsign": "x",
+                "direction_id": 0,
+                "shape_id": "1",
+                "wheelchair_accessible": 0,
+                "route_pattern_id": "1",
+                "bikes_allowed": 0,
+            }
+        ),
+        Trip,
+    )
+
+
+def bench_bulk_load(
+    rows: int = 200_000, repeat: int = 3, **_kwargs
+) -> dict[str, float]:
+    """`DataFrame.to_sql` (the old schedule path) vs `BulkLoader.insert`.
+
+    Args:
+        rows (int, optional): stop time rows to insert. Defaults to 200_000.
+        repeat (int, optional): runs per method, best is kept. Defaults to 3.
+        _kwargs: the cli's other options; loading is one thread, so `threads` is ignored
+    Returns:
+        dict[str, float]: best seconds per method
+    """
+    frame = _stop_times_frame(rows)
+    results: dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, method in {
+            "to_sql": lambda e: frame.to_sql(
+                StopTime.__tablename__, e, if_exists="append", index=False
+            ),
+            "bulk_loader": lambda e: BulkLoader(e).insert(frame, StopTime),
+        }.items():
+
+            def _run(method=method, name=name) -> None:
+                engine = _temp_engine(directory, name)
+                _load_parents(engine, frame)
+                method(engine)
+                engine.dispose()
+
+            results[name] = _timed(_run, repeat)
+    for name, seconds in results.items():
+        logging.info(
+            "%-12s %8.3f s %12.0f rows/s", name, seconds, rows / max(seconds, 1e-9)
+        )
+    logging.info("speedup: %.2fx", results["to_sql"] / results["bulk_loader"])
+    return results
+
+
+def bench_parse(rows: int = 200_000, repeat: int = 3, **_kwargs) -> dict[str, float]:
+    """parsing a `stop_times.txt` block with pandas, as `dtype=object`, \
+        vs arrow, typed from the schema, then converting it to insert rows.
+
+    Args:
+        rows (int, optional): stop time rows to parse. Defaults to 200_000.
+        repeat (int, optional): runs per mode, best is kept. Defaults to 3.
+        _kwargs: the cli's other options; blocks are parsed inline, without workers
+    Returns:
+        dict[str, float]: best seconds per mode
+    """
+    header, block = (
+        _stop_times_frame(rows).to_csv(index=False).encode().split(b"\n", maxsplit=1)
+    )
+    header += b"\n"
+    modes = {"object": {"arrow": False}, "arrow": {"arrow": True}}
+    results: dict[str, float] = {}
+    for name, mode in modes.items():
+        reader = ChunkReader(None, **mode)
+        func, func_args = reader.parser(StopTime)
+        frame = func(header, block, *func_args)
+
+        def _run(func=func, func_args=func_args) -> None:
+            chunk = func(header, block, *func_args)
+            for _ in BulkLoader.rows(chunk[BulkLoader.columns(chunk, StopTime)]):
+                pass
+
+        results[name] = _timed(_run, repeat)
+        logging.info(
+            "%-12s %8.3f s %10.1f MiB",
+            name,
+            results[name],
+            frame.memory_usage(deep=True).sum() / 2**20,
+        )
+    logging.info("speedup (arrow): %.2fx", results["object"] / results["arrow"])
+    return results
+
+
+def bench_snapshot(rows: int = 200_000, repeat: int = 3, **_kwargs) -> dict[str, float]:
+    """ "stop times at a stop today" through the orm vs `ScheduleSnapshot`.
+
+    Args:
+        rows (int, optional): stop time rows in the schedule. Defaults to 200_000.
+        repeat (int, optional): runs per method, best is kept. Defaults to 3.
+        _kwargs: the cli's other options; queries run on one thread
+    Returns:
+        dict[str, float]: best seconds per method, for 20 stops
+    """
+    frame = _stop_times_frame(rows)
+    date = dt.datetime(2025, 6, 2)
+    stop_ids = frame["stop_id"].drop_duplicates().head(20).tolist()
+    results: dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        engine = _temp_engine(directory, "snapshot")
+        _load_parents(engine, frame)
+        BulkLoader(engine).insert(frame, StopTime)
+        snapshot = ScheduleSnapshot.export(
+            engine, os.path.join(directory, "snapshot"), date
+        )
+
+        def _orm() -> None:
+            with saorm.Session(engine) as session:
+                for stop_id in stop_ids:
+                    _ = [
+                        st
+                        for st in session.scalars(
+                            sa.select(StopTime).where(StopTime.stop_id == stop_id)
+                        )
+                        if st.trip.calendar.operates_on(date)
+                    ]
+
+        def _snapshot() -> None:
+            for stop_id in stop_ids:
+                snapshot.stop_times(stop_id, date)
+
+        results = {"orm": _timed(_orm, repeat), "snapshot": _timed(_snapshot, repeat)}
+        engine.dispose()
+    for name, seconds in results.items():
+        logging.info(
+            "%-12s %8.3f s %10.2f ms/stop", name, seconds, seconds * 1e3 / len(stop_ids)
+        )
+    logging.info("speedup: %.2fx", results["orm"] / results["snapshot"])
+    return results
+
+
+def bench_profiles(
+    rows: int = 200_000, repeat: int = 3, threads: int = 8, **_kwargs
+) -> dict[str, float]:
+    """each connection profile vs the old shared pragmas, on its own workload:
+
+    - bulk_load: a fresh schedule's stop times, then `Feed.validate_database`
+    - realtime_writer: up to 200 transactions replacing 1000 stop times each
+    - read_only: stop times of every stop, queried from `threads` threads
+
+    Args:
+        rows (int, optional): stop time rows in the schedule. Defaults to 200_000.
+        repeat (int, optional): runs per profile, best is kept. Defaults to 3.
+        threads (int, optional): reader threads. Defaults to 8.
+        _kwargs: the cli's other options, none of them used here
+    Returns:
+        dict[str, float]: best seconds per `workload/profile`
+    """
+    # pylint: disable=too-many-locals
+    frame = _stop_times_frame(rows)
+    batches = [frame[i : i + 1000] for i in range(0, min(rows, 200_000), 1000)]
+    stop_ids = frame["stop_id"].drop_duplicates().tolist()
+    results: dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as directory:
+
+        def _bulk_load(profile: profiles.ConnectionProfile) -> None:
+            engine = _temp_engine(directory, "bulk_load", profile)
+            _load_parents(engine, frame)
+            BulkLoader(engine).insert(frame, StopTime)
+            Feed.validate_database(engine)
+            engine.dispose()
+
+        def _realtime_writer(profile: profiles.ConnectionProfile) -> None:
+            engine = _temp_engine(directory, "realtime_writer", profile)
+            _load_parents(engine, frame)
+            loader = BulkLoader(engine)
+            for batch in batches:
+                with engine.begin() as conn:
+                    conn.execute(
+                        sa.delete(StopTime).where(
+                            StopTime.trip_id.in_(batch["trip_id"].unique().tolist())
+                        )
+                    )
+                loader.insert(batch, StopTime)
+            engine.dispose()
+
+        engine = _temp_engine(directory, "read_only")
+        _load_parents(engine, frame)
+        BulkLoader(engine).insert(frame, StopTime)
+        engine.dispose()
+
+        def _read_only(profile: profiles.ConnectionProfile) -> None:
+            reader = profile.create_engine(os.path.join(directory, "read_only.db"))
+
+            def _query(stop_id: str) -> None:
+                with reader.connect() as conn:
+                    conn.execute(
+                        sa.select(StopTime).where(StopTime.stop_id == stop_id)
+                    ).all()
+
+            with cf.ThreadPoolExecutor(threads) as pool:
+                list(pool.map(_query, stop_ids))
+            reader.dispose()
+
+        for workload, (func, profile) in {
+            "bulk_load": (_bulk_load, profiles.BULK_LOAD),
+            "realtime_writer": (_realtime_writer, profiles.REALTIME_WRITER),
+            "read_only": (_read_only, profiles.READ_ONLY),
+        }.items():
+            logging.disable(logging.INFO)  # one "Added" line per transaction
+            for name, prof in [("legacy", LEGACY), ("profile", profile)]:
+                results[f"{workload}/{name}"] = _timed(
+                    lambda func=func, prof=prof: func(prof), repeat
+                )
+            logging.disable(logging.NOTSET)
+            logging.info(
+                "%-16s legacy %8.3f s  %-16s %8.3f s  speedup: %.2fx",
+                workload,
+                results[f"{workload}/legacy"],
+                profile.name,
+                results[f"{workload}/profile"],
+                results[f"{workload}/legacy"] / results[f"{workload}/profile"],
+            )
+    return results
+
+
+def _realtime_feeds(trips: int, stops: int = 20) -> dict[str, bytes]:
+    """serialized GTFS-realtime feeds shaped like the MBTA's.
+
+    Args:
+        trips (int): trip updates and vehicles
+        stops (int, optional): stop time updates per trip. Defaults to 20.
+    Returns:
+        dict[str, bytes]: feed per `LinkedDataset` kind
+    """
+    timestamp = 1_750_000_000
+    feeds = {
+        kind: FeedMessage()
+        for kind in ["trip_updates", "vehicle_positions", "service_alerts"]
+    }
+    for message in feeds.values():
+        message.header.gtfs_realtime_version = "2.0"
+        message.header.timestamp = timestamp
+    for i in range(trips):
+        entity = feeds["trip_updates"].entity.add(id=f"trip-{i}")
+        update = entity.trip_update
+        update.trip.trip_id, update.trip.route_id = f"trip-{i}", str(i % 50)
+        update.trip.direction_id = i % 2
+        update.vehicle.id = f"vehicle-{i}"
+        for seq in range(stops):
+            stu = update.stop_time_update.add(stop_sequence=seq, stop_id=str(seq))
+            if seq:
+                stu.arrival.time = timestamp + 60 * seq
+            if seq < stops - 1:
+                stu.departure.time = timestamp + 60 * seq + 30
+        vehicle = feeds["vehicle_positions"].entity.add(id=f"vehicle-{i}").vehicle
+        vehicle.trip.trip_id, vehicle.trip.route_id = f"trip-{i}", str(i % 50)
+        vehicle.position.latitude = 42.35 + i * 1e-5
+        vehicle.position.longitude = -71.06 - i * 1e-5
+        vehicle.position.bearing = i % 360
+        vehicle.current_stop_sequence, vehicle.current_status = i % stops, i % 3
+        vehicle.timestamp, vehicle.stop_id = timestamp - i, str(i % stops)
+        vehicle.vehicle.label, vehicle.occupancy_status = str(1000 + i), i % 4
+    for i in range(max(trips // 10, 1)):
+        alert = feeds["service_alerts"].entity.add(id=f"alert-{i}").alert
+        alert.cause, alert.effect, alert.severity_level = 1 + i % 5, 1 + i % 7, 1
+        for route in range(5):
+            alert.informed_entity.add(agency_id="1", route_id=str(route), route_type=3)
+        alert.active_period.add(start=timestamp, end=timestamp + 3600)
+        for text in [alert.header_text, alert.description_text, alert.url]:
+            text.translation.add(text=f"alert {i}", language="en")
+    return {kind: message.SerializeToString() for kind, message in feeds.items()}
+
+
+def bench_realtime_decode(
+    rows: int = 200_000, repeat: int = 3, **_kwargs
+) -> dict[str, float]:
+    """parsing and decoding each realtime feed through `MessageToDict` and \
+        `json_normalize` (the old path) vs `FeedDecoder`.
+
+    Args:
+        rows (int, optional): stop time updates in the trip updates feed, \
+            20 per trip. Defaults to 200_000.
+        repeat (int, optional): runs per method, best is kept. Defaults to 3.
+        _kwargs: the cli's other options; each feed is decoded on one thread
+    Returns:
+        dict[str, float]: best seconds per `kind/method`
+    """
+    results: dict[str, float] = {}
+    for kind, data in _realtime_feeds(max(rows // 20, 1)).items():
+        dataset = LinkedDataset(
+            url=kind,
+            trip_updates=int(kind == "trip_updates"),
+            vehicle_positions=int(kind == "vehicle_positions"),
+            service_alerts=int(kind == "service_alerts"),
+        )
+        for name, columnar in [("json", False), ("columnar", True)]:
+
+            def _run(dataset=dataset, data=data, columnar=columnar) -> None:
+                dataset.decode(FeedMessage.FromString(data), columnar=columnar)
+
+            results[f"{kind}/{name}"] = _timed(_run, repeat)
+        logging.info(
+            "%-18s json %8.3f s  columnar %8.3f s  speedup: %.2fx",
+            kind,
+            results[f"{kind}/json"],
+            results[f"{kind}/columnar"],
+            results[f"{kind}/json"] / results[f"{kind}/columnar"],
+        )
+    return results
+
+
+def bench_realtime_upsert(
+    rows: int = 40_000, repeat: int = 3, **_kwargs
+) -> dict[str, float]:
+    """rewriting the `prediction` table every cycle (the old path) vs \
+        applying a `RealtimeDiff`, between two feeds where a tenth of \
+        the trips ran late and the header timestamp changed.
+
+    Args:
+        rows (int, optional): predictions per feed, 20 per trip. Defaults to 40_000.
+        repeat (int, optional): cycles per method, best is kept. Defaults to 3.
+        _kwargs: the cli's other options; there is one writer, so `threads` is ignored
+    Returns:
+        dict[str, float]: best seconds and wal bytes per method
+    """
+    dataset = LinkedDataset(url="trip_updates", trip_updates=1)
+    first = dataset.decode(
+        FeedMessage.FromString(_realtime_feeds(max(rows // 20, 1))["trip_updates"])
+    )
+    second = first.copy()
+    moved = second["trip_id"].str.endswith("0")  # a tenth of the trips run late
+    second.loc[moved, "arrival_time"] += 60
+    second["timestamp"] += 30
+    results: dict[str, float] = {}
+    # feed applied next and last snapshot per method
+    states: dict[str, dict[str, pd.DataFrame]] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ["rewrite", "diff"]:
+            engine = _temp_engine(directory, name)
+            states[name] = {
+                "frame": second,
+                "snapshot": RealtimeDiff(Prediction, first).snapshot,
+            }
+
+            def _run(name=name, engine=engine) -> None:
+                state = states[name]
+                frame = state["frame"]
+                if name == "rewrite":
+                    with engine.begin() as conn:
+                        conn.exec_driver_sql(f"DELETE FROM {Prediction.__tablename__}")
+                        frame.to_sql(
+                            Prediction.__tablename__,
+                            conn,
+                            if_exists="append",
+                            index=True,
+                            index_label="index",
+                        )
+                else:
+                    diff = RealtimeDiff(Prediction, frame, state["snapshot"])
+                    raw = engine.raw_connection()
+                    diff.apply(raw.cursor())
+                    raw.commit()
+                    raw.close()
+                    state["snapshot"] = diff.snapshot
+                state["frame"] = first if frame is second else second
+
+            raw = engine.raw_connection()
+            RealtimeDiff(Prediction, first).apply(raw.cursor())
+            raw.commit()
+            raw.close()
+            results[name] = _timed(_run, repeat)
+            with engine.connect() as conn:  # one more cycle, into an empty wal
+                conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+            _run()
+            results[f"{name}/wal_bytes"] = os.path.getsize(f"{engine.url.database}-wal")
+            engine.dispose()
+    logging.info(
+        "rewrite %8.3f s %10d wal bytes  diff %8.3f s %10d wal bytes  speedup: %.2fx",
+        results["rewrite"],
+        results["rewrite/wal_bytes"],
+        results["diff"],
+        results["diff/wal_bytes"],
+        results["rewrite"] / results["diff"],
+    )
+    return results
+
+
+BENCHMARKS: dict[str, t.Callable[..., dict[str, float]]] = {
+    "bulk_load": bench_bulk_load,
+    "parse": bench_parse,
+    "snapshot": bench_snapshot,
+    "profiles": bench_profiles,
+    "realtime_decode": bench_realtime_decode,
+    "realtime_upsert": bench_realtime_upsert,
+}
+
+
+def get_args() -> argparse.ArgumentParser:
+    """Add arguments to the parser.
+
+    Returns:
+        argparse.ArgumentParser: parser with added arguments.
+    """
+    _argparse = argparse.ArgumentParser(description="Run backend benchmarks.")
+    _argparse.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"benchmarks to run, any of {', '.join(BENCHMARKS)} (default: all)",
+    )
+    _argparse.add_argument(
+        "--rows", "-r", type=int, default=200_000, help="rows per benchmark"
+    )
+    _argparse.add_argument(
+        "--repeat", "-n", type=int, default=3, help="runs per method, best is kept"
+    )
+    _argparse.add_argument(
+        "--threads", "-t", type=int, default=8, help="reader threads (profiles)"
+    )
+    return _argparse
+
+
+if __name__ == "__main__":
+    parser = get_args()
+    args = parser.parse_args()
+    if unknown := set(args.benchmarks) - set(BENCHMARKS):
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format="%(message)s")
+    for bench in args.benchmarks or BENCHMARKS:
+        logging.info("----- %s -----", bench)
+        BENCHMARKS[bench](rows=args.rows, repeat=args.repeat, threads=args.threads)
@@ -0,0 +1,99 @@
+# !/usr/bin/env python3
+
+"""Local stand-in for the MBTA's GTFS and GTFS-realtime servers, so ingestion \\
+    and serving can be load tested and benchmarked offline.
+
+    python3 feed_server.py record recordings/mbta --duration 1800 --interval 5
+    python3 feed_server.py replay recordings/mbta --port 8765 --speed 10
+
+point the app at the replay with the `MBTAMAPPER_GTFS_URL` environment variable, \\
+    e.g. `MBTAMAPPER_GTFS_URL=http://127.0.0.1:8765/MBTA_GTFS.zip python3 app.py -i`, \\
+    or pass the url to `FeedLoader(url=...)`. the realtime feeds are found \\
+    through the replayed zip's `linked_datasets.txt`, which points at the replay.
+
+johan cho | 2023-2025
+
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from backend import FeedRecording, FeedReplay
+
+# pylint: disable=invalid-name
+
+
+def get_args() -> argparse.ArgumentParser:
+    """Add arguments to the parser.
+
+    Returns:
+        argparse.ArgumentParser: parser with added arguments.
+    """
+    _argparse = argparse.ArgumentParser(
+        description="Record and replay GTFS and GTFS-realtime feeds."
+    )
+    _argparse.add_argument("mode", choices=["record", "replay"], help="what to do")
+    _argparse.add_argument("directory", help="where the recording is (or goes)")
+    _argparse.add_argument(
+        "--url",
+        "-u",
+        default="https://cdn.mbta.com/MBTA_GTFS.zip",
+        help="record only: static zip, whose linked datasets are recorded",
+    )
+    _argparse.add_argument(
+        "--duration",
+        type=float,
+        default=600,
+        help="record only: seconds to record the realtime feeds for",
+    )
+    _argparse.add_argument(
+        "--interval",
+        type=float,
+        default=5,
+        help="record only: seconds between polls of the realtime feeds",
+    )
+    _argparse.add_argument(
+        "--host", default="127.0.0.1", help="replay only: server host address"
+    )
+    _argparse.add_argument(
+        "--port", "-p", type=int, default=8765, help="replay only: server port"
+    )
+    _argparse.add_argument(
+        "--speed",
+        "-s",
+        type=float,
+        default=1,
+        help="replay only: replay speed, e.g. 10 for ten times as fast",
+    )
+    _argparse.add_argument(
+        "--once",
+        action="store_true",
+        help="replay only: stay at the last frames rather than start over",
+    )
+    _argparse.add_argument(
+        "--no_rebase",
+        action="store_true",
+        help="replay only: serve the recorded timestamps, not shifted to now",
+    )
+    return _argparse
+
+
+if __name__ == "__main__":
+    args = get_args().parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format="%(message)s")
+    if args.mode == "record":
+        FeedRecording.record(args.url, args.directory, args.duration, args.interval)
+        sys.exit(0)
+    server = FeedReplay(
+        FeedRecording.load(args.directory),
+        speed=args.speed,
+        loop=not args.once,
+        rebase=not args.no_rebase,
+    ).serve(args.host, args.port)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()